@@ -0,0 +1,147 @@
+import os
+import json
+import time
+
+from processamento import OpcoesProcessamento, processar_zip_sync, ResumoLote
+from resultados import armazem_resultados, hash_arquivo, chave_resultado
+from streaming import EnvioCancelado
+
+
+# -------------------------------------------------------------------
+# ACOMPANHAMENTO DO LOTE EM TEMPO REAL (NDJSON / SSE)
+# -------------------------------------------------------------------
+# Intervalo mínimo (segundos) entre dois registros de totais parciais
+ACOMPANHAMENTO_INTERVALO = float(os.environ.get("MONXML_ACOMPANHAMENTO_INTERVALO", "1"))
+# Registros aguardando envio ao cliente. Com o cliente lento o processamento espera (backpressure),
+# então a memória fica limitada a ~LIMITE_REGISTROS linhas, independente do tamanho do lote.
+LIMITE_REGISTROS = 1024
+
+# Formato do stream -> media type da resposta
+FORMATOS = {
+    "ndjson": "application/x-ndjson",
+    "sse": "text/event-stream",
+}
+
+
+class EmissorRegistros:
+    """
+    Converte o andamento de 'processar_zip_sync' em registros JSON compactos, um por linha
+    (NDJSON) ou um por evento (SSE), escritos no canal assim que acontecem:
+
+    - 'arquivo': um por XML classificado (arquivo, categoria, cstat, xmotivo, vnf, vicms);
+    - 'totais': totais parciais por categoria, no início e a cada 'intervalo' segundos;
+    - 'fim': totais finais e o link de download do ZIP de saída;
+    - 'erro': o processamento falhou (os headers já foram enviados, então o erro vai no stream).
+
+    Cada registro é serializado na hora, na thread de processamento: nada fica acumulado aqui.
+    """
+
+    def __init__(self, canal, formato: str = "ndjson", intervalo: float = ACOMPANHAMENTO_INTERVALO):
+        if formato not in FORMATOS:
+            raise ValueError(f"Formato desconhecido: '{formato}'. Use um de: {', '.join(FORMATOS)}.")
+        self._canal = canal
+        self._formato = formato
+        self._intervalo = intervalo
+        self._ultimos_totais = None
+
+    def _emitir(self, tipo: str, conteudo: dict) -> None:
+        texto = json.dumps({"tipo": tipo, **conteudo}, ensure_ascii=False, separators=(",", ":"))
+        if self._formato == "sse":
+            texto = f"event: {tipo}\ndata: {texto}\n\n"
+        else:
+            texto += "\n"
+        self._canal.write(texto.encode("utf-8"))
+
+    def arquivo(self, nome_limpo: str, categoria: str, dados) -> None:
+        """Observador de 'processar_zip_sync': um registro por XML classificado."""
+        if dados is None:
+            # Mesmos textos do relatório de rejeições
+            cstat, xmotivo, vnf, vicms = "ERRO_PARSE", "Arquivo XML inválido ou corrompido", 0.0, 0.0
+        else:
+            cstat, xmotivo, vnf, vicms = dados.cstat, dados.xmotivo, dados.v_nf, dados.v_icms
+        self._emitir("arquivo", {
+            "arquivo": nome_limpo, "categoria": categoria, "cstat": cstat, "xmotivo": xmotivo,
+            "vnf": vnf, "vicms": vicms,
+        })
+
+    def totais(self, processados: int, total: int, dados_gerais: dict) -> None:
+        """Progresso de 'processar_zip_sync': totais parciais, no máximo um a cada 'intervalo' segundos."""
+        agora = time.monotonic()
+        if processados and self._ultimos_totais is not None and agora - self._ultimos_totais < self._intervalo:
+            return
+        self._ultimos_totais = agora
+        self._emitir("totais", {"processados": processados, "total": total, "dados_gerais": dados_gerais})
+
+    def fim(self, conteudo: dict) -> None:
+        self._emitir("fim", conteudo)
+
+    def erro(self, detalhe: str) -> None:
+        self._emitir("erro", {"detail": detalhe})
+
+
+def acompanhar_zip_sync(
+    origem,
+    emissor: EmissorRegistros,
+    usar_cache: bool = True,
+    compressao: str | None = None,
+    tempos=None,
+    armazem=armazem_resultados,
+) -> dict | None:
+    """
+    Processa o ZIP emitindo um registro por XML e, no fim, o link de download do resultado.
+
+    O ZIP de saída é gravado direto no armazém de resultados (o mesmo de '/processar-zip/'),
+    então o link é '/resultados/{sha256}/zip' e um envio posterior do mesmo lote também é
+    servido de lá. Se o resultado já estiver guardado, ou com o armazém desligado ('download'
+    None), o lote só é classificado (modo só resumo), sem montar outro ZIP.
+
+    Returns:
+        dict | None: O conteúdo do registro 'fim', ou None se o processamento falhou (registro 'erro').
+    """
+    download = chave = destino = None
+    resumo = ResumoLote()
+    try:
+        if armazem.ativo:
+            hash_zip = hash_arquivo(origem)
+            chave = chave_resultado(hash_zip, itens=False, compressao=compressao)
+            download = f"/resultados/{hash_zip}/zip?itens=false&compressao={compressao}"
+            if not usar_cache or armazem.consultar(chave) is None:
+                destino = armazem.novo_arquivo()
+
+        processar_zip_sync(origem, OpcoesProcessamento(
+            destino=destino, somente_resumo=destino is None, usar_cache=usar_cache,
+            compressao=compressao, tempos=tempos, resumo=resumo,
+            observador=emissor.arquivo, progresso=emissor.totais,
+        ))
+        if destino is not None:
+            destino.close()
+            armazem.guardar(chave, destino.name, resumo.dados_gerais)
+    except EnvioCancelado:
+        # Cliente desconectou: nada mais a enviar
+        _descartar(destino)
+        raise
+    except Exception as erro:
+        _descartar(destino)
+        print(f"Erro no acompanhamento do lote: {erro}")
+        emissor.erro("Falha ao processar o lote.")
+        return None
+    except BaseException:
+        _descartar(destino)
+        raise
+
+    final = {
+        "total": sum(dados["qtd"] for dados in resumo.dados_gerais.values()),
+        "dados_gerais": resumo.dados_gerais,
+        "erros_parse": resumo.erros_parse,
+        "download": download,
+    }
+    emissor.fim(final)
+    return final
+
+
+def _descartar(destino) -> None:
+    if destino is None:
+        return
+    destino.close()
+    if os.path.exists(destino.name):
+        os.remove(destino.name)
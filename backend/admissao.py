@@ -0,0 +1,210 @@
+import os
+import zipfile
+import threading
+from typing import NamedTuple, Iterable
+
+from compressao import THREADS_COMPRESSAO, PENDENTES_POR_THREAD
+
+
+# -------------------------------------------------------------------
+# CONFIGURAÇÃO DA ADMISSÃO E DOS LIMITES DE DESCOMPRESSÃO (variáveis de ambiente)
+# -------------------------------------------------------------------
+# Memória estimada somando todas as requisições em processamento ao mesmo tempo
+ORCAMENTO_MEMORIA = int(os.environ.get("MONXML_ORCAMENTO_MEMORIA_MB", "1024")) * 1024 * 1024
+# Vagas de CPU: uma por requisição serial, 'processos' por requisição no modo paralelo
+ORCAMENTO_CPU = int(os.environ.get("MONXML_ORCAMENTO_CPU", os.cpu_count() or 1))
+# Tempo máximo (segundos) que uma requisição espera orçamento antes de receber 503
+ADMISSAO_ESPERA = float(os.environ.get("MONXML_ADMISSAO_ESPERA", "30"))
+# Requisições esperando orçamento. Acima disso, 503 na hora
+ADMISSAO_FILA = int(os.environ.get("MONXML_ADMISSAO_FILA", "16"))
+# Sugestão de espera (segundos) enviada no header Retry-After do 503
+ADMISSAO_RETRY_AFTER = int(os.environ.get("MONXML_ADMISSAO_RETRY_AFTER", "10"))
+# Razão descompactado/compactado máxima de cada membro e do ZIP inteiro (proteção contra "zip bomb")
+RAZAO_MAXIMA_MEMBRO = int(os.environ.get("MONXML_RAZAO_MAXIMA_MEMBRO", "200"))
+RAZAO_MAXIMA_TOTAL = int(os.environ.get("MONXML_RAZAO_MAXIMA_TOTAL", "100"))
+# Soma máxima dos XMLs descompactados de um ZIP
+LIMITE_DESCOMPACTADO = int(os.environ.get("MONXML_LIMITE_DESCOMPACTADO_MB", "20480")) * 1024 * 1024
+
+# Memória fixa de uma requisição (buffers do zipfile, spool do upload e da saída, relatórios)
+CUSTO_BASE = 8 * 1024 * 1024
+# Memória do parsing por byte de XML (bytes descompactados + árvore parcial do iterparse)
+FATOR_PARSE = 4
+# Membros pequenos não entram na verificação de razão: mesmo altíssima, não pesam
+MINIMO_RAZAO = 1024 * 1024
+
+
+class DescompressaoExcessiva(ValueError):
+    """O ZIP descompactaria muito mais do que o permitido (provável "zip bomb")."""
+
+
+class OrcamentoEsgotado(Exception):
+    """Não houve orçamento de memória/CPU dentro da espera máxima: o cliente deve tentar mais tarde."""
+
+
+class Custo(NamedTuple):
+    """Estimativa do que uma requisição ocupa enquanto é processada."""
+    memoria: int
+    cpu: int = 1
+
+
+def custo_de_membros(tamanhos: Iterable[int], processos: int = 1) -> Custo:
+    """
+    Estima o custo a partir dos tamanhos descompactados dos XMLs (diretório central).
+
+    O processamento descompacta e analisa um membro por vez em cada processo, e o
+    GravadorParalelo mantém até THREADS_COMPRESSAO * PENDENTES_POR_THREAD entradas
+    esperando gravação: o pico depende do MAIOR membro, não do total do ZIP.
+    """
+    tamanhos = list(tamanhos)
+    maior = max(tamanhos, default=0)
+    medio = sum(tamanhos) // len(tamanhos) if tamanhos else 0
+    pendentes = max(THREADS_COMPRESSAO, 1) * PENDENTES_POR_THREAD
+    memoria = CUSTO_BASE + maior * FATOR_PARSE * processos + medio * min(pendentes, len(tamanhos))
+    return Custo(memoria, processos)
+
+
+def verificar_membro(info: zipfile.ZipInfo) -> None:
+    """Levanta DescompressaoExcessiva se o membro passar da razão máxima de descompressão."""
+    if info.file_size > MINIMO_RAZAO and info.file_size > RAZAO_MAXIMA_MEMBRO * max(info.compress_size, 1):
+        raise DescompressaoExcessiva(
+            f"'{info.filename}' descompactaria {info.file_size} bytes a partir de {info.compress_size} "
+            f"(razão acima de {RAZAO_MAXIMA_MEMBRO}:1)."
+        )
+
+
+def verificar_descompressao(infos: list[zipfile.ZipInfo]) -> None:
+    """
+    Confere os tamanhos declarados no diretório central ANTES de descompactar qualquer coisa:
+    razão de cada membro, razão do ZIP inteiro e soma descompactada.
+
+    Basta conferir os tamanhos declarados: o zipfile nunca entrega mais do que o 'file_size'
+    de um membro (um membro que inflaria além disso termina com erro de CRC).
+
+    Raises:
+        DescompressaoExcessiva: Se algum limite for ultrapassado.
+    """
+    descompactado = comprimido = 0
+    for info in infos:
+        verificar_membro(info)
+        descompactado += info.file_size
+        comprimido += info.compress_size
+    if descompactado > LIMITE_DESCOMPACTADO:
+        raise DescompressaoExcessiva(
+            f"Os XMLs somam {descompactado} bytes descompactados (limite: {LIMITE_DESCOMPACTADO})."
+        )
+    if descompactado > MINIMO_RAZAO and descompactado > RAZAO_MAXIMA_TOTAL * max(comprimido, 1):
+        raise DescompressaoExcessiva(
+            f"O ZIP descompactaria {descompactado} bytes a partir de {comprimido} "
+            f"(razão acima de {RAZAO_MAXIMA_TOTAL}:1)."
+        )
+
+
+class Reserva:
+    """
+    Orçamento de uma requisição. 'aguardar' bloqueia até o orçamento ser concedido;
+    'liberar' (ou o fim do bloco 'with') devolve o orçamento. Liberar duas vezes não tem efeito.
+    """
+
+    def __init__(self, controle: "ControleAdmissao", custo: Custo):
+        self.controle = controle
+        self.custo = controle.ajustar(custo)
+        self.concedida = False
+
+    def aguardar(self, espera: float | None = ADMISSAO_ESPERA) -> "Reserva":
+        """
+        Raises:
+            OrcamentoEsgotado: Fila de espera cheia ou 'espera' segundos sem orçamento.
+        """
+        self.controle._conceder(self, espera)
+        return self
+
+    def liberar(self) -> None:
+        self.controle._devolver(self)
+
+    def __enter__(self) -> "Reserva":
+        return self
+
+    def __exit__(self, *erro) -> None:
+        self.liberar()
+
+
+class ControleAdmissao:
+    """
+    Controle de admissão das requisições de processamento.
+
+    Cada requisição reserva a memória e as vagas de CPU estimadas ('Custo') antes de
+    começar. Sem orçamento livre, ela espera (no máximo 'limite_fila' requisições e
+    'espera' segundos cada); depois disso, OrcamentoEsgotado (o endpoint responde 503
+    com Retry-After). Um pedido maior que o orçamento inteiro é reduzido ao orçamento
+    e roda sozinho, em vez de nunca ser admitido.
+    """
+
+    def __init__(self, memoria: int = ORCAMENTO_MEMORIA, cpu: int = ORCAMENTO_CPU, limite_fila: int = ADMISSAO_FILA):
+        self.memoria = memoria
+        self.cpu = max(cpu, 1)
+        self.limite_fila = limite_fila
+        self._condicao = threading.Condition()
+
+        # Contadores expostos em /metrics
+        self.memoria_em_uso = 0
+        self.cpu_em_uso = 0
+        self.em_espera = 0
+        self.admitidas = 0
+        self.rejeitadas = 0
+
+    def ajustar(self, custo: Custo) -> Custo:
+        return Custo(min(custo.memoria, self.memoria), min(max(custo.cpu, 1), self.cpu))
+
+    def reserva(self, custo: Custo) -> Reserva:
+        """Reserva ainda não concedida (para quem precisa liberar mesmo se a espera for interrompida)."""
+        return Reserva(self, custo)
+
+    def reservar(self, custo: Custo, espera: float | None = ADMISSAO_ESPERA) -> Reserva:
+        """Bloqueia até o custo caber no orçamento. Use com 'with'."""
+        return self.reserva(custo).aguardar(espera)
+
+    def _cabe(self, custo: Custo) -> bool:
+        return self.memoria_em_uso + custo.memoria <= self.memoria and self.cpu_em_uso + custo.cpu <= self.cpu
+
+    def _conceder(self, reserva: Reserva, espera: float | None) -> None:
+        custo = reserva.custo
+        with self._condicao:
+            if not self._cabe(custo):
+                if self.em_espera >= self.limite_fila:
+                    self.rejeitadas += 1
+                    raise OrcamentoEsgotado("Servidor sem memória/CPU livres e fila de espera cheia.")
+                self.em_espera += 1
+                try:
+                    if not self._condicao.wait_for(lambda: self._cabe(custo), espera):
+                        self.rejeitadas += 1
+                        raise OrcamentoEsgotado(f"Servidor sem memória/CPU livres após {espera:g} s de espera.")
+                finally:
+                    self.em_espera -= 1
+            self.memoria_em_uso += custo.memoria
+            self.cpu_em_uso += custo.cpu
+            self.admitidas += 1
+            reserva.concedida = True
+
+    def _devolver(self, reserva: Reserva) -> None:
+        with self._condicao:
+            if not reserva.concedida:
+                return
+            reserva.concedida = False
+            self.memoria_em_uso -= reserva.custo.memoria
+            self.cpu_em_uso -= reserva.custo.cpu
+            self._condicao.notify_all()
+
+    def estatisticas(self) -> dict:
+        return {
+            "memoria_orcamento": self.memoria,
+            "memoria_em_uso": self.memoria_em_uso,
+            "cpu_orcamento": self.cpu,
+            "cpu_em_uso": self.cpu_em_uso,
+            "em_espera": self.em_espera,
+            "admitidas": self.admitidas,
+            "rejeitadas": self.rejeitadas,
+        }
+
+
+# Orçamento único do processo, compartilhado por endpoints e jobs
+controle_admissao = ControleAdmissao()
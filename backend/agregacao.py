@@ -0,0 +1,263 @@
+import io
+import csv
+
+import numpy as np
+
+from colunar import TabelaColunar
+
+
+# -------------------------------------------------------------------
+# CAMPOS DE CABEÇALHO POR DOCUMENTO (COLUNAS TIPADAS)
+# -------------------------------------------------------------------
+# Uma linha por XML válido, coletada pelo motor de extração na mesma passagem do parsing.
+# Valores monetários em centavos inteiros: as somas são exatas (sem erro de ponto flutuante).
+ESQUEMA_CABECALHOS = [
+    ("cnpj_emitente", "|S14"),      # CNPJ ou CPF
+    ("cnpj_destinatario", "|S14"),  # CNPJ ou CPF (vazio para estrangeiros / consumidor final)
+    ("uf_emitente", "|S2"),
+    ("uf_destinatario", "|S2"),
+    ("data_emissao", "<u4"),        # AAAAMMDD (0 se ausente)
+    ("cfop", "|S4"),                # CFOP do primeiro item da nota
+    ("categoria", "|S12"),          # aprovados / contingencia / rejeitados / cancelados / eventos
+    ("v_nf", "<i8"),
+    ("v_icms", "<i8"),
+    ("v_st", "<i8"),
+    ("v_ipi", "<i8"),
+]
+
+VALORES = ("v_nf", "v_icms", "v_st", "v_ipi")
+
+# Dimensões aceitas no relatório -> função que devolve o vetor de chaves (numpy)
+DIMENSOES = {
+    "emitente": lambda c: c["cnpj_emitente"],
+    "destinatario": lambda c: c["cnpj_destinatario"],
+    "uf_emitente": lambda c: c["uf_emitente"],
+    "uf_destinatario": lambda c: c["uf_destinatario"],
+    "cfop": lambda c: c["cfop"],
+    "categoria": lambda c: c["categoria"],
+    "dia": lambda c: c["data_emissao"],
+    "mes": lambda c: c["data_emissao"] // 100,
+    "ano": lambda c: c["data_emissao"] // 10000,
+}
+
+DIMENSOES_PADRAO = ("emitente", "cfop", "mes", "uf_destinatario")
+# Categorias somadas quando o pedido não escolhe: as notas que valem, como no relatorio_geral.csv.
+# Notas canceladas por um evento do lote só entram se pedidas ('cancelados', em grupo próprio na
+# dimensão 'categoria') e os eventos nunca entram: não são notas (sem emitente, CFOP nem totais).
+CATEGORIAS_PADRAO = ("aprovados", "contingencia", "rejeitados")
+CATEGORIA_EVENTOS = "eventos"
+# Dimensões de tempo saem em ordem cronológica; as demais, do maior vNF para o menor
+DIMENSOES_TEMPO = {"dia", "mes", "ano"}
+
+# Campos de cabeçalho lidos pelo motor de extração (nome local da tag -> coluna)
+_CAMPOS_TOTAIS = {"vNF": "v_nf", "vICMS": "v_icms", "vST": "v_st", "vIPI": "v_ipi"}
+
+
+def _centavos(texto: str | None) -> int:
+    # '1234.5' -> 123450 direto do texto (sem float): exato para qualquer magnitude.
+    # O leiaute da NF-e limita os valores a 2 casas decimais.
+    if not texto:
+        return 0
+    reais, _, fracao = texto.strip().partition('.')
+    try:
+        centavos = abs(int(reais or '0')) * 100 + int((fracao + '00')[:2])
+    except ValueError:
+        return 0
+    return -centavos if reais.startswith('-') else centavos
+
+
+def _data_numerica(texto: str | None) -> int:
+    # '2024-01-15T10:00:00-03:00' (dhEmi) ou '2024-01-15' (dEmi) -> 20240115
+    if not texto or len(texto) < 10:
+        return 0
+    try:
+        return int(texto[0:4] + texto[5:7] + texto[8:10])
+    except ValueError:
+        return 0
+
+
+class ColunasCabecalhos:
+    """
+    Coletor dos campos de cabeçalho (emitente, destinatário, UF, data, CFOP e totais).
+
+    O motor de extração preenche o documento pendente ('definir'); o processamento
+    grava a linha com 'concluir_documento' depois de classificar. XMLs corrompidos
+    nunca são concluídos, então não geram linha.
+    """
+
+    def __init__(self):
+        self.tabela = TabelaColunar(ESQUEMA_CABECALHOS)
+        self.pendente: dict = {}
+
+    def __len__(self):
+        return len(self.tabela)
+
+    def iniciar_documento(self) -> None:
+        self.pendente = {}
+
+    def definir(self, campo: str, valor) -> None:
+        # Primeira ocorrência vale (mesma regra do tpEmis/ICMSTot)
+        self.pendente.setdefault(campo, valor)
+
+    def definir_totais(self, icmstot) -> None:
+        """Lê vNF, vICMS, vST e vIPI dos filhos do elemento ICMSTot."""
+        for filho in icmstot:
+            if isinstance(filho.tag, str):
+                coluna = _CAMPOS_TOTAIS.get(filho.tag.rpartition('}')[2])
+                if coluna is not None:
+                    self.definir(coluna, _centavos(filho.text))
+
+    def definir_participante(self, papel: str, elemento) -> None:
+        """Lê CNPJ/CPF e UF de 'emit' ou 'dest' (papel = 'emitente' ou 'destinatario')."""
+        for filho in elemento:
+            if not isinstance(filho.tag, str):
+                continue
+            nome = filho.tag.rpartition('}')[2]
+            if nome in ('CNPJ', 'CPF'):
+                self.definir(f"cnpj_{papel}", filho.text)
+            elif nome.startswith('ender'):
+                for campo in filho:
+                    if isinstance(campo.tag, str) and campo.tag.endswith('UF'):
+                        self.definir(f"uf_{papel}", campo.text)
+
+    def definir_data(self, texto: str | None) -> None:
+        self.definir("data_emissao", _data_numerica(texto))
+
+    def concluir_documento(self, categoria: str) -> None:
+        pendente = self.pendente
+        colunas = self.tabela.colunas
+        for nome, tipo in ESQUEMA_CABECALHOS:
+            if nome == "categoria":
+                colunas[nome].adicionar(categoria)
+            elif tipo.startswith("|S"):
+                colunas[nome].adicionar(pendente.get(nome))
+            else:
+                colunas[nome].valores.append(pendente.get(nome, 0))
+        self.pendente = {}
+
+    def estender(self, outras: "ColunasCabecalhos") -> None:
+        self.tabela.estender(outras.tabela)
+
+    def reclassificar(self, linhas: dict[int, str]) -> None:
+        """Corrige a categoria das linhas indicadas (ex: notas canceladas por um evento do lote)."""
+        self.tabela.colunas["categoria"].substituir(linhas)
+
+    def como_numpy(self) -> dict[str, np.ndarray]:
+        """
+        Vetores numpy SEM cópia, apontando para os buffers das colunas.
+        Enquanto eles existirem as colunas não podem crescer (o buffer está exportado).
+        """
+        vetores = {}
+        for nome, tipo in ESQUEMA_CABECALHOS:
+            coluna = self.tabela.colunas[nome]
+            buffer = coluna.dados if tipo.startswith("|S") else coluna.valores
+            vetores[nome] = np.frombuffer(buffer, dtype=np.dtype(tipo)) if len(buffer) else np.empty(0, np.dtype(tipo))
+        return vetores
+
+
+# -------------------------------------------------------------------
+# AGREGAÇÃO VETORIZADA
+# -------------------------------------------------------------------
+def _formatar_chave(valor) -> str:
+    if isinstance(valor, bytes):
+        return valor.decode('ascii', 'replace')
+    return str(valor)
+
+
+def validar_dimensoes(dimensoes) -> None:
+    """Levanta ValueError se alguma dimensão (ou parte de dimensão composta) não existir."""
+    desconhecidas = [parte for dimensao in dimensoes for parte in dimensao.split('+') if parte not in DIMENSOES]
+    if desconhecidas:
+        raise ValueError(f"Dimensão desconhecida: {', '.join(desconhecidas)}. Use: {', '.join(DIMENSOES)}.")
+
+
+def agregar(cabecalhos: ColunasCabecalhos, dimensoes=DIMENSOES_PADRAO, categorias=None) -> dict:
+    """
+    Totais (documentos, vNF, vICMS, vST, vIPI em centavos) por dimensão, todos de uma vez.
+
+    As reduções são feitas em bloco pelo numpy: 'np.unique' agrupa as chaves e
+    'np.add.reduceat' soma cada grupo em int64 (exato), sem laço Python por documento.
+    Uma dimensão composta junta várias com '+' (ex: 'emitente+mes').
+
+    Args:
+        cabecalhos (ColunasCabecalhos): Colunas coletadas durante o processamento.
+        dimensoes (Iterable[str]): Dimensões do relatório (ver DIMENSOES).
+        categorias (Iterable[str] | None): Considera só estas categorias (padrão: CATEGORIAS_PADRAO,
+            sem as notas canceladas). Eventos são sempre ignorados.
+
+    Raises:
+        ValueError: Dimensão desconhecida.
+    """
+    validar_dimensoes(dimensoes)
+    vetores = cabecalhos.como_numpy()
+    categorias = CATEGORIAS_PADRAO if categorias is None else categorias
+    filtro = np.isin(vetores["categoria"], [c.encode('ascii') for c in categorias if c != CATEGORIA_EVENTOS])
+    vetores = {nome: vetor[filtro] for nome, vetor in vetores.items()}
+
+    relatorio = {}
+    for dimensao in dimensoes:
+        partes = dimensao.split('+')
+
+        # Código inteiro por documento em cada parte; dimensões compostas combinam os códigos
+        chaves_partes = []
+        codigos = np.zeros(len(vetores["v_nf"]), dtype=np.int64)
+        for parte in partes:
+            valores_unicos, codigos_parte = np.unique(DIMENSOES[parte](vetores), return_inverse=True)
+            chaves_partes.append(valores_unicos)
+            codigos = codigos * len(valores_unicos) + codigos_parte.reshape(-1)
+
+        grupos, inverso, contagens = np.unique(codigos, return_inverse=True, return_counts=True)
+        ordem = np.argsort(inverso, kind='stable')
+        inicios = np.concatenate(([0], np.cumsum(contagens)[:-1])) if len(grupos) else np.empty(0, np.int64)
+        somas = {
+            campo: np.add.reduceat(vetores[campo][ordem], inicios) if len(grupos) else np.empty(0, np.int64)
+            for campo in VALORES
+        }
+
+        # Decompõe o código do grupo de volta nas chaves de cada parte
+        indices_partes = []
+        resto = grupos
+        for valores_unicos in reversed(chaves_partes):
+            indices_partes.append(resto % len(valores_unicos))
+            resto = resto // len(valores_unicos)
+        indices_partes.reverse()
+
+        linhas = []
+        for g in range(len(grupos)):
+            linha = {
+                "chave": "+".join(
+                    _formatar_chave(valores_unicos[indices[g]])
+                    for valores_unicos, indices in zip(chaves_partes, indices_partes)
+                ),
+                "documentos": int(contagens[g]),
+            }
+            for campo in VALORES:
+                linha[f"{campo}_centavos"] = int(somas[campo][g])
+            linhas.append(linha)
+
+        if not set(partes) <= DIMENSOES_TEMPO:
+            linhas.sort(key=lambda linha: (-linha["v_nf_centavos"], linha["chave"]))
+        relatorio[dimensao] = linhas
+
+    return relatorio
+
+
+def formatar_centavos(centavos: int, separador: str = '.') -> str:
+    """Centavos inteiros -> '1234.56' (ou '1234,56'), sem passar por float."""
+    sinal = '-' if centavos < 0 else ''
+    reais, resto = divmod(abs(centavos), 100)
+    return f"{sinal}{reais}{separador}{resto:02d}"
+
+
+def relatorio_csv(relatorio: dict) -> bytes:
+    """Relatório agregado em CSV (';' e vírgula decimal, para o Excel PT-BR), uma seção por dimensão."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=';')
+    writer.writerow(['Dimensão', 'Chave', 'Documentos', 'vNF (R$)', 'vICMS (R$)', 'vST (R$)', 'vIPI (R$)'])
+    for dimensao, linhas in relatorio.items():
+        for linha in linhas:
+            writer.writerow(
+                [dimensao, linha["chave"], linha["documentos"]]
+                + [formatar_centavos(linha[f"{campo}_centavos"], ',') for campo in VALORES]
+            )
+    return buffer.getvalue().encode('utf-8-sig')
@@ -0,0 +1,465 @@
+"""
+Teste de carga local do '/processar-zip/' (asyncio).
+
+Dispara uma mistura de lotes (quantidade de XMLs por ZIP, com pesos) contra a aplicação e
+mede vazão, percentis de latência, taxa de erros e a memória (RSS) do servidor ao longo do
+tempo, para dimensionar workers do uvicorn, threadpool (MONXML_THREADS_REQUISICOES),
+processos do pool e limites de upload/admissão com dados.
+
+Dois modelos de chegada:
+  - fechado ('--concorrencia'): N clientes, cada um envia o próximo lote assim que recebe a resposta;
+  - aberto ('--taxa'): chegadas de Poisson a R requisições/s, independentes das respostas. A latência
+    conta a partir do instante agendado (se o cliente atrasar, o atraso entra na medida).
+
+Três alvos:
+  - em processo (padrão): a aplicação ASGI roda no mesmo event loop, sem servidor nem rede;
+  - '--servidor': sobe um uvicorn local ('--workers') só para o teste;
+  - '--url': servidor já em execução ('--pid' para acompanhar o RSS dele).
+
+Uso (a partir da pasta backend/):
+    python -m benchmarks.carga --mistura 50:3 500:1 --concorrencia 1 4 16 --duracao 30
+    python -m benchmarks.carga --mistura 200 --taxa 1 2 4 --duracao 60
+    python -m benchmarks.carga --servidor --workers 2 --concorrencia 8 --query compressao=rapida
+    python -m benchmarks.carga --url http://127.0.0.1:8000 --pid 1234 --concorrencia 4
+"""
+import os
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import argparse
+import contextlib
+import subprocess
+from datetime import datetime, timezone
+from typing import NamedTuple, Awaitable, Callable
+from urllib.parse import urlsplit
+
+from benchmarks.corpus import PerfilCorpus, gerar_corpus_zip
+from benchmarks.executar import (
+    DIRETORIO_BACKEND, chamar_endpoint, montar_multipart_zip, percentil, descrever_ambiente
+)
+
+
+# Versão do formato do JSON de resultados (incrementar se os campos mudarem)
+VERSAO_FORMATO = 1
+
+PERCENTIS = (50, 90, 95, 99)
+TAMANHO_PEDACO_ENVIO = 64 * 1024
+
+# Envia um lote e devolve (status, bytes recebidos)
+Enviar = Callable[["Lote"], Awaitable[tuple[int, int]]]
+
+
+class Lote(NamedTuple):
+    """Um ZIP da mistura, já montado como corpo multipart."""
+    arquivos: int
+    peso: int
+    corpo: bytes
+    content_type: str
+
+
+class Amostra(NamedTuple):
+    """Uma requisição: instante (relativo ao início da etapa), latência e resultado."""
+    inicio: float
+    latencia: float
+    arquivos: int
+    status: int | None
+    bytes_recebidos: int
+    erro: str | None
+
+
+# -------------------------------------------------------------------
+# MISTURA DE LOTES
+# -------------------------------------------------------------------
+def ler_mistura(especificacao: list[str]) -> list[tuple[int, int]]:
+    """'50:3 500:1' -> [(50, 3), (500, 1)]: lotes de 50 XMLs com peso 3, de 500 com peso 1."""
+    mistura = []
+    for item in especificacao:
+        arquivos, _, peso = item.partition(":")
+        mistura.append((int(arquivos), int(peso or 1)))
+    if not mistura or any(arquivos <= 0 or peso <= 0 for arquivos, peso in mistura):
+        raise ValueError("Mistura inválida: use ARQUIVOS[:PESO] com valores positivos (ex: 50:3 500:1).")
+    return mistura
+
+
+def montar_lotes(mistura: list[tuple[int, int]], itens_max: int = 30, semente: int = 42) -> list[Lote]:
+    """Gera um corpus (reproduzível) para cada tamanho da mistura."""
+    lotes = []
+    for arquivos, peso in mistura:
+        conteudo = gerar_corpus_zip(PerfilCorpus(arquivos=arquivos, itens_max=itens_max, semente=semente + arquivos))
+        corpo, content_type = montar_multipart_zip(conteudo)
+        lotes.append(Lote(arquivos, peso, corpo, content_type))
+    return lotes
+
+
+def sortear(lotes: list[Lote], aleatorio: random.Random) -> Lote:
+    return aleatorio.choices(lotes, weights=[lote.peso for lote in lotes])[0]
+
+
+# -------------------------------------------------------------------
+# ALVOS
+# -------------------------------------------------------------------
+def alvo_em_processo(app, caminho: str, query: str) -> Enviar:
+    """Chama a aplicação ASGI direto no event loop atual (mesmo caminho de 'benchmarks.executar')."""
+    async def enviar(lote: Lote) -> tuple[int, int]:
+        return await chamar_endpoint(app, lote.corpo, lote.content_type, caminho, query)
+    return enviar
+
+
+async def post_http(host: str, port: int, caminho: str, corpo: bytes, content_type: str) -> tuple[int, int]:
+    """
+    POST HTTP/1.1 mínimo sobre asyncio (uma conexão por requisição, 'Connection: close').
+    Devolve (status, bytes do corpo da resposta). Em respostas 'chunked' o enquadramento entra na conta.
+    """
+    leitor, escritor = await asyncio.open_connection(host, port)
+    try:
+        escritor.write((
+            f"POST {caminho} HTTP/1.1\r\nHost: {host}:{port}\r\nContent-Type: {content_type}\r\n"
+            f"Content-Length: {len(corpo)}\r\nConnection: close\r\n\r\n"
+        ).encode("latin-1"))
+        for inicio in range(0, len(corpo), TAMANHO_PEDACO_ENVIO):
+            escritor.write(corpo[inicio:inicio + TAMANHO_PEDACO_ENVIO])
+            await escritor.drain()
+
+        status = int((await leitor.readline()).split()[1])
+        while (await leitor.readline()) not in (b"\r\n", b""):
+            pass
+        recebidos = 0
+        while pedaco := await leitor.read(TAMANHO_PEDACO_ENVIO):
+            recebidos += len(pedaco)
+        return status, recebidos
+    finally:
+        escritor.close()
+        with contextlib.suppress(OSError):
+            await escritor.wait_closed()
+
+
+def alvo_http(url: str, caminho: str, query: str) -> Enviar:
+    partes = urlsplit(url)
+    host, port = partes.hostname or "127.0.0.1", partes.port or 80
+    alvo = f"{partes.path.rstrip('/')}{caminho}" + (f"?{query}" if query else "")
+
+    async def enviar(lote: Lote) -> tuple[int, int]:
+        return await post_http(host, port, alvo, lote.corpo, lote.content_type)
+    return enviar
+
+
+def _esperar_porta(porta: int, processo: subprocess.Popen, limite: float = 30.0) -> None:
+    fim = time.monotonic() + limite
+    while time.monotonic() < fim:
+        if processo.poll() is not None:
+            raise RuntimeError(f"O uvicorn terminou ao iniciar (código {processo.returncode}).")
+        with contextlib.suppress(OSError), socket.create_connection(("127.0.0.1", porta), timeout=0.5):
+            return
+        time.sleep(0.1)
+    raise RuntimeError(f"O uvicorn não abriu a porta {porta} em {limite:g} s.")
+
+
+@contextlib.contextmanager
+def servidor_local(porta: int, workers: int, variaveis: dict | None = None):
+    """Sobe 'uvicorn main:app' numa porta local durante o bloco. Devolve (url, pid)."""
+    comando = [
+        sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(porta),
+        "--workers", str(workers), "--log-level", "warning",
+    ]
+    processo = subprocess.Popen(comando, cwd=DIRETORIO_BACKEND, env={**os.environ, **(variaveis or {})})
+    try:
+        _esperar_porta(porta, processo)
+        yield f"http://127.0.0.1:{porta}", processo.pid
+    finally:
+        processo.terminate()
+        try:
+            processo.wait(10)
+        except subprocess.TimeoutExpired:
+            processo.kill()
+
+
+# -------------------------------------------------------------------
+# MEMÓRIA DO SERVIDOR
+# -------------------------------------------------------------------
+def _filhos(pid: int) -> list[int]:
+    filhos = []
+    with contextlib.suppress(OSError):
+        for tarefa in os.listdir(f"/proc/{pid}/task"):
+            with open(f"/proc/{pid}/task/{tarefa}/children") as arquivo:
+                filhos.extend(int(filho) for filho in arquivo.read().split())
+    return filhos
+
+
+def rss_mb(pid: int) -> float | None:
+    """
+    RSS atual (MB) do processo e de todos os descendentes (workers do uvicorn, pool de processos).
+    Lido de /proc: fora do Linux devolve None.
+    """
+    total = 0
+    pendentes = [pid]
+    while pendentes:
+        atual = pendentes.pop()
+        try:
+            with open(f"/proc/{atual}/status") as arquivo:
+                for linha in arquivo:
+                    if linha.startswith("VmRSS:"):
+                        total += int(linha.split()[1])
+                        break
+        except OSError:
+            if atual == pid:
+                return None
+            continue
+        pendentes.extend(_filhos(atual))
+    return round(total / 1024, 1)
+
+
+async def monitorar_rss(pid: int | None, intervalo: float, inicio: float, em_voo: Callable[[], int], serie: list) -> None:
+    """Acrescenta [segundos, rss_mb, requisições em andamento] a 'serie' a cada 'intervalo' (até ser cancelado)."""
+    while True:
+        rss = rss_mb(pid) if pid is not None else None
+        serie.append([round(time.perf_counter() - inicio, 2), rss, em_voo()])
+        await asyncio.sleep(intervalo)
+
+
+# -------------------------------------------------------------------
+# MODELOS DE CHEGADA
+# -------------------------------------------------------------------
+class _Etapa:
+    """Estado compartilhado de uma etapa: amostras e requisições em andamento."""
+
+    def __init__(self, enviar: Enviar, timeout: float):
+        self.enviar = enviar
+        self.timeout = timeout
+        self.inicio = time.perf_counter()
+        self.amostras: list[Amostra] = []
+        self.em_voo = 0
+
+    async def disparar(self, lote: Lote, agendado: float | None = None) -> None:
+        # 'agendado' (modelo aberto): a latência conta desde o instante planejado da chegada
+        inicio = agendado if agendado is not None else time.perf_counter()
+        status, recebidos, erro = None, 0, None
+        self.em_voo += 1
+        try:
+            status, recebidos = await asyncio.wait_for(self.enviar(lote), self.timeout)
+        except (OSError, asyncio.TimeoutError, ValueError, IndexError) as excecao:
+            erro = type(excecao).__name__
+        finally:
+            self.em_voo -= 1
+        self.amostras.append(Amostra(
+            round(inicio - self.inicio, 4), time.perf_counter() - inicio, lote.arquivos, status, recebidos, erro
+        ))
+
+
+async def carga_fechada(etapa: _Etapa, lotes: list[Lote], concorrencia: int, duracao: float,
+                        requisicoes: int | None, aleatorio: random.Random) -> None:
+    """'concorrencia' clientes em laço até 'duracao' segundos ou 'requisicoes' enviadas."""
+    fim = etapa.inicio + duracao
+    restantes = requisicoes
+
+    async def cliente():
+        nonlocal restantes
+        while time.perf_counter() < fim:
+            if restantes is not None:
+                if restantes <= 0:
+                    return
+                restantes -= 1
+            await etapa.disparar(sortear(lotes, aleatorio))
+
+    await asyncio.gather(*(cliente() for _ in range(concorrencia)))
+
+
+async def carga_aberta(etapa: _Etapa, lotes: list[Lote], taxa: float, duracao: float,
+                       requisicoes: int | None, limite_em_voo: int, aleatorio: random.Random) -> None:
+    """
+    Chegadas de Poisson a 'taxa' requisições/s durante 'duracao' segundos. No máximo 'limite_em_voo'
+    requisições abertas ao mesmo tempo (proteção do próprio cliente); as que esperam vaga já estão
+    contando latência.
+    """
+    vagas = asyncio.Semaphore(limite_em_voo)
+    tarefas = []
+
+    async def chegada(lote: Lote, agendado: float):
+        async with vagas:
+            await etapa.disparar(lote, agendado)
+
+    agendado = etapa.inicio
+    while True:
+        agendado += aleatorio.expovariate(taxa)
+        if agendado > etapa.inicio + duracao or (requisicoes is not None and len(tarefas) >= requisicoes):
+            break
+        await asyncio.sleep(max(0.0, agendado - time.perf_counter()))
+        tarefas.append(asyncio.create_task(chegada(sortear(lotes, aleatorio), agendado)))
+    await asyncio.gather(*tarefas)
+
+
+# -------------------------------------------------------------------
+# RESUMO
+# -------------------------------------------------------------------
+def _latencias(amostras: list[Amostra]) -> dict:
+    latencias = [amostra.latencia for amostra in amostras]
+    if not latencias:
+        return {}
+    return {
+        **{f"p{p}_s": round(percentil(latencias, p), 4) for p in PERCENTIS},
+        "max_s": round(max(latencias), 4),
+    }
+
+
+def resumir_etapa(amostras: list[Amostra], duracao: float, serie_rss: list) -> dict:
+    """Vazão, percentis (só das respostas 200), erros por status/exceção e RSS da etapa."""
+    sucesso = [amostra for amostra in amostras if amostra.status == 200]
+    erros: dict[str, int] = {}
+    for amostra in amostras:
+        if amostra.status != 200:
+            chave = amostra.erro or str(amostra.status)
+            erros[chave] = erros.get(chave, 0) + 1
+
+    por_lote = {}
+    for arquivos in sorted({amostra.arquivos for amostra in amostras}):
+        do_lote = [amostra for amostra in amostras if amostra.arquivos == arquivos]
+        ok = [amostra for amostra in do_lote if amostra.status == 200]
+        por_lote[str(arquivos)] = {"requisicoes": len(do_lote), "erros": len(do_lote) - len(ok), **_latencias(ok)}
+
+    valores_rss = [rss for _, rss, _ in serie_rss if rss is not None]
+    return {
+        "requisicoes": len(amostras),
+        "sucesso": len(sucesso),
+        "taxa_erro": round(1 - len(sucesso) / len(amostras), 4) if amostras else 0.0,
+        "erros": erros,
+        "duracao_s": round(duracao, 3),
+        "requisicoes_por_s": round(len(sucesso) / duracao, 3) if duracao else 0.0,
+        "arquivos_por_s": round(sum(amostra.arquivos for amostra in sucesso) / duracao, 1) if duracao else 0.0,
+        **_latencias(sucesso),
+        "por_lote": por_lote,
+        "rss_pico_mb": max(valores_rss, default=None),
+        # [segundos desde o início da etapa, RSS (MB), requisições em andamento]
+        "rss": serie_rss,
+    }
+
+
+async def executar_etapa(enviar: Enviar, lotes: list[Lote], *, concorrencia: int | None = None,
+                         taxa: float | None = None, duracao: float = 30.0, requisicoes: int | None = None,
+                         limite_em_voo: int = 64, pid: int | None = None, intervalo_rss: float = 0.5,
+                         timeout: float = 600.0, semente: int = 0) -> dict:
+    """Roda uma etapa (modelo fechado com 'concorrencia' ou aberto com 'taxa') e devolve o resumo."""
+    aleatorio = random.Random(semente)
+    etapa = _Etapa(enviar, timeout)
+    serie_rss: list = []
+    monitor = asyncio.create_task(monitorar_rss(pid, intervalo_rss, etapa.inicio, lambda: etapa.em_voo, serie_rss))
+    try:
+        if taxa is not None:
+            await carga_aberta(etapa, lotes, taxa, duracao, requisicoes, limite_em_voo, aleatorio)
+        else:
+            await carga_fechada(etapa, lotes, concorrencia or 1, duracao, requisicoes, aleatorio)
+    finally:
+        monitor.cancel()
+    duracao_real = time.perf_counter() - etapa.inicio
+    if pid is not None:
+        serie_rss.append([round(duracao_real, 2), rss_mb(pid), 0])
+    parametros = {"taxa": taxa} if taxa is not None else {"concorrencia": concorrencia or 1}
+    return {**parametros, **resumir_etapa(etapa.amostras, duracao_real, serie_rss)}
+
+
+async def executar_carga(enviar: Enviar, lotes: list[Lote], niveis: list, modelo: str, **opcoes) -> list[dict]:
+    """Uma etapa por nível (concorrência ou taxa), com um aquecimento de uma requisição por lote."""
+    for lote in lotes:
+        await enviar(lote)
+    etapas = []
+    for nivel in niveis:
+        chave = "taxa" if modelo == "aberto" else "concorrencia"
+        etapas.append(await executar_etapa(enviar, lotes, **{chave: nivel}, **opcoes))
+        imprimir_etapa(etapas[-1])
+    return etapas
+
+
+def imprimir_etapa(etapa: dict) -> None:
+    nivel = f"taxa {etapa['taxa']:g}/s" if "taxa" in etapa else f"concorrência {etapa['concorrencia']}"
+    latencias = "  ".join(f"p{p} {etapa[f'p{p}_s']:.3f}s" for p in PERCENTIS if f"p{p}_s" in etapa)
+    print(
+        f"{nivel:<18} {etapa['requisicoes_por_s']:>8} req/s  {etapa['arquivos_por_s']:>9} arquivos/s  {latencias}  "
+        f"erros {etapa['taxa_erro']:.1%} {etapa['erros'] or ''}  pico RSS {etapa['rss_pico_mb']} MB"
+    )
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mistura", nargs="+", default=["50:3", "500:1"],
+                        help="Lotes ARQUIVOS[:PESO] (ex: 50:3 500:1 = 3 lotes de 50 XMLs para cada um de 500)")
+    parser.add_argument("--itens-max", type=int, default=30)
+    parser.add_argument("--semente", type=int, default=42)
+    modelo = parser.add_mutually_exclusive_group()
+    modelo.add_argument("--concorrencia", type=int, nargs="+", help="Modelo fechado: clientes simultâneos (uma etapa por valor)")
+    modelo.add_argument("--taxa", type=float, nargs="+", help="Modelo aberto: chegadas por segundo (uma etapa por valor)")
+    parser.add_argument("--duracao", type=float, default=30.0, help="Segundos por etapa")
+    parser.add_argument("--requisicoes", type=int, help="Encerra a etapa após N requisições")
+    parser.add_argument("--limite-em-voo", type=int, default=64, help="Modelo aberto: requisições abertas ao mesmo tempo")
+    parser.add_argument("--timeout", type=float, default=600.0)
+    parser.add_argument("--caminho", default="/processar-zip/")
+    parser.add_argument("--query", default="", help="Parâmetros extras (ex: compressao=rapida&itens=true)")
+    parser.add_argument("--com-cache", action="store_true",
+                        help="Mantém o cache de classificação e o armazém de resultados (reenvios ficam quase grátis)")
+    alvo = parser.add_mutually_exclusive_group()
+    alvo.add_argument("--url", help="Servidor já em execução (ex: http://127.0.0.1:8000)")
+    alvo.add_argument("--servidor", action="store_true", help="Sobe um uvicorn local durante o teste")
+    parser.add_argument("--workers", type=int, default=1, help="Workers do uvicorn de '--servidor'")
+    parser.add_argument("--porta", type=int, default=8765)
+    parser.add_argument("--pid", type=int, help="PID do servidor de '--url' (para o RSS)")
+    parser.add_argument("--intervalo-rss", type=float, default=0.5)
+    parser.add_argument("--saida", help="Arquivo JSON de saída (padrão: benchmarks/resultados/carga-<data>.json)")
+    args = parser.parse_args(argv)
+
+    query = "&".join(filter(None, [f"usar_cache={str(args.com_cache).lower()}", args.query]))
+    modelo_chegada = "aberto" if args.taxa else "fechado"
+    niveis = args.taxa or args.concorrencia or [1]
+    mistura = ler_mistura(args.mistura)
+    lotes = montar_lotes(mistura, args.itens_max, args.semente)
+    opcoes = {
+        "duracao": args.duracao, "requisicoes": args.requisicoes, "limite_em_voo": args.limite_em_voo,
+        "intervalo_rss": args.intervalo_rss, "timeout": args.timeout, "semente": args.semente,
+    }
+
+    with contextlib.ExitStack() as pilha:
+        if args.servidor:
+            url, pid = pilha.enter_context(servidor_local(args.porta, args.workers))
+            descricao_alvo = {"tipo": "servidor", "workers": args.workers}
+        elif args.url:
+            url, pid = args.url, args.pid
+            descricao_alvo = {"tipo": "url", "url": url}
+        else:
+            url, pid = None, os.getpid()
+            descricao_alvo = {"tipo": "em_processo"}
+
+        if url is None:
+            import main as aplicacao
+
+            async def rodar():
+                # Sem servidor, o lifespan não roda: o threadpool é configurado aqui, no loop do teste
+                aplicacao.configurar_threadpool()
+                return await executar_carga(
+                    alvo_em_processo(aplicacao.app, args.caminho, query), lotes, niveis, modelo_chegada, pid=pid, **opcoes
+                )
+        else:
+            async def rodar():
+                return await executar_carga(alvo_http(url, args.caminho, query), lotes, niveis, modelo_chegada, pid=pid, **opcoes)
+
+        etapas = asyncio.run(rodar())
+
+    resultado = {
+        "versao_formato": VERSAO_FORMATO,
+        "data": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "ambiente": descrever_ambiente(),
+        "alvo": {**descricao_alvo, "caminho": args.caminho, "query": query},
+        "mistura": [{"arquivos": lote.arquivos, "peso": lote.peso, "bytes": len(lote.corpo)} for lote in lotes],
+        "modelo": modelo_chegada,
+        "etapas": etapas,
+    }
+    saida = args.saida or os.path.join(
+        DIRETORIO_BACKEND, "benchmarks", "resultados", f"carga-{datetime.now():%Y%m%d-%H%M%S}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(saida)), exist_ok=True)
+    with open(saida, "w", encoding="utf-8") as arquivo:
+        json.dump(resultado, arquivo, ensure_ascii=False, indent=2)
+    print(f"Resultados gravados em {saida}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
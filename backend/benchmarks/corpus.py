@@ -0,0 +1,170 @@
+import io
+import random
+import zipfile
+from dataclasses import dataclass, field
+
+
+# -------------------------------------------------------------------
+# GERADOR DE CORPUS SINTÉTICO DE NF-e
+# -------------------------------------------------------------------
+# Produz documentos com a mesma estrutura dos reais (ide, emit, dest, det/prod/imposto,
+# total/ICMSTot e protNFe/infProt), para que o benchmark exercite o motor de extração
+# como em produção. Tudo é derivado de uma semente: o mesmo perfil gera SEMPRE o mesmo ZIP.
+
+NAMESPACE_NFE = "http://www.portalfiscal.inf.br/nfe"
+DATA_ARQUIVOS = (2024, 1, 15, 10, 0, 0)
+
+XMOTIVOS = {
+    "100": "Autorizado o uso da NF-e",
+    "150": "Autorizado o uso da NF-e, autorizacao fora de prazo",
+    "204": "Rejeicao: Duplicidade de NF-e",
+    "539": "Rejeicao: Duplicidade de NF-e, com diferenca na Chave de Acesso",
+    "302": "Uso Denegado: Irregularidade fiscal do destinatario",
+}
+
+
+@dataclass
+class PerfilCorpus:
+    """
+    Descrição de um corpus: quantidade de arquivos, itens por nota e a mistura de casos.
+
+    Os pesos de 'cstat' e 'tpemis' são relativos (não precisam somar 1).
+    'proporcao_sem_protocolo' gera NFe "crua" (sem nfeProc/protNFe), que cai em rejeitados.
+    'proporcao_canceladas' acrescenta, logo depois de uma nota autorizada, o procEventoNFe
+    de cancelamento dela (um arquivo a mais no ZIP).
+    """
+    arquivos: int = 1000
+    itens_min: int = 1
+    itens_max: int = 30
+    cstat: dict = field(default_factory=lambda: {"100": 80, "150": 5, "204": 10, "302": 5})
+    tpemis: dict = field(default_factory=lambda: {"1": 90, "9": 10})
+    proporcao_corrompidos: float = 0.02
+    proporcao_sem_protocolo: float = 0.03
+    proporcao_canceladas: float = 0.0
+    semente: int = 42
+
+    def como_dict(self) -> dict:
+        return dict(self.__dict__)
+
+
+def _escolher(aleatorio: random.Random, pesos: dict) -> str:
+    return aleatorio.choices(list(pesos), weights=list(pesos.values()))[0]
+
+
+def _montar_itens(aleatorio: random.Random, quantidade: int) -> tuple[str, int, int]:
+    # Valores em centavos (inteiros) para os totais baterem exatamente com a soma dos itens
+    partes = []
+    total_prod = 0
+    total_icms = 0
+    for n in range(1, quantidade + 1):
+        quantidade_item = aleatorio.randint(1, 20)
+        unitario = aleatorio.randint(100, 50000)
+        v_prod = quantidade_item * unitario
+        v_icms = v_prod * 18 // 100
+        total_prod += v_prod
+        total_icms += v_icms
+        partes.append(
+            f'<det nItem="{n}"><prod>'
+            f'<cProd>{aleatorio.randint(1, 99999):05d}</cProd>'
+            f'<cEAN>SEM GTIN</cEAN>'
+            f'<xProd>PRODUTO SINTETICO {aleatorio.randint(1, 5000)}</xProd>'
+            f'<NCM>{aleatorio.randint(10000000, 99999999)}</NCM>'
+            f'<CFOP>5102</CFOP><uCom>UN</uCom>'
+            f'<qCom>{quantidade_item}.0000</qCom>'
+            f'<vUnCom>{unitario / 100:.10f}</vUnCom>'
+            f'<vProd>{v_prod / 100:.2f}</vProd>'
+            f'</prod><imposto><ICMS><ICMS00>'
+            f'<orig>0</orig><CST>00</CST><modBC>3</modBC>'
+            f'<vBC>{v_prod / 100:.2f}</vBC><pICMS>18.00</pICMS><vICMS>{v_icms / 100:.2f}</vICMS>'
+            f'</ICMS00></ICMS></imposto></det>'
+        )
+    return "".join(partes), total_prod, total_icms
+
+
+def gerar_nfe(
+    aleatorio: random.Random,
+    numero: int,
+    itens: int,
+    cstat: str | None = "100",
+    tpemis: str = "1",
+) -> bytes:
+    """
+    Gera um XML de NF-e. Com 'cstat' devolve um nfeProc (NFe + protNFe); com None, a NFe crua.
+    """
+    dets, total_prod, total_icms = _montar_itens(aleatorio, itens)
+    chave = f"35{aleatorio.randint(10**41, 10**42 - 1)}"
+    nfe = (
+        f'<NFe xmlns="{NAMESPACE_NFE}"><infNFe Id="NFe{chave}" versao="4.00">'
+        f'<ide><cUF>35</cUF><natOp>VENDA</natOp><mod>55</mod><serie>1</serie><nNF>{numero}</nNF>'
+        f'<dhEmi>2024-01-15T10:00:00-03:00</dhEmi><tpNF>1</tpNF><tpEmis>{tpemis}</tpEmis></ide>'
+        f'<emit><CNPJ>{aleatorio.randint(10**13, 10**14 - 1)}</CNPJ><xNome>EMITENTE SINTETICO LTDA</xNome></emit>'
+        f'<dest><CNPJ>{aleatorio.randint(10**13, 10**14 - 1)}</CNPJ><xNome>DESTINATARIO SINTETICO SA</xNome></dest>'
+        f'{dets}'
+        f'<total><ICMSTot><vBC>{total_prod / 100:.2f}</vBC><vICMS>{total_icms / 100:.2f}</vICMS>'
+        f'<vProd>{total_prod / 100:.2f}</vProd><vNF>{total_prod / 100:.2f}</vNF></ICMSTot></total>'
+        f'</infNFe></NFe>'
+    )
+    if cstat is None:
+        return f'<?xml version="1.0" encoding="UTF-8"?>{nfe}'.encode()
+
+    return (
+        f'<?xml version="1.0" encoding="UTF-8"?><nfeProc xmlns="{NAMESPACE_NFE}" versao="4.00">{nfe}'
+        f'<protNFe versao="4.00"><infProt><tpAmb>1</tpAmb><chNFe>{chave}</chNFe>'
+        f'<dhRecbto>2024-01-15T10:00:05-03:00</dhRecbto><nProt>1{numero:014d}</nProt>'
+        f'<cStat>{cstat}</cStat><xMotivo>{XMOTIVOS.get(cstat, "Rejeicao")}</xMotivo></infProt></protNFe>'
+        f'</nfeProc>'
+    ).encode()
+
+
+def gerar_evento_cancelamento(chave: str, cstat: str = "135") -> bytes:
+    """Gera um procEventoNFe de cancelamento (tpEvento 110111) da nota 'chave'."""
+    return (
+        f'<?xml version="1.0" encoding="UTF-8"?><procEventoNFe xmlns="{NAMESPACE_NFE}" versao="1.00">'
+        f'<evento versao="1.00"><infEvento Id="ID110111{chave}01"><cOrgao>35</cOrgao><tpAmb>1</tpAmb>'
+        f'<CNPJ>00000000000191</CNPJ><chNFe>{chave}</chNFe><dhEvento>2024-01-16T09:00:00-03:00</dhEvento>'
+        f'<tpEvento>110111</tpEvento><nSeqEvento>1</nSeqEvento><verEvento>1.00</verEvento>'
+        f'<detEvento versao="1.00"><descEvento>Cancelamento</descEvento><nProt>135240000000001</nProt>'
+        f'<xJust>Cancelamento de teste do corpus sintetico</xJust></detEvento></infEvento></evento>'
+        f'<retEvento versao="1.00"><infEvento><tpAmb>1</tpAmb><cOrgao>35</cOrgao><cStat>{cstat}</cStat>'
+        f'<xMotivo>Evento registrado e vinculado a NF-e</xMotivo><chNFe>{chave}</chNFe>'
+        f'<tpEvento>110111</tpEvento><nSeqEvento>1</nSeqEvento></infEvento></retEvento></procEventoNFe>'
+    ).encode()
+
+
+def iterar_corpus(perfil: PerfilCorpus):
+    """Gera (nome_do_arquivo, conteúdo) para cada documento do perfil, em ordem determinística."""
+    aleatorio = random.Random(perfil.semente)
+    for numero in range(1, perfil.arquivos + 1):
+        nome = f"lote_{numero // 1000:03d}/nfe_{numero:07d}.xml"
+        sorteio = aleatorio.random()
+        if sorteio < perfil.proporcao_corrompidos:
+            # Documento truncado no meio (como um download interrompido)
+            conteudo = gerar_nfe(aleatorio, numero, perfil.itens_min)
+            yield nome, conteudo[: len(conteudo) // 2]
+            continue
+
+        cstat = None if sorteio < perfil.proporcao_corrompidos + perfil.proporcao_sem_protocolo else _escolher(aleatorio, perfil.cstat)
+        itens = aleatorio.randint(perfil.itens_min, perfil.itens_max)
+        conteudo = gerar_nfe(aleatorio, numero, itens, cstat, _escolher(aleatorio, perfil.tpemis))
+        yield nome, conteudo
+
+        # Sorteio só com a proporção ligada: os perfis sem cancelamentos geram o mesmo ZIP de antes
+        if perfil.proporcao_canceladas and cstat in ("100", "150") and aleatorio.random() < perfil.proporcao_canceladas:
+            chave = conteudo.split(b'Id="NFe', 1)[1][:44].decode()
+            yield nome.replace(".xml", "-procEventoNFe.xml"), gerar_evento_cancelamento(chave)
+
+
+def gerar_corpus_zip(perfil: PerfilCorpus, destino=None):
+    """
+    Grava o corpus do perfil num ZIP (DEFLATED, como os enviados pelos usuários).
+
+    Args:
+        perfil (PerfilCorpus): Descrição do corpus.
+        destino: Caminho ou arquivo binário. Se omitido, devolve os bytes do ZIP.
+    """
+    saida = io.BytesIO() if destino is None else destino
+    with zipfile.ZipFile(saida, "w", zipfile.ZIP_DEFLATED) as zip_out:
+        for nome, conteudo in iterar_corpus(perfil):
+            # Data fixa: o ZIP sai idêntico byte a byte a cada execução
+            zip_out.writestr(zipfile.ZipInfo(nome, date_time=DATA_ARQUIVOS), conteudo, zipfile.ZIP_DEFLATED)
+    return saida.getvalue() if destino is None else destino
@@ -0,0 +1,320 @@
+"""
+Benchmark reproduzível do processamento de ZIPs.
+
+Gera um corpus sintético (ver 'corpus.py'), mede 'processar_zip_sync' e o endpoint
+'/processar-zip/' (chamado em processo, direto pelo ASGI, sem servidor nem rede) e
+grava os resultados num JSON comparável entre versões.
+
+Uso (a partir da pasta backend/):
+    python -m benchmarks.executar --perfil medio
+    python -m benchmarks.executar --perfil medio --comparar benchmarks/resultados/base.json
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import asyncio
+import argparse
+import platform
+import tempfile
+import subprocess
+import multiprocessing
+from datetime import datetime, timezone
+
+# Permite importar os módulos do backend (processamento, main) a partir da pasta benchmarks/
+DIRETORIO_BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, DIRETORIO_BACKEND)
+
+from benchmarks.corpus import PerfilCorpus, gerar_corpus_zip
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+# Versão do formato do JSON de resultados (incrementar se os campos mudarem)
+VERSAO_FORMATO = 1
+
+PERFIS = {
+    "pequeno": PerfilCorpus(arquivos=200, itens_max=10),
+    "medio": PerfilCorpus(arquivos=5000, itens_max=30),
+    "grande": PerfilCorpus(arquivos=50000, itens_max=100),
+}
+
+CENARIOS = ("biblioteca", "endpoint")
+
+
+# -------------------------------------------------------------------
+# MEDIÇÃO
+# -------------------------------------------------------------------
+def pico_rss_mb() -> float | None:
+    """Pico de memória residente do processo atual (os workers do pool não entram na conta)."""
+    if resource is None:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux informa em KB, macOS em bytes
+    return round(pico / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def percentil(valores: list[float], p: float) -> float:
+    """Percentil pelo método nearest-rank (estável com poucas amostras)."""
+    ordenados = sorted(valores)
+    indice = max(0, min(len(ordenados) - 1, -(-len(ordenados) * p // 100) - 1))
+    return ordenados[int(indice)]
+
+
+def _executar_biblioteca(caminho_zip: str, usar_cache: bool) -> None:
+    from processamento import OpcoesProcessamento, processar_zip_sync
+
+    with tempfile.TemporaryFile() as destino:
+        processar_zip_sync(caminho_zip, OpcoesProcessamento(destino=destino, usar_cache=usar_cache))
+
+
+async def chamar_endpoint(app, corpo: bytes, content_type: str, caminho: str, query: str = "") -> tuple[int, int]:
+    """
+    Faz um POST direto na aplicação ASGI (sem servidor HTTP) e devolve (status, bytes recebidos).
+    O corpo é entregue em pedaços de 64 KB, como chegaria pela rede.
+    """
+    pedacos = [corpo[i:i + 65536] for i in range(0, len(corpo), 65536)] or [b""]
+    resposta = {"status": None, "bytes": 0}
+
+    async def receive():
+        if pedacos:
+            pedaco = pedacos.pop(0)
+            return {"type": "http.request", "body": pedaco, "more_body": bool(pedacos)}
+        # Cliente nunca desconecta: fica esperando até a resposta terminar
+        await asyncio.Future()
+
+    async def send(mensagem):
+        if mensagem["type"] == "http.response.start":
+            resposta["status"] = mensagem["status"]
+        elif mensagem["type"] == "http.response.body":
+            resposta["bytes"] += len(mensagem.get("body", b""))
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0", "spec_version": "2.4"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": caminho,
+        "raw_path": caminho.encode(),
+        "query_string": query.encode(),
+        "root_path": "",
+        "headers": [(b"content-type", content_type.encode()), (b"content-length", str(len(corpo)).encode())],
+        "client": ("127.0.0.1", 50000),
+        "server": ("127.0.0.1", 8000),
+    }
+    await app(scope, receive, send)
+    return resposta["status"], resposta["bytes"]
+
+
+def montar_multipart_zip(conteudo_zip: bytes, campo: str = "arquivo") -> tuple[bytes, str]:
+    boundary = f"monxml-bench-{uuid.uuid4().hex}"
+    corpo = (
+        f'--{boundary}\r\nContent-Disposition: form-data; name="{campo}"; filename="corpus.zip"\r\n'
+        f"Content-Type: application/zip\r\n\r\n"
+    ).encode() + conteudo_zip + f"\r\n--{boundary}--\r\n".encode()
+    return corpo, f"multipart/form-data; boundary={boundary}"
+
+
+def _executar_endpoint(corpo: bytes, content_type: str, usar_cache: bool) -> None:
+    from main import app
+
+    status, _ = asyncio.run(
+        chamar_endpoint(app, corpo, content_type, "/processar-zip/", f"usar_cache={str(usar_cache).lower()}")
+    )
+    if status != 200:
+        raise RuntimeError(f"/processar-zip/ respondeu {status}")
+
+
+def medir_cenario(cenario: str, caminho_zip: str, repeticoes: int, usar_cache: bool) -> dict:
+    """Roda um cenário (1 aquecimento + 'repeticoes' medidas) e devolve latências e pico de RSS."""
+    if cenario == "biblioteca":
+        executar = lambda: _executar_biblioteca(caminho_zip, usar_cache)
+    else:
+        with open(caminho_zip, "rb") as arquivo:
+            corpo, content_type = montar_multipart_zip(arquivo.read())
+        executar = lambda: _executar_endpoint(corpo, content_type, usar_cache)
+
+    # Aquecimento: imports, criação do pool de processos, caches do SO
+    executar()
+
+    latencias = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        executar()
+        latencias.append(time.perf_counter() - inicio)
+
+    return {"latencias_s": [round(valor, 6) for valor in latencias], "pico_rss_mb": pico_rss_mb()}
+
+
+def _medir_em_subprocesso(fila, *args) -> None:
+    try:
+        fila.put(medir_cenario(*args))
+    except Exception as erro:
+        fila.put({"erro": repr(erro)})
+
+
+def medir_isolado(*args) -> dict:
+    """
+    Roda 'medir_cenario' num processo novo: o pico de RSS de um cenário não
+    contamina o outro e nenhum estado (cache, pool) sobra da medição anterior.
+    """
+    contexto = multiprocessing.get_context("spawn")
+    fila = contexto.Queue()
+    processo = contexto.Process(target=_medir_em_subprocesso, args=(fila, *args))
+    processo.start()
+    resultado = fila.get()
+    processo.join()
+    if "erro" in resultado:
+        raise RuntimeError(resultado["erro"])
+    return resultado
+
+
+def resumir(medicao: dict, arquivos: int, bytes_xml: int) -> dict:
+    latencias = medicao["latencias_s"]
+    mediana = percentil(latencias, 50)
+    return {
+        **medicao,
+        "repeticoes": len(latencias),
+        "p50_s": mediana,
+        "p99_s": percentil(latencias, 99),
+        "arquivos_por_s": round(arquivos / mediana, 1),
+        # MB de XML descompactado (o volume que o motor de extração realmente analisa)
+        "mb_por_s": round(bytes_xml / (1024 * 1024) / mediana, 2),
+    }
+
+
+# -------------------------------------------------------------------
+# RESULTADOS
+# -------------------------------------------------------------------
+def _commit_atual() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=DIRETORIO_BACKEND,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def descrever_ambiente() -> dict:
+    return {
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "cpus": os.cpu_count(),
+        "commit": _commit_atual(),
+        # Configuração que afeta o desempenho
+        "variaveis": {chave: valor for chave, valor in os.environ.items() if chave.startswith("MONXML_")},
+    }
+
+
+def comparar(atual: dict, base: dict, tolerancia: float) -> list[str]:
+    """
+    Compara dois resultados e devolve as regressões acima da tolerância (ex: 0.10 = 10%).
+    """
+    regressoes = []
+    if atual["corpus"] != base["corpus"]:
+        print("Aviso: os corpora são diferentes, a comparação não é direta.")
+
+    for cenario, medidas in atual["cenarios"].items():
+        anterior = base["cenarios"].get(cenario)
+        if anterior is None:
+            continue
+        # (métrica, maior_e_melhor)
+        for metrica, maior_e_melhor in (("arquivos_por_s", True), ("p99_s", False), ("pico_rss_mb", False)):
+            novo, velho = medidas.get(metrica), anterior.get(metrica)
+            if not novo or not velho:
+                continue
+            variacao = (novo - velho) / velho
+            piorou = -variacao if maior_e_melhor else variacao
+            marca = "REGRESSÃO" if piorou > tolerancia else "ok"
+            print(f"  {cenario:<11} {metrica:<15} {velho:>12} -> {novo:>12} ({variacao:+.1%}) {marca}")
+            if piorou > tolerancia:
+                regressoes.append(f"{cenario}.{metrica} {variacao:+.1%}")
+    return regressoes
+
+
+def executar_benchmark(perfil: PerfilCorpus, cenarios=CENARIOS, repeticoes: int = 5, usar_cache: bool = False, isolar: bool = True) -> dict:
+    """Gera o corpus do perfil, mede os cenários e devolve o resultado no formato do JSON."""
+    import zipfile
+
+    with tempfile.TemporaryDirectory() as diretorio:
+        caminho_zip = os.path.join(diretorio, "corpus.zip")
+        gerar_corpus_zip(perfil, caminho_zip)
+        with zipfile.ZipFile(caminho_zip) as zip_in:
+            bytes_xml = sum(info.file_size for info in zip_in.infolist())
+
+        resultado = {
+            "versao_formato": VERSAO_FORMATO,
+            "data": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "ambiente": descrever_ambiente(),
+            "corpus": {**perfil.como_dict(), "bytes_zip": os.path.getsize(caminho_zip), "bytes_xml": bytes_xml},
+            "usar_cache": usar_cache,
+            "cenarios": {},
+        }
+
+        medir = medir_isolado if isolar else medir_cenario
+        for cenario in cenarios:
+            medicao = medir(cenario, caminho_zip, repeticoes, usar_cache)
+            resultado["cenarios"][cenario] = resumir(medicao, perfil.arquivos, bytes_xml)
+
+    return resultado
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--perfil", choices=PERFIS, default="pequeno")
+    parser.add_argument("--arquivos", type=int, help="Sobrescreve a quantidade de XMLs do perfil")
+    parser.add_argument("--itens-min", type=int)
+    parser.add_argument("--itens-max", type=int)
+    parser.add_argument("--corrompidos", type=float, help="Proporção de XMLs truncados (0 a 1)")
+    parser.add_argument("--sem-protocolo", type=float, help="Proporção de NFe sem protNFe (0 a 1)")
+    parser.add_argument("--semente", type=int)
+    parser.add_argument("--cenarios", nargs="+", choices=CENARIOS, default=list(CENARIOS))
+    parser.add_argument("--repeticoes", type=int, default=5)
+    parser.add_argument("--com-cache", action="store_true", help="Mede com o cache de classificação ligado")
+    parser.add_argument("--saida", help="Arquivo JSON de saída (padrão: benchmarks/resultados/<data>.json)")
+    parser.add_argument("--comparar", help="JSON de uma execução anterior para detectar regressões")
+    parser.add_argument("--tolerancia", type=float, default=0.10)
+    args = parser.parse_args(argv)
+
+    perfil = PerfilCorpus(**PERFIS[args.perfil].como_dict())
+    for campo, valor in (
+        ("arquivos", args.arquivos), ("itens_min", args.itens_min), ("itens_max", args.itens_max),
+        ("proporcao_corrompidos", args.corrompidos), ("proporcao_sem_protocolo", args.sem_protocolo),
+        ("semente", args.semente),
+    ):
+        if valor is not None:
+            setattr(perfil, campo, valor)
+
+    resultado = executar_benchmark(perfil, args.cenarios, args.repeticoes, usar_cache=args.com_cache)
+
+    for cenario, medidas in resultado["cenarios"].items():
+        print(
+            f"{cenario:<11} {medidas['arquivos_por_s']:>10} arquivos/s  {medidas['mb_por_s']:>8} MB/s  "
+            f"p50 {medidas['p50_s']:.3f}s  p99 {medidas['p99_s']:.3f}s  pico RSS {medidas['pico_rss_mb']} MB"
+        )
+
+    saida = args.saida or os.path.join(
+        DIRETORIO_BACKEND, "benchmarks", "resultados", f"{datetime.now():%Y%m%d-%H%M%S}-{args.perfil}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(saida)), exist_ok=True)
+    with open(saida, "w", encoding="utf-8") as arquivo:
+        json.dump(resultado, arquivo, ensure_ascii=False, indent=2)
+    print(f"Resultados gravados em {saida}")
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as arquivo:
+            regressoes = comparar(resultado, json.load(arquivo), args.tolerancia)
+        if regressoes:
+            print("Regressões: " + ", ".join(regressoes))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,199 @@
+import os
+import json
+import sqlite3
+import hashlib
+import threading
+import zipfile
+from collections import OrderedDict
+
+from extracao import DadosNFe
+
+
+# -------------------------------------------------------------------
+# CONFIGURAÇÃO DO CACHE (variáveis de ambiente)
+# -------------------------------------------------------------------
+# Máximo de documentos no cache em memória (LRU). 0 desativa o cache.
+CACHE_ENTRADAS = int(os.environ.get("MONXML_CACHE_ENTRADAS", "100000"))
+# Caminho do arquivo SQLite do nível em disco (vazio = sem nível em disco)
+CACHE_DISCO = os.environ.get("MONXML_CACHE_DISCO", "")
+# Máximo de documentos no nível em disco
+CACHE_DISCO_ENTRADAS = int(os.environ.get("MONXML_CACHE_DISCO_ENTRADAS", "5000000"))
+# Inclui um hash do conteúdo na chave (evita falsos positivos de CRC32, mas exige descompactar)
+CACHE_HASH_CONTEUDO = os.environ.get("MONXML_CACHE_HASH_CONTEUDO", "0") == "1"
+
+# Gravações em disco são agrupadas em transações deste tamanho
+LOTE_GRAVACAO_DISCO = 500
+
+# Versão do formato gravado em disco. Deve ser incrementada sempre que DadosNFe
+# ou as regras do motor de extração mudarem, para invalidar o que já estava salvo.
+VERSAO_CACHE = 2
+
+
+def chave_cache(info: zipfile.ZipInfo, conteudo: bytes | None = None) -> tuple:
+    """
+    Monta a chave de um membro a partir do diretório central do ZIP: (CRC32, tamanho).
+
+    Com 'conteudo', acrescenta um hash BLAKE2b do XML descompactado, eliminando a chance
+    (pequena, mas real em milhões de documentos) de dois XMLs diferentes colidirem.
+    """
+    if conteudo is None:
+        return (info.CRC, info.file_size)
+    return (info.CRC, info.file_size, hashlib.blake2b(conteudo, digest_size=16).hexdigest())
+
+
+class CacheClassificacao:
+    """
+    Cache LRU (em memória) dos resultados do motor de extração, com nível opcional em disco.
+
+    Um acerto dispensa a descompactação e o parsing do XML: o resultado vem direto do cache.
+    Thread-safe: várias requisições podem consultá-lo ao mesmo tempo.
+    """
+
+    def __init__(
+        self,
+        limite: int = CACHE_ENTRADAS,
+        caminho_disco: str = CACHE_DISCO,
+        limite_disco: int = CACHE_DISCO_ENTRADAS,
+        hash_conteudo: bool = CACHE_HASH_CONTEUDO,
+    ):
+        self.limite = limite
+        self.limite_disco = limite_disco
+        # Se True, as chaves incluem o hash do XML descompactado (ver 'chave_cache')
+        self.hash_conteudo = hash_conteudo
+        self._memoria: OrderedDict[tuple, DadosNFe] = OrderedDict()
+        self._lock = threading.Lock()
+
+        # Contadores expostos em /cache/
+        self.acertos = 0
+        self.acertos_disco = 0
+        self.falhas = 0
+        self.remocoes = 0
+
+        self._disco = None
+        self._pendentes_disco: list[tuple[str, str]] = []
+        self._gravados_disco = 0
+        if caminho_disco and limite > 0:
+            self._disco = self._abrir_disco(caminho_disco)
+
+    @property
+    def ativo(self) -> bool:
+        return self.limite > 0
+
+    # --- Nível em disco (SQLite) ---
+    def _abrir_disco(self, caminho: str) -> sqlite3.Connection:
+        conexao = sqlite3.connect(caminho, check_same_thread=False, isolation_level=None)
+        conexao.execute("PRAGMA journal_mode=WAL")
+        conexao.execute("CREATE TABLE IF NOT EXISTS meta (versao INTEGER)")
+        versao = conexao.execute("SELECT versao FROM meta").fetchone()
+        if versao is None or versao[0] != VERSAO_CACHE:
+            # Formato antigo: descartamos tudo em vez de arriscar um resultado incompatível
+            conexao.execute("DROP TABLE IF EXISTS classificacao")
+            conexao.execute("DELETE FROM meta")
+            conexao.execute("INSERT INTO meta (versao) VALUES (?)", (VERSAO_CACHE,))
+        conexao.execute("CREATE TABLE IF NOT EXISTS classificacao (chave TEXT PRIMARY KEY, dados TEXT NOT NULL)")
+        return conexao
+
+    def _chave_disco(self, chave: tuple) -> str:
+        return ":".join(str(parte) for parte in chave)
+
+    def _ler_disco(self, chave: tuple) -> DadosNFe | None:
+        linha = self._disco.execute(
+            "SELECT dados FROM classificacao WHERE chave = ?", (self._chave_disco(chave),)
+        ).fetchone()
+        return DadosNFe(*json.loads(linha[0])) if linha else None
+
+    def _gravar_disco(self, chave: tuple, dados: DadosNFe) -> None:
+        self._pendentes_disco.append((self._chave_disco(chave), json.dumps(dados, ensure_ascii=False)))
+        if len(self._pendentes_disco) >= LOTE_GRAVACAO_DISCO:
+            self._descarregar_disco()
+
+    def _descarregar_disco(self) -> None:
+        if not self._pendentes_disco:
+            return
+        # Uma transação por lote: um único fsync em vez de um por documento
+        with self._disco:
+            self._disco.execute("BEGIN")
+            self._disco.executemany(
+                "INSERT OR REPLACE INTO classificacao (chave, dados) VALUES (?, ?)", self._pendentes_disco
+            )
+        self._gravados_disco += len(self._pendentes_disco)
+        self._pendentes_disco.clear()
+
+        # Poda em blocos de 10% (os mais antigos pelo rowid) para não contar a tabela a cada lote
+        if self.limite_disco and self._gravados_disco >= self.limite_disco // 10:
+            self._gravados_disco = 0
+            total = self._disco.execute("SELECT COUNT(*) FROM classificacao").fetchone()[0]
+            if total > self.limite_disco:
+                excesso = total - int(self.limite_disco * 0.9)
+                self._disco.execute(
+                    "DELETE FROM classificacao WHERE rowid IN (SELECT rowid FROM classificacao ORDER BY rowid LIMIT ?)",
+                    (excesso,),
+                )
+                self.remocoes += excesso
+
+    # --- API pública ---
+    def obter(self, chave: tuple) -> DadosNFe | None:
+        """Devolve o resultado guardado para a chave, ou None (falha)."""
+        with self._lock:
+            dados = self._memoria.get(chave)
+            if dados is not None:
+                self._memoria.move_to_end(chave)
+                self.acertos += 1
+                return dados
+
+            if self._disco is not None:
+                dados = self._ler_disco(chave)
+                if dados is not None:
+                    self.acertos += 1
+                    self.acertos_disco += 1
+                    self._guardar_memoria(chave, dados)
+                    return dados
+
+            self.falhas += 1
+            return None
+
+    def guardar(self, chave: tuple, dados: DadosNFe) -> None:
+        """Guarda o resultado de um documento (XMLs corrompidos não são guardados)."""
+        with self._lock:
+            self._guardar_memoria(chave, dados)
+            if self._disco is not None:
+                self._gravar_disco(chave, dados)
+
+    def _guardar_memoria(self, chave: tuple, dados: DadosNFe) -> None:
+        self._memoria[chave] = dados
+        self._memoria.move_to_end(chave)
+        while len(self._memoria) > self.limite:
+            self._memoria.popitem(last=False)
+            self.remocoes += 1
+
+    def descarregar(self) -> None:
+        """Grava no disco o que ainda está pendente (chamado ao fim de cada lote)."""
+        with self._lock:
+            if self._disco is not None:
+                self._descarregar_disco()
+
+    def limpar(self) -> None:
+        with self._lock:
+            self._memoria.clear()
+            if self._disco is not None:
+                self._pendentes_disco.clear()
+                self._disco.execute("DELETE FROM classificacao")
+
+    def estatisticas(self) -> dict:
+        with self._lock:
+            consultas = self.acertos + self.falhas
+            return {
+                "entradas": len(self._memoria),
+                "limite": self.limite,
+                "disco": self._disco is not None,
+                "hash_conteudo": self.hash_conteudo,
+                "acertos": self.acertos,
+                "acertos_disco": self.acertos_disco,
+                "falhas": self.falhas,
+                "remocoes": self.remocoes,
+                "taxa_acerto": round(self.acertos / consultas, 4) if consultas else 0.0,
+            }
+
+
+# Instância única do processo, compartilhada por todas as requisições
+cache_global = CacheClassificacao()
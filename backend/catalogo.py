@@ -0,0 +1,286 @@
+import os
+import time
+import queue
+import sqlite3
+import threading
+
+from colunar import ColunasItens
+from agregacao import ColunasCabecalhos
+
+
+# -------------------------------------------------------------------
+# CONFIGURAÇÃO DO CATÁLOGO (variáveis de ambiente)
+# -------------------------------------------------------------------
+# Caminho do arquivo SQLite do catálogo de produtos (vazio = catálogo desligado)
+CATALOGO_DISCO = os.environ.get("MONXML_CATALOGO", "")
+# Lotes processados aguardando indexação. Com a fila cheia, o próximo lote espera
+# (a memória dos itens pendentes fica limitada).
+CATALOGO_FILA = int(os.environ.get("MONXML_CATALOGO_FILA", "8"))
+
+# Itens gravados por transação (um único commit/fsync por bloco)
+LOTE_INDEXACAO = 20000
+# Máximo de resultados por página da busca
+LIMITE_BUSCA = 500
+
+# Versão do esquema gravado em disco. Incrementar quando as tabelas mudarem.
+VERSAO_CATALOGO = 2
+
+_COLUNAS = (
+    "identificador", "chave", "n_item", "cprod", "xprod", "ncm", "cfop", "ucom", "qcom", "vuncom",
+    "vprod_centavos", "emitente", "data_emissao", "arquivo", "categoria",
+)
+
+
+def _termos_fts(texto: str) -> str:
+    """
+    'parafuso inox 3/8' -> '"parafuso"* "inox"* "3/8"*': todas as palavras, cada uma como prefixo.
+    As aspas impedem que o texto do usuário seja interpretado como sintaxe do FTS5.
+    """
+    return " ".join('"' + palavra.replace('"', '""') + '"*' for palavra in texto.split())
+
+
+def _intervalo_prefixo(prefixo: str) -> tuple[str, str]:
+    # 'LIKE prefixo%' sem perder o índice B-tree: coluna >= '2202' AND coluna < '2203'
+    return prefixo, prefixo[:-1] + chr(ord(prefixo[-1]) + 1)
+
+
+class CatalogoProdutos:
+    """
+    Catálogo persistente (SQLite) dos itens vistos no processamento, para a tela de busca de produtos.
+
+    - Tabela 'itens' com índices B-tree em NCM, CFOP, cProd e emitente (filtros e prefixos).
+    - Tabela FTS5 'itens_fts' (xProd e cProd, sem acento e com índice de prefixo) para o texto livre.
+
+    A indexação NÃO acontece na requisição: o processamento entrega as colunas do lote
+    ('enfileirar') e uma thread grava tudo em transações grandes. Um item já catalogado
+    (mesma chave de acesso + nItem) não é duplicado quando o lote é reenviado. Documentos sem
+    chave de acesso são identificados por emitente + data de emissão + nome do arquivo: no
+    SQLite, NULLs numa restrição UNIQUE são todos distintos e nunca deduplicariam.
+    """
+
+    def __init__(self, caminho: str = CATALOGO_DISCO, tamanho_fila: int = CATALOGO_FILA):
+        self.caminho = caminho
+        self._fila: queue.Queue = queue.Queue(maxsize=max(tamanho_fila, 1))
+        self._thread = None
+        self._lock = threading.Lock()
+        self._leitura = threading.local()
+
+        # Contadores expostos em /produtos/estatisticas e /metrics
+        self.itens_indexados = 0
+        self.lotes_indexados = 0
+        self.erros = 0
+        self.segundos_indexacao = 0.0
+
+        self._escrita = self._abrir(caminho) if caminho else None
+
+    @property
+    def ativo(self) -> bool:
+        return self._escrita is not None
+
+    @property
+    def lotes_pendentes(self) -> int:
+        return self._fila.qsize()
+
+    # --- Banco ---
+    def _abrir(self, caminho: str) -> sqlite3.Connection:
+        conexao = sqlite3.connect(caminho, check_same_thread=False, isolation_level=None)
+        conexao.execute("PRAGMA journal_mode=WAL")
+        # Com WAL, NORMAL só perde as últimas transações numa queda de energia (nunca corrompe)
+        conexao.execute("PRAGMA synchronous=NORMAL")
+        conexao.execute("CREATE TABLE IF NOT EXISTS meta (versao INTEGER)")
+        versao = conexao.execute("SELECT versao FROM meta").fetchone()
+        if versao is None or versao[0] != VERSAO_CATALOGO:
+            # Esquema antigo: o catálogo é reconstruído a partir dos próximos lotes
+            conexao.execute("DROP TABLE IF EXISTS itens_fts")
+            conexao.execute("DROP TABLE IF EXISTS itens")
+            conexao.execute("DELETE FROM meta")
+            conexao.execute("INSERT INTO meta (versao) VALUES (?)", (VERSAO_CATALOGO,))
+        conexao.executescript("""
+            CREATE TABLE IF NOT EXISTS itens (
+                id INTEGER PRIMARY KEY,
+                identificador TEXT NOT NULL,
+                chave TEXT,
+                n_item INTEGER,
+                cprod TEXT,
+                xprod TEXT,
+                ncm TEXT,
+                cfop TEXT,
+                ucom TEXT,
+                qcom REAL,
+                vuncom REAL,
+                vprod_centavos INTEGER,
+                emitente TEXT,
+                data_emissao INTEGER,
+                arquivo TEXT,
+                categoria TEXT,
+                UNIQUE (identificador, n_item)
+            );
+            CREATE INDEX IF NOT EXISTS itens_ncm ON itens (ncm);
+            CREATE INDEX IF NOT EXISTS itens_cfop ON itens (cfop);
+            CREATE INDEX IF NOT EXISTS itens_cprod ON itens (cprod);
+            CREATE INDEX IF NOT EXISTS itens_emitente ON itens (emitente);
+            CREATE VIRTUAL TABLE IF NOT EXISTS itens_fts USING fts5(
+                xprod, cprod, content='itens', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+            );
+        """)
+        return conexao
+
+    def _conexao_leitura(self) -> sqlite3.Connection:
+        # Uma conexão por thread: as buscas rodam em paralelo com a indexação (WAL)
+        conexao = getattr(self._leitura, "conexao", None)
+        if conexao is None:
+            conexao = self._leitura.conexao = sqlite3.connect(self.caminho, check_same_thread=False)
+        return conexao
+
+    # --- Indexação ---
+    def enfileirar(self, itens: ColunasItens, cabecalhos: ColunasCabecalhos) -> None:
+        """
+        Entrega as colunas de um lote para a thread de indexação e volta na hora.
+        'itens.documentos' e 'cabecalhos' devem ter uma linha por documento, na mesma ordem.
+        """
+        if not self.ativo or not len(itens):
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._indexar_fila, name="monxml-catalogo", daemon=True)
+                self._thread.start()
+        self._fila.put((itens, cabecalhos))
+
+    def aguardar(self) -> None:
+        """Bloqueia até a fila de indexação esvaziar."""
+        self._fila.join()
+
+    def _indexar_fila(self) -> None:
+        while True:
+            itens, cabecalhos = self._fila.get()
+            try:
+                self.indexar(itens, cabecalhos)
+            except sqlite3.Error as erro:
+                # Falhar a indexação não pode derrubar o processamento (o lote já foi entregue)
+                self.erros += 1
+                print(f"Erro ao indexar itens no catálogo: {erro}")
+            finally:
+                self._fila.task_done()
+
+    def _linhas(self, itens: ColunasItens, cabecalhos: ColunasCabecalhos):
+        # Colunas -> tuplas na ordem de _COLUNAS; os campos do documento são repetidos em cada item
+        documentos = itens.documentos.colunas
+        campos_documento = {
+            "chave": [chave or None for chave in documentos["chave"].como_lista()],
+            "emitente": cabecalhos.tabela.colunas["cnpj_emitente"].como_lista(),
+            "data_emissao": cabecalhos.tabela.colunas["data_emissao"].como_lista(),
+            "arquivo": documentos["arquivo"].como_lista(),
+            "categoria": documentos["categoria"].como_lista(),
+        }
+        # Chave da deduplicação (nunca NULL): a chave de acesso ou, sem ela, emitente|data|arquivo
+        campos_documento["identificador"] = [
+            chave or f"{emitente}|{data}|{arquivo}"
+            for chave, emitente, data, arquivo in zip(
+                campos_documento["chave"], campos_documento["emitente"],
+                campos_documento["data_emissao"], campos_documento["arquivo"],
+            )
+        ]
+        colunas = itens.itens.colunas
+        indices = colunas["documento"].valores
+        return zip(*(
+            [campos_documento[nome][d] for d in indices] if nome in campos_documento else colunas[nome].como_lista()
+            for nome in _COLUNAS
+        ))
+
+    def indexar(self, itens: ColunasItens, cabecalhos: ColunasCabecalhos) -> int:
+        """Grava os itens de um lote no catálogo (síncrono). Devolve quantos itens eram novos."""
+        inicio = time.perf_counter()
+        linhas = list(self._linhas(itens, cabecalhos))
+        sql = f"INSERT OR IGNORE INTO itens ({', '.join(_COLUNAS)}) VALUES ({', '.join('?' * len(_COLUNAS))})"
+        novos = 0
+        conexao = self._escrita
+        for i in range(0, len(linhas), LOTE_INDEXACAO):
+            with conexao:
+                conexao.execute("BEGIN")
+                (ultimo_id,) = conexao.execute("SELECT coalesce(max(id), 0) FROM itens").fetchone()
+                conexao.executemany(sql, linhas[i:i + LOTE_INDEXACAO])
+                # O índice de texto recebe só as linhas novas (duplicatas ignoradas não ganham id)
+                cursor = conexao.execute(
+                    "INSERT INTO itens_fts (rowid, xprod, cprod) SELECT id, xprod, cprod FROM itens WHERE id > ?",
+                    (ultimo_id,),
+                )
+                novos += cursor.rowcount
+        self.itens_indexados += novos
+        self.lotes_indexados += 1
+        self.segundos_indexacao += time.perf_counter() - inicio
+        return novos
+
+    # --- Consulta ---
+    def buscar(
+        self,
+        texto: str | None = None,
+        ncm: str | None = None,
+        cfop: str | None = None,
+        cprod: str | None = None,
+        emitente: str | None = None,
+        limite: int = 50,
+        deslocamento: int = 0,
+    ) -> dict:
+        """
+        Busca itens por texto livre (xProd/cProd, prefixo de cada palavra, sem acento)
+        e/ou filtros. NCM e cProd aceitam prefixo; CFOP e emitente são exatos.
+
+        Com texto, os resultados vêm por relevância (bm25); sem texto, os mais recentes primeiro.
+        """
+        limite = max(1, min(limite, LIMITE_BUSCA))
+        condicoes, parametros = [], []
+        for coluna, prefixo in (("ncm", ncm), ("cprod", cprod)):
+            if prefixo:
+                condicoes.append(f"i.{coluna} >= ? AND i.{coluna} < ?")
+                parametros.extend(_intervalo_prefixo(prefixo))
+        for coluna, valor in (("cfop", cfop), ("emitente", emitente)):
+            if valor:
+                condicoes.append(f"i.{coluna} = ?")
+                parametros.append(valor)
+
+        termos = _termos_fts(texto) if texto else ""
+        if termos:
+            sql = "SELECT i.* FROM itens_fts JOIN itens i ON i.id = itens_fts.rowid WHERE itens_fts MATCH ?"
+            parametros.insert(0, termos)
+            if condicoes:
+                sql += " AND " + " AND ".join(condicoes)
+            sql += " ORDER BY itens_fts.rank"
+        else:
+            sql = "SELECT i.* FROM itens i"
+            if condicoes:
+                sql += " WHERE " + " AND ".join(condicoes)
+            sql += " ORDER BY i.id DESC"
+        # Uma linha a mais só para saber se existe próxima página (sem COUNT sobre milhões de linhas)
+        sql += " LIMIT ? OFFSET ?"
+        parametros.extend((limite + 1, max(deslocamento, 0)))
+
+        inicio = time.perf_counter()
+        cursor = self._conexao_leitura().execute(sql, parametros)
+        nomes = [descricao[0] for descricao in cursor.description]
+        linhas = [dict(zip(nomes, linha)) for linha in cursor.fetchall()]
+        for linha in linhas:
+            del linha["id"], linha["identificador"]
+        return {
+            "itens": linhas[:limite],
+            "mais": len(linhas) > limite,
+            "tempo_ms": round((time.perf_counter() - inicio) * 1000, 2),
+        }
+
+    def estatisticas(self) -> dict:
+        total = 0
+        if self.ativo:
+            (total,) = self._conexao_leitura().execute("SELECT count(*) FROM itens").fetchone()
+        return {
+            "ativo": self.ativo,
+            "itens": total,
+            "itens_indexados": self.itens_indexados,
+            "lotes_indexados": self.lotes_indexados,
+            "lotes_pendentes": self.lotes_pendentes,
+            "erros": self.erros,
+            "segundos_indexacao": round(self.segundos_indexacao, 3),
+        }
+
+
+# Catálogo único do processo, alimentado por todas as requisições
+catalogo_global = CatalogoProdutos()
@@ -0,0 +1,395 @@
+import sys
+import json
+import struct
+from array import array
+from typing import BinaryIO
+
+
+# -------------------------------------------------------------------
+# FORMATO COLUNAR TIPADO (.mxc)
+# -------------------------------------------------------------------
+# Arquivo binário simples, pensado para milhões de linhas:
+#
+#   b"MONXMLC1"                 assinatura (8 bytes)
+#   uint32 (little-endian)      tamanho do cabeçalho JSON
+#   cabeçalho JSON (UTF-8)      tabelas -> linhas + colunas -> tipo e buffers (offset, tamanho)
+#   buffers                     dados crus de cada coluna, alinhados em 8 bytes
+#
+# Tipos de coluna (mesma notação de dtype do numpy, para leitura direta com np.frombuffer):
+#   '<u4', '<i8', '<f8'   números little-endian
+#   '|S<n>'               texto ASCII de largura fixa (completado com NUL)
+#   'utf8'                texto de tamanho variável: buffer 'offsets' ('<u8', linhas + 1) + buffer 'dados'
+#
+# As colunas são 'array' / 'bytearray' (e não listas de objetos Python): cada linha custa
+# só os bytes do valor, então a memória de um lote é previsível (≈ soma das larguras × linhas).
+
+ASSINATURA = b"MONXMLC1"
+VERSAO_FORMATO = 1
+ALINHAMENTO = 8
+
+# Tipo da coluna -> typecode do módulo 'array'
+_TYPECODES = {'<u4': 'I', '<i8': 'q', '<f8': 'd'}
+
+for _tipo, _typecode in _TYPECODES.items():
+    assert array(_typecode).itemsize == int(_tipo[2]), f"typecode '{_typecode}' sem o tamanho esperado"
+
+
+def _em_little_endian(valores: array) -> array:
+    if sys.byteorder == 'little':
+        return valores
+    copia = array(valores.typecode, valores)
+    copia.byteswap()
+    return copia
+
+
+class ColunaNumerica:
+    __slots__ = ("tipo", "valores")
+
+    def __init__(self, tipo: str):
+        self.tipo = tipo
+        self.valores = array(_TYPECODES[tipo])
+
+    def __len__(self):
+        return len(self.valores)
+
+    def truncar(self, linhas: int) -> None:
+        del self.valores[linhas:]
+
+    def estender(self, outra: "ColunaNumerica", deslocamento: int = 0) -> None:
+        if deslocamento:
+            self.valores.extend(valor + deslocamento for valor in outra.valores)
+        else:
+            self.valores.extend(outra.valores)
+
+    def buffers(self) -> dict:
+        return {"dados": _em_little_endian(self.valores)}
+
+    def como_lista(self) -> list:
+        return self.valores.tolist()
+
+
+class ColunaFixa:
+    """Texto ASCII de largura fixa (ex: NCM, CFOP, chave de acesso)."""
+
+    __slots__ = ("tipo", "largura", "dados")
+
+    def __init__(self, largura: int):
+        self.tipo = f"|S{largura}"
+        self.largura = largura
+        self.dados = bytearray()
+
+    def __len__(self):
+        return len(self.dados) // self.largura
+
+    def adicionar(self, texto: str | None) -> None:
+        valor = (texto or "").encode('ascii', 'replace')[:self.largura]
+        self.dados += valor.ljust(self.largura, b"\0")
+
+    def truncar(self, linhas: int) -> None:
+        del self.dados[linhas * self.largura:]
+
+    def substituir(self, valores: dict[int, str | None]) -> None:
+        """Troca o texto das linhas indicadas (linha -> texto), no próprio buffer."""
+        largura = self.largura
+        for linha, texto in valores.items():
+            valor = (texto or "").encode('ascii', 'replace')[:largura]
+            self.dados[linha * largura:(linha + 1) * largura] = valor.ljust(largura, b"\0")
+
+    def estender(self, outra: "ColunaFixa", deslocamento: int = 0) -> None:
+        self.dados += outra.dados
+
+    def buffers(self) -> dict:
+        return {"dados": self.dados}
+
+    def como_lista(self) -> list[str]:
+        dados, largura = self.dados, self.largura
+        return [dados[i:i + largura].rstrip(b"\0").decode('ascii') for i in range(0, len(dados), largura)]
+
+
+class ColunaTexto:
+    """Texto UTF-8 de tamanho variável: offsets + bytes concatenados (layout do Arrow)."""
+
+    __slots__ = ("tipo", "offsets", "dados")
+
+    def __init__(self):
+        self.tipo = "utf8"
+        self.offsets = array('Q', [0])
+        self.dados = bytearray()
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def adicionar(self, texto: str | None) -> None:
+        if texto:
+            self.dados += texto.encode('utf-8')
+        self.offsets.append(len(self.dados))
+
+    def truncar(self, linhas: int) -> None:
+        del self.dados[self.offsets[linhas]:]
+        del self.offsets[linhas + 1:]
+
+    def substituir(self, valores: dict[int, str | None]) -> None:
+        """Troca o texto das linhas indicadas (linha -> texto), remontando os buffers uma única vez."""
+        textos = self.como_lista()
+        for linha, texto in valores.items():
+            textos[linha] = texto
+        self.offsets = array('Q', [0])
+        self.dados = bytearray()
+        for texto in textos:
+            self.adicionar(texto)
+
+    def estender(self, outra: "ColunaTexto", deslocamento: int = 0) -> None:
+        base = len(self.dados)
+        self.dados += outra.dados
+        self.offsets.extend(base + offset for offset in outra.offsets[1:])
+
+    def buffers(self) -> dict:
+        return {"offsets": _em_little_endian(self.offsets), "dados": self.dados}
+
+    def como_lista(self) -> list[str]:
+        dados, offsets = self.dados, self.offsets
+        return [dados[offsets[i]:offsets[i + 1]].decode('utf-8') for i in range(len(offsets) - 1)]
+
+
+def criar_coluna(tipo: str):
+    if tipo in _TYPECODES:
+        return ColunaNumerica(tipo)
+    if tipo == "utf8":
+        return ColunaTexto()
+    if tipo.startswith("|S"):
+        return ColunaFixa(int(tipo[2:]))
+    raise ValueError(f"Tipo de coluna desconhecido: {tipo!r}")
+
+
+class TabelaColunar:
+    """Conjunto de colunas com o mesmo número de linhas."""
+
+    def __init__(self, esquema: list[tuple[str, str]]):
+        self.esquema = esquema
+        self.colunas = {nome: criar_coluna(tipo) for nome, tipo in esquema}
+
+    def __len__(self):
+        primeira = next(iter(self.colunas.values()))
+        return len(primeira)
+
+    def truncar(self, linhas: int) -> None:
+        for coluna in self.colunas.values():
+            coluna.truncar(linhas)
+
+    def estender(self, outra: "TabelaColunar", deslocamentos: dict | None = None) -> None:
+        """Acrescenta as linhas de outra tabela (somando 'deslocamentos[coluna]' a colunas de índice)."""
+        deslocamentos = deslocamentos or {}
+        for nome, coluna in self.colunas.items():
+            coluna.estender(outra.colunas[nome], deslocamentos.get(nome, 0))
+
+
+def gravar_colunar(destino: BinaryIO, tabelas: dict[str, TabelaColunar]) -> int:
+    """
+    Grava as tabelas no formato .mxc. Os buffers são escritos direto das colunas,
+    sem montar o arquivo inteiro em memória. Devolve o total de bytes gravados.
+    """
+    cabecalho = {"versao": VERSAO_FORMATO, "tabelas": {}}
+    ordem = []
+    posicao = 0
+    for nome_tabela, tabela in tabelas.items():
+        colunas = []
+        for nome, coluna in tabela.colunas.items():
+            buffers = {}
+            for papel, buffer in coluna.buffers().items():
+                tamanho = len(memoryview(buffer).cast('B'))
+                buffers[papel] = {"offset": posicao, "tamanho": tamanho}
+                ordem.append((buffer, tamanho))
+                posicao += tamanho + (-tamanho % ALINHAMENTO)
+            colunas.append({"nome": nome, "tipo": coluna.tipo, "buffers": buffers})
+        cabecalho["tabelas"][nome_tabela] = {"linhas": len(tabela), "colunas": colunas}
+
+    json_cabecalho = json.dumps(cabecalho, ensure_ascii=False).encode('utf-8')
+    inicio = len(ASSINATURA) + 4 + len(json_cabecalho)
+    preenchimento_cabecalho = -inicio % ALINHAMENTO
+
+    destino.write(ASSINATURA)
+    destino.write(struct.pack('<I', len(json_cabecalho)))
+    destino.write(json_cabecalho)
+    destino.write(b"\0" * preenchimento_cabecalho)
+    for buffer, tamanho in ordem:
+        destino.write(memoryview(buffer).cast('B'))
+        destino.write(b"\0" * (-tamanho % ALINHAMENTO))
+
+    return inicio + preenchimento_cabecalho + posicao
+
+
+def ler_colunar(origem: bytes | BinaryIO) -> dict[str, dict[str, list]]:
+    """
+    Lê um arquivo .mxc e devolve {tabela: {coluna: valores}}.
+    Números vêm como 'array', textos como listas de str.
+    """
+    dados = origem if isinstance(origem, (bytes, bytearray, memoryview)) else origem.read()
+    dados = memoryview(dados)
+    if bytes(dados[:len(ASSINATURA)]) != ASSINATURA:
+        raise ValueError("Arquivo não está no formato colunar do MonXML.")
+
+    (tamanho_cabecalho,) = struct.unpack_from('<I', dados, len(ASSINATURA))
+    inicio = len(ASSINATURA) + 4
+    cabecalho = json.loads(bytes(dados[inicio:inicio + tamanho_cabecalho]))
+    base = inicio + tamanho_cabecalho
+    base += -base % ALINHAMENTO
+
+    def buffer(descricao: dict) -> memoryview:
+        return dados[base + descricao["offset"]:base + descricao["offset"] + descricao["tamanho"]]
+
+    resultado = {}
+    for nome_tabela, tabela in cabecalho["tabelas"].items():
+        colunas = {}
+        for coluna in tabela["colunas"]:
+            tipo, buffers = coluna["tipo"], coluna["buffers"]
+            if tipo in _TYPECODES:
+                valores = array(_TYPECODES[tipo], bytes(buffer(buffers["dados"])))
+                if sys.byteorder != 'little':
+                    valores.byteswap()
+            elif tipo == "utf8":
+                offsets = array('Q', bytes(buffer(buffers["offsets"])))
+                if sys.byteorder != 'little':
+                    offsets.byteswap()
+                texto = bytes(buffer(buffers["dados"]))
+                valores = [texto[offsets[i]:offsets[i + 1]].decode('utf-8') for i in range(len(offsets) - 1)]
+            else:
+                largura = int(tipo[2:])
+                bruto = bytes(buffer(buffers["dados"]))
+                valores = [bruto[i:i + largura].rstrip(b"\0").decode('ascii') for i in range(0, len(bruto), largura)]
+            colunas[coluna["nome"]] = valores
+        resultado[nome_tabela] = colunas
+    return resultado
+
+
+# -------------------------------------------------------------------
+# ITENS DAS NOTAS (det/prod)
+# -------------------------------------------------------------------
+ESQUEMA_ITENS = [
+    ("documento", "<u4"),       # índice na tabela 'documentos'
+    ("n_item", "<u4"),
+    ("cprod", "utf8"),
+    ("xprod", "utf8"),
+    ("ncm", "|S8"),
+    ("cfop", "|S4"),
+    ("ucom", "utf8"),
+    ("qcom", "<f8"),
+    ("vuncom", "<f8"),
+    ("vprod_centavos", "<i8"),  # valor exato em centavos (sem erro de ponto flutuante)
+]
+
+ESQUEMA_DOCUMENTOS = [
+    ("chave", "|S44"),
+    ("arquivo", "utf8"),
+    ("categoria", "utf8"),
+]
+
+# Nome da entrada gravada no ZIP de saída
+NOME_ARQUIVO_ITENS = "itens.mxc"
+
+
+def _para_float(texto: str | None) -> float:
+    try:
+        return float(texto) if texto else 0.0
+    except ValueError:
+        return 0.0
+
+
+def _para_inteiro(texto: str | None) -> int:
+    try:
+        return int(texto) if texto else 0
+    except ValueError:
+        return 0
+
+
+class ColunasItens:
+    """
+    Coletor dos itens (det/prod) de um lote, alimentado pelo motor de extração.
+
+    Ciclo por documento: 'iniciar_documento' -> 'adicionar_item' (por det) ->
+    'definir_chave' -> 'concluir_documento' (ou 'descartar_documento' se o XML
+    estiver corrompido, removendo os itens já coletados dele).
+    """
+
+    def __init__(self):
+        self.itens = TabelaColunar(ESQUEMA_ITENS)
+        self.documentos = TabelaColunar(ESQUEMA_DOCUMENTOS)
+        self._inicio_documento = 0
+        self._chave = None
+        self._ligar_atalhos()
+
+    def _ligar_atalhos(self) -> None:
+        # Atalhos para o caminho quente ('adicionar_item' roda uma vez por item)
+        c = self.itens.colunas
+        self._documento = c["documento"].valores
+        self._n_item = c["n_item"].valores
+        self._cprod = c["cprod"].adicionar
+        self._xprod = c["xprod"].adicionar
+        self._ncm = c["ncm"].adicionar
+        self._cfop = c["cfop"].adicionar
+        self._ucom = c["ucom"].adicionar
+        self._qcom = c["qcom"].valores
+        self._vuncom = c["vuncom"].valores
+        self._vprod = c["vprod_centavos"].valores
+
+    def __len__(self):
+        return len(self.itens)
+
+    def iniciar_documento(self) -> None:
+        self._inicio_documento = len(self.itens)
+        self._chave = None
+
+    def adicionar_item(self, n_item: str | None, campos: dict) -> None:
+        get = campos.get
+        self._documento.append(len(self.documentos))
+        self._n_item.append(_para_inteiro(n_item))
+        self._cprod(get('cProd'))
+        self._xprod(get('xProd'))
+        self._ncm(get('NCM'))
+        self._cfop(get('CFOP'))
+        self._ucom(get('uCom'))
+        self._qcom.append(_para_float(get('qCom')))
+        self._vuncom.append(_para_float(get('vUnCom')))
+        self._vprod.append(round(_para_float(get('vProd')) * 100))
+
+    def definir_chave(self, chave: str | None) -> None:
+        if chave and self._chave is None:
+            self._chave = chave
+
+    def concluir_documento(self, nome_arquivo: str, categoria: str) -> None:
+        colunas = self.documentos.colunas
+        colunas["chave"].adicionar(self._chave)
+        colunas["arquivo"].adicionar(nome_arquivo)
+        colunas["categoria"].adicionar(categoria)
+
+    def descartar_documento(self) -> None:
+        self.itens.truncar(self._inicio_documento)
+
+    def reclassificar(self, linhas: dict[int, str]) -> None:
+        """Corrige a categoria dos documentos indicados (linha na tabela 'documentos' -> categoria)."""
+        self.documentos.colunas["categoria"].substituir(linhas)
+
+    def estender(self, outras: "ColunasItens") -> None:
+        """Acrescenta os itens coletados por outro processo (modo paralelo), mantendo a ordem."""
+        self.itens.estender(outras.itens, {"documento": len(self.documentos)})
+        self.documentos.estender(outras.documentos)
+
+    def __getstate__(self):
+        # Só as tabelas viajam entre processos; os atalhos são recriados no destino
+        return {"itens": self.itens, "documentos": self.documentos}
+
+    def __setstate__(self, estado):
+        self.itens = estado["itens"]
+        self.documentos = estado["documentos"]
+        self._inicio_documento = len(self.itens)
+        self._chave = None
+        self._ligar_atalhos()
+
+    def tamanho_estimado(self) -> int:
+        total = 0
+        for tabela in (self.itens, self.documentos):
+            for coluna in tabela.colunas.values():
+                total += sum(len(memoryview(b).cast('B')) for b in coluna.buffers().values())
+        return total
+
+    def gravar(self, destino: BinaryIO) -> int:
+        return gravar_colunar(destino, {"itens": self.itens, "documentos": self.documentos})
@@ -0,0 +1,121 @@
+import os
+import time
+import zlib
+import threading
+import zipfile
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from zip_bruto import gravar_bruto, ler_bruto
+
+
+# -------------------------------------------------------------------
+# POLÍTICAS DE COMPRESSÃO DO ZIP DE SAÍDA
+# -------------------------------------------------------------------
+# Nome da política -> (método do zipfile, nível do zlib)
+POLITICAS = {
+    "armazenar": (zipfile.ZIP_STORED, None),  # sem compressão: o mais rápido, ZIP maior (rede local)
+    "rapida": (zipfile.ZIP_DEFLATED, 1),
+    "padrao": (zipfile.ZIP_DEFLATED, 6),      # mesmo nível do writestr padrão do zipfile
+    "maxima": (zipfile.ZIP_DEFLATED, 9),      # menor ZIP ainda legível por qualquer descompactador
+}
+
+# Políticas compatíveis com a cópia bruta: o deflate do ZIP enviado já serve (e copiar é o mais rápido).
+# 'armazenar' e 'maxima' pedem outro formato/nível, então os membros são recomprimidos.
+POLITICAS_COPIA_BRUTA = ("rapida", "padrao")
+
+# Política usada quando a requisição não escolhe uma
+COMPRESSAO_PADRAO = os.environ.get("MONXML_COMPRESSAO", "padrao")
+# Threads que comprimem as entradas do ZIP de saída (o zlib libera o GIL). 1 = sem pool.
+THREADS_COMPRESSAO = int(os.environ.get("MONXML_THREADS_COMPRESSAO", min(4, os.cpu_count() or 1)))
+
+# Entradas comprimidas aguardando gravação, por thread (limita a memória do pipeline)
+PENDENTES_POR_THREAD = 8
+
+# Pools reaproveitados entre requisições, um por quantidade de threads
+_pools: dict[int, ThreadPoolExecutor] = {}
+_pools_lock = threading.Lock()
+
+
+def validar_politica(politica: str | None) -> str:
+    """Devolve a política (ou a padrão, se None). Levanta ValueError se ela não existir."""
+    politica = politica or COMPRESSAO_PADRAO
+    if politica not in POLITICAS:
+        raise ValueError(f"Política de compressão desconhecida: {politica}. Use: {', '.join(POLITICAS)}.")
+    return politica
+
+
+def _obter_pool(threads: int) -> ThreadPoolExecutor:
+    # Um gravador de outra requisição pode estar usando o pool: nunca o trocamos, criamos um por tamanho
+    with _pools_lock:
+        pool = _pools.get(threads)
+        if pool is None:
+            pool = _pools[threads] = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="monxml-deflate")
+        return pool
+
+
+def _comprimir(dados: bytes, metodo: int, nivel: int | None) -> tuple[bytes, int, int]:
+    crc = zlib.crc32(dados)
+    if metodo == zipfile.ZIP_STORED:
+        return dados, crc, len(dados)
+    # Deflate cru (wbits negativo), exatamente como o zipfile grava
+    compressor = zlib.compressobj(nivel, zlib.DEFLATED, -15)
+    return compressor.compress(dados) + compressor.flush(), crc, len(dados)
+
+
+class GravadorParalelo:
+    """
+    Grava entradas no ZIP de saída comprimindo-as num pool de threads.
+
+    As entradas são comprimidas em paralelo, mas gravadas na ORDEM em que foram
+    adicionadas: o ZIP de saída tem as mesmas entradas, na mesma ordem, do caminho
+    serial (writestr). Cópias brutas ('adicionar_bruto') entram na mesma fila.
+
+    Antes de gravar qualquer outra coisa direto no 'zip_out' (ex: relatórios), chame 'concluir'.
+    """
+
+    def __init__(self, zip_out: zipfile.ZipFile, politica: str | None = None, threads: int | None = None):
+        self.zip_out = zip_out
+        self.metodo, self.nivel = POLITICAS[validar_politica(politica)]
+        threads = THREADS_COMPRESSAO if threads is None else threads
+        self._pool = _obter_pool(threads) if threads > 1 else None
+        self._limite = max(threads, 1) * PENDENTES_POR_THREAD
+        # (nome, Future ou (dados_comprimidos, crc, tamanho), método, date_time), na ordem de gravação
+        self._pendentes: deque = deque()
+
+    def adicionar(self, nome: str, dados: bytes) -> None:
+        if len(dados) > zipfile.ZIP64_LIMIT * 0.9:
+            # Entrada gigante: o header precisa de ZIP64, que a gravação bruta não monta
+            self.concluir()
+            self.zip_out.writestr(nome, dados, compress_type=self.metodo, compresslevel=self.nivel)
+            return
+        if self._pool is None:
+            resultado = _comprimir(dados, self.metodo, self.nivel)
+        else:
+            resultado = self._pool.submit(_comprimir, dados, self.metodo, self.nivel)
+        self._enfileirar(nome, resultado, self.metodo, time.localtime(time.time())[:6])
+
+    def adicionar_bruto(self, zip_in: zipfile.ZipFile, info: zipfile.ZipInfo, nome: str) -> None:
+        """Cópia bruta (sem recomprimir) na vez certa da fila. Os bytes são lidos agora, nesta thread."""
+        resultado = (ler_bruto(zip_in, info), info.CRC, info.file_size)
+        self._enfileirar(nome, resultado, info.compress_type, info.date_time)
+
+    def _enfileirar(self, nome: str, resultado, metodo: int, date_time: tuple) -> None:
+        self._pendentes.append((nome, resultado, metodo, date_time))
+        if len(self._pendentes) >= self._limite:
+            # Grava a metade mais antiga; a outra metade continua comprimindo enquanto o laço segue
+            self._gravar_pendentes(self._limite // 2)
+        elif self._pool is None:
+            self._gravar_pendentes()
+
+    def _gravar_pendentes(self, manter: int = 0) -> None:
+        while len(self._pendentes) > manter:
+            nome, resultado, metodo, date_time = self._pendentes.popleft()
+            if isinstance(resultado, Future):
+                resultado = resultado.result()
+            dados, crc, tamanho = resultado
+            gravar_bruto(self.zip_out, nome, dados, metodo, crc, tamanho, date_time)
+
+    def concluir(self) -> None:
+        """Grava tudo o que ainda está na fila (bloqueia até as compressões terminarem)."""
+        self._gravar_pendentes()
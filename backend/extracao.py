@@ -0,0 +1,311 @@
+import io
+from typing import BinaryIO, NamedTuple
+
+# Importamos 'etree' do lxml para parsing de XML de alta performance
+from lxml import etree as ET
+
+
+# -------------------------------------------------------------------
+# MOTOR DE EXTRAÇÃO (PASSAGEM ÚNICA / STREAMING)
+# -------------------------------------------------------------------
+class DadosNFe(NamedTuple):
+    """
+    Registro compacto com tudo que o classificador precisa de um documento.
+
+    É uma NamedTuple (e não um dict) para ocupar pouca memória, ser imutável
+    e poder ser enviada entre processos (pickle) sem custo extra.
+    """
+    cstat: str
+    xmotivo: str
+    tpemis: str | None
+    v_nf: float
+    v_icms: float
+    # Chave de acesso (44 dígitos): da nota ('infNFe/@Id') ou a que o evento referencia ('chNFe')
+    chave: str | None = None
+    # Tipo do evento (ex: '110111' = cancelamento) em procEventoNFe; None em notas
+    tp_evento: str | None = None
+
+
+# Valores padrão quando a tag não existe no documento (mesmos textos usados nos relatórios)
+CSTAT_AUSENTE = "N/A"
+XMOTIVO_AUSENTE = "Motivo não encontrado"
+
+# Tags que interessam ao motor. O wildcard '{*}' casa com qualquer namespace (ou nenhum),
+# e o filtro é aplicado pelo próprio lxml em C: elementos fora desta lista não geram eventos Python.
+_TAGS_INTERESSE = (
+    '{*}tpEmis',
+    '{*}det',
+    '{*}ICMSTot',
+    '{*}cStat',
+    '{*}xMotivo',
+    '{*}infProt',
+    # Chave de acesso (nota: atributo Id do 'infNFe'; evento/protocolo: 'chNFe') e tipo do evento
+    '{*}infNFe',
+    '{*}chNFe',
+    '{*}tpEvento',
+)
+# Com coleta de cabeçalhos: emitente, destinatário e data de emissão (v4 'dhEmi', v2 'dEmi')
+_TAGS_CABECALHO = ('{*}emit', '{*}dest', '{*}dhEmi', '{*}dEmi')
+# Motor em árvore (extrair_resumo_nfe): as mesmas tags, menos os itens
+_TAGS_RESUMO = tuple(tag for tag in _TAGS_INTERESSE if tag != '{*}det')
+
+# Acima deste tamanho o motor em árvore delega ao iterparse (a árvore inteira ocupa
+# várias vezes o tamanho do XML)
+LIMITE_ARVORE = 4 * 1024 * 1024
+
+
+def _nome_local(tag: str) -> str:
+    """Remove o namespace de uma tag no formato '{uri}nome'."""
+    return tag.rpartition('}')[2]
+
+
+def _para_float(texto: str | None) -> float:
+    """Converte o texto de um valor monetário, devolvendo 0.0 se vazio ou inválido."""
+    if not texto:
+        return 0.0
+    try:
+        return float(texto)
+    except ValueError:
+        return 0.0
+
+
+def _ler_icmstot(elem) -> tuple[float, float]:
+    """(vNF, vICMS) de um 'ICMSTot'."""
+    v_nf = v_icms = 0.0
+    for child in elem:
+        tag_filho = child.tag
+        # Comentários/PIs têm 'tag' não-string: ignoramos
+        if not isinstance(tag_filho, str):
+            continue
+        if tag_filho.endswith('vNF'):
+            v_nf = _para_float(child.text)
+        elif tag_filho.endswith('vICMS'):
+            v_icms = _para_float(child.text)
+    return v_nf, v_icms
+
+
+def _descartar(elem) -> None:
+    """
+    Libera um elemento já processado (e os irmãos anteriores) da árvore parcial.
+    Sem isso o iterparse acabaria montando o DOM completo em memória.
+    """
+    elem.clear()
+    while elem.getprevious() is not None:
+        del elem.getparent()[0]
+
+
+def _coletar_item(det, itens) -> None:
+    """Lê os campos de 'det/prod' de um item e os entrega ao coletor (antes do descarte)."""
+    for filho in det:
+        if isinstance(filho.tag, str) and _nome_local(filho.tag) == 'prod':
+            campos = {_nome_local(campo.tag): campo.text for campo in filho if isinstance(campo.tag, str)}
+            itens.adicionar_item(det.get('nItem'), campos)
+            return
+
+
+def _primeiro_cfop(det) -> str | None:
+    for filho in det:
+        if isinstance(filho.tag, str) and _nome_local(filho.tag) == 'prod':
+            for campo in filho:
+                if isinstance(campo.tag, str) and campo.tag.endswith('CFOP'):
+                    return campo.text
+    return None
+
+
+class _Campos:
+    """
+    Campos de DadosNFe em coleta, com as regras de ocorrência comuns aos dois motores
+    ('extrair_dados_nfe' e 'extrair_resumo_nfe'):
+        - tpEmis e ICMSTot: vale a PRIMEIRA ocorrência.
+        - cStat e xMotivo: vale a ÚLTIMA ocorrência (num evento, a do 'retEvento').
+        - Chave de acesso e tpEvento: vale a PRIMEIRA ocorrência.
+    """
+    __slots__ = ('cstat', 'xmotivo', 'tpemis', 'v_nf', 'v_icms', 'icmstot_lido', 'chave', 'tp_evento')
+
+    def __init__(self):
+        self.cstat = None
+        self.xmotivo = None
+        self.tpemis = None
+        self.v_nf = 0.0
+        self.v_icms = 0.0
+        self.icmstot_lido = False
+        self.chave = None
+        self.tp_evento = None
+
+    def absorver(self, nome: str, elem) -> bool:
+        """Aplica a regra da tag 'nome' (sem namespace). True se 'elem' é a ocorrência que vale."""
+        if nome == 'ICMSTot':
+            if self.icmstot_lido:
+                return False
+            self.icmstot_lido = True
+            self.v_nf, self.v_icms = _ler_icmstot(elem)
+        elif nome == 'tpEmis':
+            if self.tpemis is not None:
+                return False
+            self.tpemis = elem.text
+        elif nome == 'cStat':
+            self.cstat = elem
+        elif nome == 'xMotivo':
+            self.xmotivo = elem
+        elif nome == 'infNFe':
+            if self.chave is not None:
+                return False
+            self.chave = (elem.get('Id') or '').removeprefix('NFe') or None
+        elif nome == 'chNFe':
+            if self.chave is not None:
+                return False
+            self.chave = elem.text
+        elif nome == 'tpEvento':
+            if self.tp_evento is not None:
+                return False
+            self.tp_evento = elem.text
+        else:
+            return False
+        return True
+
+    def completos(self) -> bool:
+        """Tudo que a classificação usa já foi lido (condição de parada no fim do 'infProt')."""
+        return self.cstat is not None and self.xmotivo is not None and self.tpemis is not None and self.icmstot_lido
+
+    def dados(self) -> DadosNFe:
+        return DadosNFe(
+            cstat=self.cstat.text if self.cstat is not None else CSTAT_AUSENTE,
+            xmotivo=self.xmotivo.text if self.xmotivo is not None else XMOTIVO_AUSENTE,
+            tpemis=self.tpemis,
+            v_nf=self.v_nf,
+            v_icms=self.v_icms,
+            chave=self.chave,
+            tp_evento=self.tp_evento,
+        )
+
+
+def extrair_dados_nfe(origem: bytes | BinaryIO, itens=None, cabecalho=None) -> DadosNFe:
+    """
+    Extrai cStat, xMotivo, tpEmis, vNF, vICMS, a chave de acesso e o tipo de evento
+    (procEventoNFe) numa ÚNICA passagem pelo XML.
+
+    Usa 'iterparse' do lxml filtrado pelas tags de interesse. Os itens ('det'),
+    que podem ser milhares numa NF-e grande, são descartados assim que terminam,
+    então a árvore completa nunca é montada. A leitura é interrompida ao fim do
+    protocolo de autorização ('infProt') quando todos os campos já foram coletados.
+
+    As regras de ocorrência (primeira/última) ficam em '_Campos', compartilhadas com
+    o motor em árvore ('extrair_resumo_nfe').
+
+    Args:
+        origem (bytes | BinaryIO): Conteúdo do XML ou um objeto arquivo já aberto
+            (ex: o retorno de 'zipfile.ZipFile.open'), lido sob demanda.
+        itens (colunar.ColunasItens | None): Se informado, cada 'det/prod' é copiado para
+            este coletor na mesma passagem, antes de ser descartado. Se o XML estiver
+            corrompido, os itens já coletados do documento são removidos.
+        cabecalho (agregacao.ColunasCabecalhos | None): Se informado, recebe emitente,
+            destinatário, UFs, data de emissão, CFOP do primeiro item e os totais
+            (vNF, vICMS, vST, vIPI) para a agregação por dimensões.
+
+    Returns:
+        DadosNFe: Registro compacto com os campos extraídos.
+
+    Raises:
+        ET.ParseError: Se o XML estiver corrompido ou mal formatado.
+    """
+    if isinstance(origem, (bytes, bytearray, memoryview)):
+        origem = io.BytesIO(origem)
+
+    campos = _Campos()
+
+    tags = _TAGS_INTERESSE
+    if itens is not None:
+        itens.iniciar_documento()
+    if cabecalho is not None:
+        tags += _TAGS_CABECALHO
+        cabecalho.iniciar_documento()
+    cfop_pendente = cabecalho is not None
+
+    try:
+        for _, elem in ET.iterparse(origem, events=('end',), tag=tags):
+            tag = elem.tag
+
+            # Caminho quente: itens ('det') não são usados na classificação e são
+            # a imensa maioria dos eventos. Descartamos sem nenhum outro processamento
+            # (a não ser a cópia para o coletor, quando a exportação de itens foi pedida).
+            if tag.endswith('det'):
+                if itens is not None:
+                    _coletar_item(elem, itens)
+                if cfop_pendente:
+                    cfop_pendente = False
+                    cabecalho.definir("cfop", _primeiro_cfop(elem))
+                _descartar(elem)
+                continue
+
+            nome = _nome_local(tag)
+
+            if nome == 'ICMSTot':
+                if campos.absorver(nome, elem) and cabecalho is not None:
+                    cabecalho.definir_totais(elem)
+                _descartar(elem)
+
+            elif nome == 'infProt':
+                # Fim do protocolo: numa nfeProc nada relevante vem depois dele.
+                # Só paramos se todo o resto já foi lido (senão seguimos até o fim do documento).
+                if campos.completos():
+                    break
+
+            elif campos.absorver(nome, elem):
+                if nome == 'infNFe' and itens is not None:
+                    itens.definir_chave(campos.chave)
+
+            elif cabecalho is not None and nome in ('emit', 'dest'):
+                cabecalho.definir_participante('emitente' if nome == 'emit' else 'destinatario', elem)
+                _descartar(elem)
+
+            elif cabecalho is not None and nome in ('dhEmi', 'dEmi'):
+                cabecalho.definir_data(elem.text)
+
+    except ET.ParseError:
+        if itens is not None:
+            itens.descartar_documento()
+        raise
+
+    return campos.dados()
+
+
+def extrair_resumo_nfe(conteudo_xml: bytes) -> DadosNFe:
+    """
+    Mesmo resultado de 'extrair_dados_nfe' (sem coleta de itens/cabeçalhos), para XMLs já em memória.
+
+    Monta a árvore inteira de uma vez em C ('fromstring') e só então percorre as poucas
+    tags de interesse: em NF-e de tamanho comum é cerca de 2x mais rápido que o iterparse,
+    cujo custo fixo por documento domina. Usado no modo só resumo.
+
+    As regras são as mesmas ('_Campos'), inclusive a parada no fim do primeiro 'infProt' completo.
+    Se o XML não for bem formado (ex: lixo depois do protocolo, que o iterparse nunca chega
+    a ler) ou for grande demais para a árvore inteira, a decisão fica com 'extrair_dados_nfe'.
+
+    Raises:
+        ET.ParseError: Se o XML estiver corrompido antes do fim do protocolo.
+    """
+    if len(conteudo_xml) > LIMITE_ARVORE:
+        return extrair_dados_nfe(conteudo_xml)
+    try:
+        raiz = ET.fromstring(conteudo_xml)
+    except ET.ParseError:
+        return extrair_dados_nfe(conteudo_xml)
+
+    campos = _Campos()
+    # 'infProt' cujo fim ainda não passou: no iterparse a parada é avaliada no evento 'end',
+    # depois dos filhos (cStat/xMotivo), então aqui ela espera o primeiro elemento fora dele
+    protocolo = None
+
+    for elem in raiz.iter(_TAGS_RESUMO):
+        if protocolo is not None and protocolo not in elem.iterancestors():
+            if campos.completos():
+                break
+            protocolo = None
+
+        nome = _nome_local(elem.tag)
+        if nome == 'infProt':
+            protocolo = elem
+        else:
+            campos.absorver(nome, elem)
+
+    return campos.dados()
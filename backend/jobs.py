@@ -0,0 +1,199 @@
+import os
+import copy
+import time
+import uuid
+import queue
+import shutil
+import tempfile
+import threading
+from dataclasses import replace
+
+from processamento import OpcoesProcessamento, processar_zip_sync, estimar_custo
+from admissao import controle_admissao, Custo
+
+
+# -------------------------------------------------------------------
+# CONFIGURAÇÃO DA FILA DE JOBS (variáveis de ambiente)
+# -------------------------------------------------------------------
+# Threads que processam jobs em paralelo (cada uma ainda pode usar o pool de processos)
+JOBS_WORKERS = int(os.environ.get("MONXML_JOBS_WORKERS", "2"))
+# Jobs aguardando na fila. Acima disso novos envios recebem 429 (backpressure)
+JOBS_LIMITE_FILA = int(os.environ.get("MONXML_JOBS_LIMITE_FILA", "8"))
+# Tempo (segundos) que um resultado fica disponível para download após concluir
+JOBS_TTL = int(os.environ.get("MONXML_JOBS_TTL", "3600"))
+# Sugestão de espera (segundos) enviada no header Retry-After quando a fila está cheia
+JOBS_RETRY_AFTER = int(os.environ.get("MONXML_JOBS_RETRY_AFTER", "30"))
+# Diretório dos arquivos de entrada/saída dos jobs (padrão: temporário do sistema)
+JOBS_DIRETORIO = os.environ.get("MONXML_JOBS_DIRETORIO", "") or os.path.join(tempfile.gettempdir(), "monxml-jobs")
+
+# Estados possíveis de um job
+NA_FILA = "na_fila"
+PROCESSANDO = "processando"
+CONCLUIDO = "concluido"
+ERRO = "erro"
+
+
+class FilaCheia(Exception):
+    """A fila de jobs atingiu o limite: o cliente deve tentar novamente mais tarde."""
+
+
+class Job:
+    """Estado de um lote enviado pela API de jobs."""
+
+    def __init__(self, nome_arquivo: str, caminho_entrada: str, caminho_resultado: str, opcoes: OpcoesProcessamento):
+        self.id = uuid.uuid4().hex
+        self.nome_arquivo = nome_arquivo
+        self.caminho_entrada = caminho_entrada
+        self.caminho_resultado = caminho_resultado
+        self.opcoes = opcoes
+        # Custo estimado no envio (None: estimado pelo worker, a partir da cópia em disco)
+        self.custo: Custo | None = None
+        self.status = NA_FILA
+        self.total = None
+        self.processados = 0
+        self.dados_gerais = None
+        self.erro = None
+        self.criado_em = time.time()
+        self.concluido_em = None
+
+    def atualizar_progresso(self, processados: int, total: int, dados_gerais: dict) -> None:
+        # Chamado a cada XML pela thread de processamento; a cópia dos totais fica para 'como_dict'
+        self.total = total
+        self.processados = processados
+        self.dados_gerais = dados_gerais
+
+    def expira_em(self, ttl: int) -> float | None:
+        return self.concluido_em + ttl if self.concluido_em is not None else None
+
+    def como_dict(self, ttl: int) -> dict:
+        return {
+            "id": self.id,
+            "arquivo": self.nome_arquivo,
+            "status": self.status,
+            "processados": self.processados,
+            "total": self.total,
+            # Cópia: a thread de processamento continua alterando o original
+            "dados_gerais": copy.deepcopy(self.dados_gerais),
+            "erro": self.erro,
+            "criado_em": self.criado_em,
+            "concluido_em": self.concluido_em,
+            "expira_em": self.expira_em(ttl),
+        }
+
+
+class GerenciadorJobs:
+    """
+    Fila limitada de jobs + pool local de threads que os processa.
+
+    O envio apenas copia o upload para um arquivo do job e devolve o id; o processamento
+    acontece em segundo plano com 'processar_zip_sync', gravando o ZIP de saída em disco.
+    """
+
+    def __init__(
+        self,
+        workers: int = JOBS_WORKERS,
+        limite_fila: int = JOBS_LIMITE_FILA,
+        ttl: int = JOBS_TTL,
+        diretorio: str = JOBS_DIRETORIO,
+    ):
+        self.workers = workers
+        self.ttl = ttl
+        self.diretorio = diretorio
+        self._fila: queue.Queue[Job] = queue.Queue(maxsize=limite_fila)
+        self._jobs: dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self._threads: list[threading.Thread] = []
+
+    def _iniciar_workers(self) -> None:
+        # Threads sobem só no primeiro envio (importar o módulo não cria threads)
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._executar, name=f"monxml-job-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submeter(
+        self, arquivo, nome_arquivo: str, custo: Custo | None = None, opcoes: OpcoesProcessamento | None = None
+    ) -> Job:
+        """
+        Copia o upload ('arquivo', objeto arquivo, desde o início) para o diretório de jobs e o enfileira.
+        'custo' é o orçamento já estimado no envio ('estimar_custo'), reaproveitado pelo worker.
+        'opcoes' vão para 'processar_zip_sync' (o worker acrescenta o destino e o progresso).
+
+        Raises:
+            FilaCheia: Se a fila estiver no limite (nada é copiado nesse caso).
+        """
+        self.limpar_expirados()
+        if self._fila.full():
+            raise FilaCheia()
+
+        os.makedirs(self.diretorio, exist_ok=True)
+        job = Job(nome_arquivo, "", "", opcoes or OpcoesProcessamento())
+        job.custo = custo
+        job.caminho_entrada = os.path.join(self.diretorio, f"{job.id}.entrada.zip")
+        job.caminho_resultado = os.path.join(self.diretorio, f"{job.id}.resultado.zip")
+
+        arquivo.seek(0)
+        with open(job.caminho_entrada, "wb") as destino:
+            shutil.copyfileobj(arquivo, destino)
+
+        try:
+            self._fila.put_nowait(job)
+        except queue.Full:
+            # Outro envio ocupou a última vaga enquanto copiávamos
+            os.remove(job.caminho_entrada)
+            raise FilaCheia()
+
+        with self._lock:
+            self._jobs[job.id] = job
+        self._iniciar_workers()
+        return job
+
+    def obter(self, job_id: str) -> Job | None:
+        self.limpar_expirados()
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _executar(self) -> None:
+        while True:
+            job = self._fila.get()
+            try:
+                # O job já esperou na fila: aguarda o orçamento de memória/CPU sem prazo (nunca 503)
+                custo = job.custo or estimar_custo(job.caminho_entrada)
+                with controle_admissao.reservar(custo, espera=None):
+                    job.status = PROCESSANDO
+                    with open(job.caminho_resultado, "wb") as destino:
+                        opcoes = replace(job.opcoes, destino=destino, progresso=job.atualizar_progresso)
+                        _, job.dados_gerais = processar_zip_sync(job.caminho_entrada, opcoes)
+                job.status = CONCLUIDO
+            except Exception as erro:
+                print(f"Erro no job {job.id}: {erro!r}")
+                job.status = ERRO
+                job.erro = str(erro)
+            finally:
+                job.concluido_em = time.time()
+                _remover(job.caminho_entrada)
+                self._fila.task_done()
+
+    def limpar_expirados(self) -> None:
+        """Remove jobs (e arquivos de resultado) concluídos há mais de 'ttl' segundos."""
+        agora = time.time()
+        with self._lock:
+            expirados = [job for job in self._jobs.values() if job.concluido_em is not None and agora > job.expira_em(self.ttl)]
+            for job in expirados:
+                del self._jobs[job.id]
+        for job in expirados:
+            _remover(job.caminho_resultado)
+
+
+def _remover(caminho: str) -> None:
+    try:
+        os.remove(caminho)
+    except FileNotFoundError:
+        pass
+
+
+# Instância única do processo, compartilhada pelos endpoints /jobs/
+gerenciador_jobs = GerenciadorJobs()
@@ -1,26 +1,82 @@
 import uvicorn
-import io
-import zipfile
-import csv
-import time
 import os
+import time
+import asyncio
+import zipfile
+from tempfile import SpooledTemporaryFile
+from contextlib import asynccontextmanager
+from typing import BinaryIO
 
-# Importamos 'etree' do lxml para parsing de XML de alta performance
-from lxml import etree as ET
-from typing import List
+import anyio
 
-from fastapi import FastAPI, File, UploadFile, Response
-from fastapi.responses import StreamingResponse
+# Núcleo de processamento (extração, classificação e montagem do ZIP de saída).
+# Fica num módulo separado para poder ser importado pelos processos do pool paralelo.
+from processamento import OpcoesProcessamento, processar_zip_sync, processar_xmls_sync, resumir_zip_sync, estimar_custo
+# Leitura incremental do multipart de /processar-xmls/ (uma parte por vez)
+from upload_xmls import iterar_partes_multipart, ParteMuitoGrande, RequisicaoInvalida, LIMITE_XML
+
+from admissao import (
+    controle_admissao, custo_de_membros, Custo, Reserva, DescompressaoExcessiva, OrcamentoEsgotado,
+    ADMISSAO_RETRY_AFTER
+)
+# Cache de classificação compartilhado (estatísticas expostas em /cache/)
+from cache_classificacao import cache_global
+# Catálogo persistente de produtos (busca da tela product-search)
+from catalogo import catalogo_global
+# Políticas de compressão do ZIP de saída (armazenar / rapida / padrao / maxima)
+from compressao import validar_politica
+# Fila de jobs para lotes longos (processamento em segundo plano)
+from jobs import gerenciador_jobs, FilaCheia, CONCLUIDO, JOBS_RETRY_AFTER
+# Upload retomável em pedaços, com classificação antecipada dos membros que já chegaram
+from uploads import (
+    gerenciador_uploads, SessaoNaoEncontrada, PedacoForaDeOrdem, UploadIncompleto, UPLOADS_LIMITE_PEDACO
+)
+# Armazém dos ZIPs de saída já prontos, para reenvios do mesmo lote
+from resultados import armazem_resultados, hash_arquivo, chave_resultado, Resultado
+# Canal que liga a thread de processamento ao StreamingResponse (modo streaming)
+from streaming import CanalSaida, transmitir_em_thread, iterar_arquivo
+# Registros por XML em NDJSON/SSE enquanto o lote é classificado (/acompanhar-zip/)
+from acompanhamento import EmissorRegistros, acompanhar_zip_sync, FORMATOS, LIMITE_REGISTROS
+# Tempos por etapa (Server-Timing) e métricas no formato do Prometheus (/metrics)
+from metricas import registro, registrar_requisicao, TempoEtapas, MiddlewareInicioRequisicao
+# Agregação vetorizada (numpy) dos campos de cabeçalho por emitente, CFOP, período...
+from agregacao import ColunasCabecalhos, DIMENSOES_PADRAO, VALORES, agregar, validar_dimensoes, formatar_centavos, relatorio_csv
+
+from fastapi import FastAPI, File, UploadFile, Request, Response, HTTPException, Query
+from fastapi.responses import StreamingResponse, JSONResponse, FileResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 # Importamos 'run_in_threadpool' para executar tarefas CPU-bound (síncronas) sem bloquear o Event Loop assíncrono do FastAPI
 from starlette.concurrency import run_in_threadpool 
+from starlette.formparsers import MultiPartParser
+
+# Limite (em MB) a partir do qual uploads e ZIPs de saída deixam a RAM e vão para um arquivo
+# temporário em disco. Assim a memória por requisição não cresce com o tamanho do ZIP.
+LIMITE_SPOOL = int(os.environ.get("MONXML_LIMITE_SPOOL_MB", "1")) * 1024 * 1024
+MultiPartParser.spool_max_size = LIMITE_SPOOL
+
+# Threads do threadpool (run_in_threadpool) por processo do uvicorn: quantas requisições podem
+# estar processando ao mesmo tempo. O padrão (40) é o do anyio.
+THREADS_REQUISICOES = int(os.environ.get("MONXML_THREADS_REQUISICOES", "40"))
+
+
+def configurar_threadpool() -> None:
+    """Aplica THREADS_REQUISICOES ao threadpool do event loop atual (o limite é por loop)."""
+    anyio.to_thread.current_default_thread_limiter().total_tokens = THREADS_REQUISICOES
+
+
+@asynccontextmanager
+async def ciclo_de_vida(app):
+    configurar_threadpool()
+    yield
+
 
 # Inicia a aplicação FastAPI
 # metadados servem para a documentação automática (Swagger UI em /docs)
 app = FastAPI(
     title="Processador de XML (MonXML)",
     description="API especializada em validação de cStat e separação de XMLs de NF-e.",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=ciclo_de_vida,
 )
 
 # Configuração de CORS (Cross-Origin Resource Sharing)
@@ -41,211 +97,50 @@ app.add_middleware(
     expose_headers=[
         "X-Count-Approved", "X-Count-Contingency", "X-Count-Rejected",
         "X-Value-Approved", "X-Value-Contingency", "X-Value-Rejected",
-        "X-Icms-Approved", "X-Icms-Contingency", "X-Icms-Rejected"
+        "X-Icms-Approved", "X-Icms-Contingency", "X-Icms-Rejected",
+        "X-Count-Cancelled", "X-Value-Cancelled", "X-Icms-Cancelled", "X-Count-Events",
+        "Location", "Retry-After", "Server-Timing", "ETag"
     ] # Importante!
 )
 
+# Marca o instante de chegada de cada requisição (para medir o tempo de upload)
+app.add_middleware(MiddlewareInicioRequisicao)
 
-# -------------------------------------------------------------------
-# LÓGICA DE PROCESSAMENTO (SÍNCRONA / CPU-BOUND)
-# -------------------------------------------------------------------
-def processar_zip_sync(conteudo_zip_recebido: bytes) -> io.BytesIO:
+
+def montar_headers_resumo(stats: dict) -> dict:
     """
-    Função síncrona que processa o arquivo ZIP recebido.
-    
-    MOTIVO DE SER SÍNCRONA:
-    O processamento de arquivos ZIP e parsing de XML são tarefas intensivas em CPU (CPU-bound).
-    Em Python, código síncrono CPU-bound bloqueia o Event Loop do asyncio.
-    Para evitar travar o servidor, isolamos esta lógica nesta função e a chamamos via 'run_in_threadpool'.
-    
-    Args:
-        conteudo_zip_recebido (bytes): O conteúdo binário do arquivo ZIP enviado pelo usuário.
-        
-    Returns:
-        io.BytesIO: Um objeto em memória contendo o novo arquivo ZIP processado.
+    Headers X-Count/X-Value/X-Icms com os totais por categoria (lidos pelo Angular).
     """
-    
-    # Lógica de tracking para relatório e resumo
-    # Listas para guardar tuplas (nome_arquivo, cstat, xmotivo)
-    lista_detalhes_rejeicao = []
-    
-    # Estrutura de acumuladores para o relatório geral (qtd, valor, icms)
-    dados_gerais = {
-        "aprovados": {"qtd": 0, "valor": 0.0, "icms": 0.0},
-        "contingencia": {"qtd": 0, "valor": 0.0, "icms": 0.0},
-        "rejeitados": {"qtd": 0, "valor": 0.0, "icms": 0.0}
+    return {
+        "X-Count-Approved": str(stats["aprovados"]["qtd"]),
+        "X-Count-Contingency": str(stats["contingencia"]["qtd"]),
+        "X-Count-Rejected": str(stats["rejeitados"]["qtd"]),
+        "X-Value-Approved": f"{stats['aprovados']['valor']:.2f}",
+        "X-Value-Contingency": f"{stats['contingencia']['valor']:.2f}",
+        "X-Value-Rejected": f"{stats['rejeitados']['valor']:.2f}",
+        "X-Icms-Approved": f"{stats['aprovados']['icms']:.2f}",
+        "X-Icms-Contingency": f"{stats['contingencia']['icms']:.2f}",
+        "X-Icms-Rejected": f"{stats['rejeitados']['icms']:.2f}",
+        # Notas canceladas por um evento do mesmo lote (fora dos totais de aprovados/contingência)
+        "X-Count-Cancelled": str(stats["cancelados"]["qtd"]),
+        "X-Value-Cancelled": f"{stats['cancelados']['valor']:.2f}",
+        "X-Icms-Cancelled": f"{stats['cancelados']['icms']:.2f}",
+        "X-Count-Events": str(stats["eventos"]["qtd"]),
     }
 
-    # Criamos um buffer em memória para o ZIP de saída (evita gravar em disco = + performance)
-    memoria_zip_saida = io.BytesIO()
-
-    # Abrimos o ZIP de saída em modo de escrita ('w') com compressão DEFLATED
-    with zipfile.ZipFile(memoria_zip_saida, 'w', zipfile.ZIP_DEFLATED) as zip_out:
-        
-        # Abrimos o ZIP de entrada a partir dos bytes recebidos
-        try:
-            with zipfile.ZipFile(io.BytesIO(conteudo_zip_recebido), 'r') as zip_in:
-                
-                # Itera por cada arquivo existente dentro do ZIP enviado
-                for nome_arquivo in zip_in.namelist():
-                    
-                    # Ignoramos arquivos que não sejam XML (ex: imagens, txt, pastas ocultas)
-                    if not nome_arquivo.lower().endswith('.xml'):
-                        continue 
-
-                    # Lê o conteúdo binário do XML específico
-                    conteudo_xml = zip_in.read(nome_arquivo)
-
-                    # --- FIX: FLATTEN PATH ---
-                    # Usa apenas o nome do arquivo, ignorando as pastas de origem
-                    nome_limpo = os.path.basename(nome_arquivo)
-                    
-                    # --- Lógica de Validação: cStat ---
-                    try:
-                        # Parsing do XML para árvore de elementos (DOM)
-                        root = ET.fromstring(conteudo_xml)
-                        
-                        # --- Extração de Valores Financeiros (vNF e vICMS) ---
-                        v_nf = 0.0
-                        v_icms = 0.0
-                        
-                        # Busca o nó ICMSTot para extrair totais
-                        icmstot_node = None
-                        for node in root.iter():
-                            if node.tag.endswith('ICMSTot'):
-                                icmstot_node = node
-                                break
-                        
-                        if icmstot_node is not None:
-                            for child in icmstot_node:
-                                if child.tag.endswith('vNF') and child.text:
-                                    try:
-                                        v_nf = float(child.text)
-                                    except ValueError:
-                                        pass
-                                elif child.tag.endswith('vICMS') and child.text:
-                                    try:
-                                        v_icms = float(child.text)
-                                    except ValueError:
-                                        pass
-
-                        # Definição dos namespaces geralmente usados na NFe
-                        ns = {'ns': 'http://www.portalfiscal.inf.br/nfe'}
-                        
-                        # --- VALIDAÇÃO 1: Encontrar a tag 'cStat' (Status) ---
-                        # Busca cStat ignorando namespace ou usando wildcard se necessário
-                        # Para simplificar e manter a lógica robusta anterior:
-                        cstat_node = None
-                        xmotivo_node = None
-                        
-                        for node in root.iter():
-                            if node.tag.endswith('cStat'):
-                                cstat_node = node
-                            elif node.tag.endswith('xMotivo'):
-                                xmotivo_node = node
-                        
-                        cstat_value = cstat_node.text if cstat_node is not None else "N/A"
-                        xmotivo_value = xmotivo_node.text if xmotivo_node is not None else "Motivo não encontrado"
-
-                        # --- REGRA DE NEGÓCIO 1: Filtrar por cStat ---
-                        # Se cStat não for 100 (Autorizado) ou 150 (Autorizado Fora de Prazo), é REJEITADO.
-                        if cstat_value not in ['100', '150']:
-                            # Gravamos na pasta 'rejeitados/' dentro do novo ZIP
-                            zip_out.writestr(f'rejeitados/{nome_limpo}', conteudo_xml)
-                            dados_gerais["rejeitados"]["qtd"] += 1
-                            dados_gerais["rejeitados"]["valor"] += v_nf
-                            dados_gerais["rejeitados"]["icms"] += v_icms
-                            lista_detalhes_rejeicao.append([nome_limpo, cstat_value, xmotivo_value])
-                        
-                        else:
-                            # --- VALIDAÇÃO 2: Verificar Tipo de Emissão (tpEmis) ---
-                            tpemis_node = None
-                            for node in root.iter():
-                                if node.tag.endswith('tpEmis'):
-                                    tpemis_node = node
-                                    break
-                            
-                            tpemis_value = tpemis_node.text if tpemis_node is not None else None
-
-                            # --- REGRA DE NEGÓCIO 2: Classificar Aprovados vs Contingência ---
-                            # tpEmis = 1: Emissão Normal -> Pasta 'aprovados/'
-                            if tpemis_value == '1':
-                                zip_out.writestr(f'aprovados/{nome_limpo}', conteudo_xml)
-                                dados_gerais["aprovados"]["qtd"] += 1
-                                dados_gerais["aprovados"]["valor"] += v_nf
-                                dados_gerais["aprovados"]["icms"] += v_icms
-                            # Outros valores (EX: 9): Contingência -> Pasta 'contingencia/'
-                            else: 
-                                zip_out.writestr(f'contingencia/{nome_limpo}', conteudo_xml)
-                                dados_gerais["contingencia"]["qtd"] += 1
-                                dados_gerais["contingencia"]["valor"] += v_nf
-                                dados_gerais["contingencia"]["icms"] += v_icms
-                        
-                    except ET.ParseError:
-                        # Se o arquivo .xml estiver corrompido ou mal formatado
-                        print(f"Erro ao analisar o XML: {nome_arquivo}")
-                        zip_out.writestr(f'rejeitados/{nome_limpo}', conteudo_xml)
-                        dados_gerais["rejeitados"]["qtd"] += 1
-                        lista_detalhes_rejeicao.append([nome_limpo, "ERRO_PARSE", "Arquivo XML inválido ou corrompido"])
-
-            # --- GERAÇÃO DO RELATÓRIO DE REJEIÇÕES (CSV) ---
-            if lista_detalhes_rejeicao:
-                csv_buffer = io.StringIO()
-                writer = csv.writer(csv_buffer, delimiter=';') # Ponto e vírgula para Excel PT-BR
-                writer.writerow(['Nome do Arquivo', 'Código Status (cStat)', 'Motivo (xMotivo)'])
-                writer.writerows(lista_detalhes_rejeicao)
-                
-                # Grava o CSV no ZIP
-                zip_out.writestr('rejeitados/relatorio_erros.csv', csv_buffer.getvalue().encode('utf-8-sig')) # utf-8-sig para Excel abrir direto
-
-            # --- GERAÇÃO DO RELATÓRIO GERAL (CSV) ---
-            csv_buffer_geral = io.StringIO()
-            writer_geral = csv.writer(csv_buffer_geral, delimiter=';')
-            writer_geral.writerow(['Categoria', 'Quantidade', 'Valor Total (R$)', 'ICMS Total (R$)'])
-            
-            total_qtd = 0
-            total_valor = 0.0
-            total_icms = 0.0
-            
-            categorias = ['aprovados', 'contingencia', 'rejeitados']
-            for cat in categorias:
-                dados = dados_gerais[cat]
-                writer_geral.writerow([
-                    cat.capitalize(), 
-                    dados['qtd'], 
-                    f"{dados['valor']:.2f}".replace('.', ','), 
-                    f"{dados['icms']:.2f}".replace('.', ',')
-                ])
-                total_qtd += dados['qtd']
-                total_valor += dados['valor']
-                total_icms += dados['icms']
-            
-            writer_geral.writerow([
-                'TOTAL GERAL', 
-                total_qtd, 
-                f"{total_valor:.2f}".replace('.', ','), 
-                f"{total_icms:.2f}".replace('.', ',')
-            ])
-            
-            zip_out.writestr('relatorio_geral.csv', csv_buffer_geral.getvalue().encode('utf-8-sig'))
-
-        except zipfile.BadZipFile:
-            # Caso o arquivo enviado pelo usuário não seja um ZIP válido
-            print("Erro: Ficheiro não é um ZIP válido.")
-            zip_out.writestr('ERRO.txt', 'O ficheiro enviado não era um ZIP válido.')
-
-    # "Rebobina" o ponteiro do arquivo em memória para o início (byte 0) para que possa ser lido
-    memoria_zip_saida.seek(0)
-    
-    # Retorna a estrutura completa de dados_gerais para uso nos headers
-    return memoria_zip_saida, dados_gerais
-
 
 # -------------------------------------------------------------------
 # ENDPOINT PRINCIPAL (ASSÍNCRONO)
 # -------------------------------------------------------------------
 @app.post("/processar-zip/")
-async def processar_zip(arquivo: UploadFile = File(...)):
+async def processar_zip(
+    request: Request,
+    arquivo: UploadFile = File(...),
+    streaming: bool = False,
+    usar_cache: bool = True,
+    itens: bool = False,
+    compressao: str | None = None,
+):
     """
     Endpoint principal para processar o ZIP.
     RECEBE o arquivo e DEVOLVE um ZIP processado.
@@ -253,148 +148,808 @@ async def processar_zip(arquivo: UploadFile = File(...)):
     Esta função é 'async', o que significa que ela roda no Event Loop do FastAPI.
     NÃO devemos colocar lógica bloqueante/pesada diretamente aqui, senão o servidor
     para de responder a outras requisições enquanto processa esta.
+
+    Com '?streaming=true' o ZIP é enviado à medida que é escrito (memória limitada e
+    primeiros bytes imediatos). Como os headers saem ANTES do processamento, os totais
+    não vão nos headers X-Count/X-Value/X-Icms: vêm na entrada 'resumo.json' no fim do ZIP.
+
+    Com '?usar_cache=false' todos os XMLs são analisados, ignorando o cache de classificação
+    e o armazém de resultados (um reenvio é processado de novo).
+
+    Com '?itens=true' os itens (det/prod) de cada nota são extraídos no servidor e vão para
+    'itens.mxc' dentro do ZIP (formato colunar tipado), em vez de serem lidos no navegador.
+
+    '?compressao=armazenar|rapida|padrao|maxima' troca tamanho do ZIP por latência
+    (ex: 'armazenar' ou 'rapida' em rede local).
+
+    O header Server-Timing traz a duração de cada etapa (upload, descompactação, parsing, gravação...).
     """
     
     start_time = time.perf_counter()
-
-    # Leitura ASSÍNCRONA do arquivo recebido. Isso libera o Event Loop enquanto o SO lê os dados.
-    conteudo_zip_recebido = await arquivo.read()
+    tempos = tempos_da_requisicao(request)
+    compressao = politica_da_requisicao(compressao)
+
+    # O upload NÃO é lido para a memória: o Starlette já o guardou num SpooledTemporaryFile
+    # (RAM até LIMITE_SPOOL, disco acima disso) e o zipfile lê direto desse arquivo,
+    # descompactando um membro de cada vez.
+    arquivo_zip_recebido = arquivo.file
+
+    # --- ARMAZÉM DE RESULTADOS ---
+    # O mesmo ZIP com as mesmas opções já foi processado? Devolve o arquivo guardado, sem processar.
+    chave = None
+    if armazem_resultados.ativo and usar_cache and not streaming:
+        with tempos.medir("hash_upload"):
+            hash_zip = await run_in_threadpool(hash_arquivo, arquivo_zip_recebido)
+        chave = chave_resultado(hash_zip, itens=itens, compressao=compressao)
+        aberto = armazem_resultados.abrir(chave)
+        if aberto is not None:
+            return responder_resultado(request, *aberto, tempos, "processar-zip", arquivo.size)
+
+    # Controle de admissão: o custo vem do diretório central, antes de descompactar qualquer membro
+    reserva = await admitir(await custo_do_zip(arquivo_zip_recebido))
+
+    if streaming:
+        # O processamento roda numa thread e escreve direto no canal; o Event Loop só repassa os pedaços.
+        # O orçamento é devolvido quando essa thread termina, não quando o endpoint retorna.
+        def processar_e_liberar(*args):
+            with reserva:
+                return processar_zip_sync(*args)
+
+        canal = CanalSaida(asyncio.get_running_loop())
+        transmitir_em_thread(
+            canal, processar_e_liberar, arquivo_zip_recebido,
+            OpcoesProcessamento(
+                destino=canal, incluir_resumo=True, usar_cache=usar_cache, tempos=tempos, exportar_itens=itens,
+                compressao=compressao,
+            ),
+        )
+        return StreamingResponse(
+            contar_enviados(canal.iterar(), "processar-zip", tempos, arquivo.size),
+            media_type="application/x-zip-compressed",
+            headers={"Content-Disposition": "attachment; filename=xmls_processados.zip"}
+        )
+
+    # O ZIP de saída também é "spooled": pequeno fica na RAM, grande vai para o disco.
+    # Com o armazém ligado, vai direto para um arquivo no diretório do armazém (guardado depois com rename).
+    if chave is None:
+        arquivo_zip_saida = SpooledTemporaryFile(max_size=LIMITE_SPOOL)
+    else:
+        arquivo_zip_saida = armazem_resultados.novo_arquivo()
 
     # Delegação para WORKER THREAD:
     # Como 'processar_zip_sync' é pesado (CPU-bound), usamos 'run_in_threadpool'.
     # O FastAPI executa a função numa thread separada e 'await' aguarda o resultado sem bloquear o loop principal.
-    memoria_zip_saida, stats = await run_in_threadpool(processar_zip_sync, conteudo_zip_recebido)
-    
+    try:
+        with reserva:
+            arquivo_zip_saida, stats = await run_in_threadpool(
+                processar_zip_sync, arquivo_zip_recebido,
+                OpcoesProcessamento(
+                    destino=arquivo_zip_saida, usar_cache=usar_cache, tempos=tempos, exportar_itens=itens,
+                    compressao=compressao,
+                ),
+            )
+        if chave is not None:
+            arquivo_zip_saida.flush()
+            await run_in_threadpool(armazem_resultados.guardar, chave, arquivo_zip_saida.name, stats)
+    except BaseException:
+        arquivo_zip_saida.close()
+        if chave is not None and os.path.exists(arquivo_zip_saida.name):
+            os.remove(arquivo_zip_saida.name)
+        raise
+
     end_time = time.perf_counter()
     duration = end_time - start_time
 
     print(f"Processamento do ficheiro '{arquivo.filename}' concluído em {duration:.2f} segundos.")
 
+    return responder_zip(arquivo_zip_saida, stats, tempos, "processar-zip", arquivo.size, etag=chave)
+
+
+def politica_da_requisicao(compressao: str | None) -> str:
+    """Valida o parâmetro '?compressao=' (400 se a política não existir)."""
+    try:
+        return validar_politica(compressao)
+    except ValueError as erro:
+        raise HTTPException(status_code=400, detail=str(erro))
+
+
+async def custo_do_zip(origem) -> Custo:
+    """Estima o custo do ZIP pelo diretório central (413 se passar dos limites de descompressão)."""
+    try:
+        return await run_in_threadpool(estimar_custo, origem)
+    except DescompressaoExcessiva as erro:
+        raise HTTPException(status_code=413, detail=str(erro))
+
+
+async def admitir(custo: Custo) -> Reserva:
+    """
+    Espera orçamento de memória/CPU para a requisição (controle de admissão).
+    Sem orçamento dentro da espera máxima, responde 503 com Retry-After.
+    """
+    reserva = controle_admissao.reserva(custo)
+    try:
+        await run_in_threadpool(reserva.aguardar)
+    except OrcamentoEsgotado as erro:
+        raise HTTPException(status_code=503, detail=str(erro), headers={"Retry-After": str(ADMISSAO_RETRY_AFTER)})
+    except BaseException:
+        # Requisição interrompida enquanto esperava: o orçamento pode ter sido concedido no fim da espera
+        reserva.liberar()
+        raise
+    return reserva
+
+
+def tempos_da_requisicao(request: Request) -> TempoEtapas:
+    """
+    Cria o TempoEtapas da requisição a partir do instante de chegada (MiddlewareInicioRequisicao).
+    Para endpoints com UploadFile, o tempo até aqui é o recebimento do multipart.
+    """
+    inicio = request.scope.get(MiddlewareInicioRequisicao.CHAVE)
+    tempos = TempoEtapas(inicio)
+    if inicio is not None:
+        tempos.adicionar("leitura_upload", time.perf_counter() - inicio)
+    return tempos
+
+
+async def contar_enviados(pedacos, endpoint: str, tempos: TempoEtapas, bytes_entrada: int | None):
+    """Repassa os pedaços do modo streaming e publica as métricas da requisição quando o envio termina."""
+    enviados = 0
+    try:
+        async for pedaco in pedacos:
+            enviados += len(pedaco)
+            yield pedaco
+    finally:
+        registrar_requisicao(endpoint, tempos.total(), bytes_entrada, enviados)
+
+
+def responder_zip(
+    arquivo_zip_saida,
+    stats: dict,
+    tempos: TempoEtapas,
+    endpoint: str,
+    bytes_entrada: int | None,
+    etag: str | None = None,
+) -> StreamingResponse:
+    """
+    Devolve o ZIP de saída (já gravado, com o cursor no fim) com Content-Length, os headers
+    de resumo e o Server-Timing, e publica as métricas da requisição.
+    Com 'etag' (chave do armazém de resultados), envia também o header ETag.
+    """
+    tamanho_saida = arquivo_zip_saida.tell()
+    arquivo_zip_saida.seek(0)
+    registrar_requisicao(endpoint, tempos.total(), bytes_entrada, tamanho_saida)
 
     # --- Retorno da Resposta ---
-    # Devolvemos os bytes diretos, marcando o Content-Type como ZIP.
+    # Devolvemos o arquivo em pedaços (sem copiar tudo para um 'bytes'), marcando o Content-Type como ZIP.
     # O navegador identificará como download de arquivo.
-    
+
     # Headers customizados com o resumo
     headers = {
         "Content-Disposition": "attachment; filename=xmls_processados.zip",
-        "X-Count-Approved": str(stats["aprovados"]["qtd"]),
-        "X-Count-Contingency": str(stats["contingencia"]["qtd"]),
-        "X-Count-Rejected": str(stats["rejeitados"]["qtd"]),
-        "X-Value-Approved": f"{stats['aprovados']['valor']:.2f}",
-        "X-Value-Contingency": f"{stats['contingencia']['valor']:.2f}",
-        "X-Value-Rejected": f"{stats['rejeitados']['valor']:.2f}",
-        "X-Icms-Approved": f"{stats['aprovados']['icms']:.2f}",
-        "X-Icms-Contingency": f"{stats['contingencia']['icms']:.2f}",
-        "X-Icms-Rejected": f"{stats['rejeitados']['icms']:.2f}",
+        "Content-Length": str(tamanho_saida),
+        "Server-Timing": tempos.server_timing(),
+        **montar_headers_resumo(stats),
     }
-    
+    if etag is not None:
+        headers["ETag"] = f'"{etag}"'
+
     # Expose headers para o CORS (importante para o Angular conseguir ler)
-    
-    return Response(
-        content=memoria_zip_saida.getvalue(), # Obtém os bytes brutos do buffer
+
+    return StreamingResponse(
+        iterar_arquivo(arquivo_zip_saida),
         media_type="application/x-zip-compressed",
         headers=headers
     )
 
 
+def responder_resultado(
+    request: Request,
+    resultado: Resultado,
+    arquivo: BinaryIO,
+    tempos: TempoEtapas | None,
+    endpoint: str,
+    bytes_entrada: int | None,
+) -> Response:
+    """
+    Devolve um resultado do armazém direto do disco, com ETag e os headers de resumo.
+    'arquivo' é o ZIP aberto por 'ArmazemResultados.abrir' (fechado ao fim do envio).
+    Se o cliente já tem esta versão ('If-None-Match' com o mesmo ETag), responde 304 sem corpo.
+    """
+    etag = f'"{resultado.chave}"'
+    headers = {"ETag": etag, **montar_headers_resumo(resultado.dados_gerais)}
+    if tempos is not None:
+        headers["Server-Timing"] = tempos.server_timing()
+        registrar_requisicao(endpoint, tempos.total(), bytes_entrada, resultado.tamanho)
+    if etag in (valor.strip() for valor in request.headers.get("if-none-match", "").split(",")):
+        arquivo.close()
+        return Response(status_code=304, headers=headers)
+    # Lido do arquivo já aberto: se o resultado for removido do armazém durante o envio, nada muda
+    headers["Content-Disposition"] = "attachment; filename=xmls_processados.zip"
+    headers["Content-Length"] = str(resultado.tamanho)
+    return StreamingResponse(iterar_arquivo(arquivo), media_type="application/x-zip-compressed", headers=headers)
 
-"""
-# === ENDPOINT PARA VÁRIOS XMLS ===
-@app.post("/processar-xmls/")
-def processar_xmls(arquivos: List[UploadFile] = File(...)):
-    ""
-    Este endpoint recebe UMA LISTA de ficheiros XML, processa-os
-    e devolve um ZIP com o resultado.
-    ""
-    # As listas são as mesmas
-    aprovados = []
-    rejeitados = []
-    contingencia = []
 
-    # --- Etapa 1: Ler a LISTA de ficheiros ---
-    # Em vez de ler um ZIP, iteramos a lista de 'UploadFile'
-    
-    for arquivo in arquivos:
-        
-        # Garante que estamos a processar apenas arquivos XML
-        if arquivo.filename and arquivo.filename.endswith('.xml'):
-            # Lê o conteúdo do XML
-            conteudo_xml = arquivo.read()
-            nome_arquivo = arquivo.filename # Guardamos o nome
-            nome_limpo = os.path.basename(nome_arquivo) # Flattening
-            
-            # --- Etapa 2: Validar o XML (Lógica IDÊNTICA) ---
-            # (Esta lógica é copiada exatamente do 'processar_zip')
-            try:
-                # Analisa o conteúdo XML
-                root = ET.fromstring(conteudo_xml)
-                
-                # --- VALIDAÇÃO 1: Encontrar o cStat ---
-                cstat_node = None
-                for node in root.iter():
-                    if node.tag.endswith('cStat'):
-                        cstat_node = node
-                        break
-                cstat_value = cstat_node.text if cstat_node is not None else None
-
-                # --- APLICAÇÃO DAS REGRAS ---
-                
-                # REGRA 1: REJEITADOS
-                if cstat_value not in ['100', '150']:
-                    rejeitados.append((nome_limpo, conteudo_xml))
-                
-                # Se o cStat for 100 ou 150...
-                else:
-                    # --- VALIDAÇÃO 2: Encontrar o tpEmis ---
-                    tpemis_node = None
-                    for node in root.iter():
-                        if node.tag.endswith('tpEmis'):
-                            tpemis_node = node
-                            break
-                    tpemis_value = tpemis_node.text if tpemis_node is not None else None
-
-                    # REGRA 2: APROVADOS (Normais)
-                    if tpemis_value == '1':
-                        aprovados.append((nome_limpo, conteudo_xml))
-                    
-                    # REGRA 3: CONTINGÊNCIA
-                    else:
-                        contingencia.append((nome_limpo, conteudo_xml))
-
-            except ET.ParseError:
-                # Se o XML estiver corrompido ou for inválido
-                print(f"Erro ao analisar o XML: {nome_arquivo}")
-                rejeitados.append((nome_limpo, conteudo_xml))
-
-
-    # --- Etapa 3: Criar o novo ZIP de resposta (IDÊNTICA) ---
-    
-    memoria_zip_saida = io.BytesIO()
-    with zipfile.ZipFile(memoria_zip_saida, 'w', zipfile.ZIP_DEFLATED) as zip_out:
-        
-        for nome_arquivo, conteudo in aprovados:
-            zip_out.writestr(f'aprovados/{nome_arquivo}', conteudo)
-            
-        for nome_arquivo, conteudo in contingencia:
-            zip_out.writestr(f'contingencia/{nome_arquivo}', conteudo)
-            
-        for nome_arquivo, conteudo in rejeitados:
-            zip_out.writestr(f'rejeitados/{nome_arquivo}', conteudo)
-
-    memoria_zip_saida.seek(0)
-
-    # --- Etapa 4: Devolver o novo ZIP para o usuário (IDÊNTICA) ---
-    
+# -------------------------------------------------------------------
+# ENDPOINT PARA VÁRIOS XMLS
+# -------------------------------------------------------------------
+def _processar_multipart(corpo, content_type: str, destino, tempos: TempoEtapas, compressao: str):
+    """
+    Roda no threadpool: puxa o corpo da requisição do Event Loop pedaço a pedaço
+    e classifica cada XML assim que sua parte termina de chegar.
+    """
+    def ler_pedaco() -> bytes | None:
+        try:
+            return anyio.from_thread.run(corpo.__anext__)
+        except StopAsyncIteration:
+            return None
+
+    partes = iterar_partes_multipart(ler_pedaco, content_type)
+    return processar_xmls_sync(partes, destino=destino, tempos=tempos, compressao=compressao)
+
+
+@app.post(
+    "/processar-xmls/",
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "multipart/form-data": {
+                    "schema": {
+                        "type": "object",
+                        "properties": {"arquivos": {"type": "array", "items": {"type": "string", "format": "binary"}}},
+                        "required": ["arquivos"],
+                    }
+                }
+            },
+        }
+    },
+)
+async def processar_xmls(request: Request, compressao: str | None = None):
+    """
+    Recebe VÁRIOS XMLs soltos (campo 'arquivos' do multipart) e devolve o mesmo ZIP
+    de '/processar-zip/': pastas por categoria, relatórios CSV e headers de resumo.
+
+    O corpo NÃO passa por 'request.form()' (que guardaria todos os arquivos antes de
+    começar): cada parte é classificada e gravada no ZIP de saída assim que chega,
+    então a memória fica limitada mesmo com milhares de XMLs.
+
+    Aceita o mesmo '?compressao=' de '/processar-zip/'.
+    """
+    start_time = time.perf_counter()
+    compressao = politica_da_requisicao(compressao)
+    # Aqui o corpo ainda não foi lido: o upload é medido dentro do processamento
+    tempos = TempoEtapas(request.scope.get(MiddlewareInicioRequisicao.CHAVE))
+    # Sem diretório central: o maior XML possível é o menor entre o corpo inteiro e LIMITE_XML
+    tamanho_corpo = request.headers.get("content-length")
+    reserva = await admitir(custo_de_membros([min(int(tamanho_corpo or LIMITE_XML), LIMITE_XML)]))
+    arquivo_zip_saida = SpooledTemporaryFile(max_size=LIMITE_SPOOL)
+
+    try:
+        with reserva:
+            arquivo_zip_saida, stats = await run_in_threadpool(
+                _processar_multipart, request.stream().__aiter__(),
+                request.headers.get("content-type", ""), arquivo_zip_saida, tempos, compressao
+            )
+    except BaseException as erro:
+        # Requisição recusada no meio do corpo: o ZIP de saída parcial (temporário) é descartado
+        arquivo_zip_saida.close()
+        if isinstance(erro, RequisicaoInvalida):
+            raise HTTPException(status_code=400, detail=str(erro))
+        if isinstance(erro, ParteMuitoGrande):
+            raise HTTPException(status_code=413, detail=str(erro))
+        raise
+
+    duration = time.perf_counter() - start_time
+    total = sum(totais["qtd"] for totais in stats.values())
+    print(f"Processamento de {total} XMLs concluído em {duration:.2f} segundos.")
+
+    return responder_zip(
+        arquivo_zip_saida, stats, tempos, "processar-xmls", int(tamanho_corpo) if tamanho_corpo else None
+    )
+
+
+# -------------------------------------------------------------------
+# PRÉ-CONFERÊNCIA (SÓ O RESUMO, SEM ZIP DE SAÍDA)
+# -------------------------------------------------------------------
+@app.post("/resumo-zip/")
+async def resumo_zip(request: Request, arquivo: UploadFile = File(...), usar_cache: bool = True):
+    """
+    Classifica o ZIP e devolve SÓ o resumo em JSON: total, totais por categoria
+    (os mesmos dos headers X-Count/X-Value/X-Icms, que também vêm na resposta),
+    XMLs corrompidos e a lista de rejeições (arquivo, cStat, xMotivo).
+
+    Nenhum ZIP de saída é montado (nada é comprimido nem gravado): serve para
+    dashboards e para conferir um lote antes do processamento completo.
+    """
+    tempos = tempos_da_requisicao(request)
+    with await admitir(await custo_do_zip(arquivo.file)):
+        try:
+            resumo = await run_in_threadpool(
+                resumir_zip_sync, arquivo.file, OpcoesProcessamento(usar_cache=usar_cache, tempos=tempos)
+            )
+        except zipfile.BadZipFile:
+            raise HTTPException(status_code=400, detail="O ficheiro enviado não era um ZIP válido.")
+
+    registrar_requisicao("resumo-zip", tempos.total(), arquivo.size, None)
+    headers = {"Server-Timing": tempos.server_timing(), **montar_headers_resumo(resumo["dados_gerais"])}
+    return JSONResponse(content=resumo, headers=headers)
+
+
+@app.post("/acompanhar-zip/")
+async def acompanhar_zip(
+    request: Request,
+    arquivo: UploadFile = File(...),
+    formato: str = "ndjson",
+    usar_cache: bool = True,
+    compressao: str | None = None,
+):
+    """
+    Processa o ZIP devolvendo, à medida que cada XML é classificado, um registro compacto
+    (arquivo, categoria, cStat, xMotivo, vNF, vICMS): NDJSON por padrão ou SSE com '?formato=sse'.
+    Totais parciais vão periodicamente e o último registro traz os totais finais e o link de
+    download do ZIP de saída ('/resultados/{sha256}/zip').
+
+    O processamento roda numa thread própria que escreve no canal (streaming.CanalSaida); o
+    Event Loop só repassa as linhas. Com o cliente lento a thread espera, então a memória não
+    cresce com o tamanho do lote.
+    """
+    tempos = tempos_da_requisicao(request)
+    compressao = politica_da_requisicao(compressao)
+    if formato not in FORMATOS:
+        raise HTTPException(status_code=400, detail=f"Formato desconhecido: '{formato}'. Use um de: {', '.join(FORMATOS)}.")
+    # Depois dos headers não há mais status HTTP: o ZIP inválido é recusado antes
+    if not await run_in_threadpool(zipfile.is_zipfile, arquivo.file):
+        raise HTTPException(status_code=400, detail="O ficheiro enviado não era um ZIP válido.")
+    reserva = await admitir(await custo_do_zip(arquivo.file))
+
+    def acompanhar_e_liberar(canal):
+        with reserva:
+            acompanhar_zip_sync(
+                arquivo.file, EmissorRegistros(canal, formato), usar_cache=usar_cache, compressao=compressao,
+                tempos=tempos, armazem=armazem_resultados
+            )
+
+    # Um pedaço por registro (tamanho 1): cada linha sai assim que é escrita
+    canal = CanalSaida(asyncio.get_running_loop(), tamanho_pedaco=1, limite_pedacos=LIMITE_REGISTROS)
+    transmitir_em_thread(canal, acompanhar_e_liberar, canal)
     return StreamingResponse(
-        memoria_zip_saida,
+        contar_enviados(canal.iterar(), "acompanhar-zip", tempos, arquivo.size),
+        media_type=FORMATOS[formato],
+        # Sem cache nem buffer de proxy (nginx): os registros devem chegar na hora
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# -------------------------------------------------------------------
+# RELATÓRIO AGREGADO (EMITENTE, CFOP, PERÍODO...)
+# -------------------------------------------------------------------
+@app.post("/agregacoes/")
+async def agregacoes(
+    request: Request,
+    arquivo: UploadFile = File(...),
+    dimensoes: list[str] = Query(list(DIMENSOES_PADRAO)),
+    categorias: list[str] | None = Query(None),
+    formato: str = "json",
+):
+    """
+    Processa o ZIP e devolve os totais (documentos, vNF, vICMS, vST, vIPI) agrupados
+    por várias dimensões de uma vez, em vez de o relatório ser remontado no Excel.
+
+    Dimensões: emitente, destinatario, uf_emitente, uf_destinatario, cfop, categoria,
+    dia, mes, ano. Compostas com '+' (ex: '?dimensoes=emitente+mes&dimensoes=cfop').
+    Por padrão entram as notas aprovadas, em contingência e rejeitadas (as mesmas linhas do
+    relatorio_geral.csv); notas canceladas por um evento do lote só com '?categorias=cancelados'
+    e eventos nunca. Com '?categorias=aprovados' só entram as notas destas categorias.
+
+    Os valores são somados em centavos inteiros (exatos). '?formato=csv' devolve o
+    relatório em CSV (';' e vírgula decimal, como os demais relatórios).
+    """
+    if formato not in ("json", "csv"):
+        raise HTTPException(status_code=400, detail="Formato inválido. Use 'json' ou 'csv'.")
+    try:
+        validar_dimensoes(dimensoes)
+    except ValueError as erro:
+        raise HTTPException(status_code=400, detail=str(erro))
+
+    tempos = tempos_da_requisicao(request)
+    cabecalhos = ColunasCabecalhos()
+    # Só os totais interessam: o ZIP de saída nem é montado
+    with await admitir(await custo_do_zip(arquivo.file)):
+        try:
+            _, stats = await run_in_threadpool(
+                processar_zip_sync, arquivo.file,
+                OpcoesProcessamento(tempos=tempos, cabecalhos=cabecalhos, somente_resumo=True),
+            )
+        except zipfile.BadZipFile:
+            raise HTTPException(status_code=400, detail="O ficheiro enviado não era um ZIP válido.")
+
+    with tempos.medir("relatorios"):
+        relatorio = await run_in_threadpool(agregar, cabecalhos, dimensoes, categorias)
+    registrar_requisicao("agregacoes", tempos.total(), arquivo.size, None)
+    headers = {"Server-Timing": tempos.server_timing(), **montar_headers_resumo(stats)}
+
+    if formato == "csv":
+        return Response(
+            relatorio_csv(relatorio),
+            media_type="text/csv; charset=utf-8",
+            headers={"Content-Disposition": "attachment; filename=relatorio_agregado.csv", **headers},
+        )
+
+    # Centavos (inteiros, para somas exatas no cliente) + valor em reais formatado como texto
+    for linhas in relatorio.values():
+        for linha in linhas:
+            for campo in VALORES:
+                linha[campo] = formatar_centavos(linha[f"{campo}_centavos"])
+    # Toda dimensão reparte os mesmos documentos (os das categorias pedidas): qualquer uma dá o total
+    documentos = sum(linha["documentos"] for linha in next(iter(relatorio.values()), []))
+    return JSONResponse(content={"documentos": documentos, "dimensoes": relatorio}, headers=headers)
+
+
+# -------------------------------------------------------------------
+# ARMAZÉM DE RESULTADOS (CONSULTA PELO HASH, ANTES DO UPLOAD)
+# -------------------------------------------------------------------
+def _chave_por_hash(hash_zip: str, itens: bool, compressao: str | None) -> str:
+    return chave_resultado(hash_zip.lower(), itens=itens, compressao=politica_da_requisicao(compressao))
+
+
+RESULTADO_NAO_ENCONTRADO = "Nenhum resultado guardado para este ZIP."
+
+
+@app.get("/resultados/estatisticas")
+async def estatisticas_resultados():
+    """Ocupação e taxa de acerto do armazém de resultados."""
+    return armazem_resultados.estatisticas()
+
+
+@app.get("/resultados/{hash_zip}")
+async def consultar_resultado(hash_zip: str, itens: bool = False, compressao: str | None = None):
+    """
+    O cliente calcula o SHA-256 do ZIP e pergunta ANTES de enviar: se o mesmo lote (com as
+    mesmas opções de '/processar-zip/') já foi processado, devolve os totais e o link de
+    download, e o upload nem acontece. 404 se não houver resultado guardado.
+    """
+    resultado = armazem_resultados.obter(_chave_por_hash(hash_zip, itens, compressao))
+    if resultado is None:
+        raise HTTPException(status_code=404, detail=RESULTADO_NAO_ENCONTRADO)
+    parametros = f"itens={str(itens).lower()}&compressao={politica_da_requisicao(compressao)}"
+    return JSONResponse(
+        content={
+            "tamanho": resultado.tamanho,
+            "dados_gerais": resultado.dados_gerais,
+            "download": f"/resultados/{hash_zip.lower()}/zip?{parametros}",
+        },
+        headers={"ETag": f'"{resultado.chave}"'},
+    )
+
+
+@app.get("/resultados/{hash_zip}/zip")
+async def baixar_resultado(request: Request, hash_zip: str, itens: bool = False, compressao: str | None = None):
+    """Download do ZIP guardado (mesmos headers de '/processar-zip/'); 304 com 'If-None-Match'."""
+    aberto = armazem_resultados.abrir(_chave_por_hash(hash_zip, itens, compressao))
+    if aberto is None:
+        raise HTTPException(status_code=404, detail=RESULTADO_NAO_ENCONTRADO)
+    return responder_resultado(request, *aberto, None, "resultados", None)
+
+
+# -------------------------------------------------------------------
+# CACHE DE CLASSIFICAÇÃO
+# -------------------------------------------------------------------
+@app.get("/cache/")
+async def estatisticas_cache():
+    """
+    Contadores do cache de classificação: acertos, falhas, remoções (evictions) e ocupação.
+    """
+    return cache_global.estatisticas()
+
+
+# -------------------------------------------------------------------
+# CATÁLOGO DE PRODUTOS
+# -------------------------------------------------------------------
+@app.get("/produtos/")
+async def buscar_produtos(
+    q: str | None = None,
+    ncm: str | None = None,
+    cfop: str | None = None,
+    cprod: str | None = None,
+    emitente: str | None = None,
+    limite: int = 50,
+    deslocamento: int = 0,
+):
+    """
+    Busca nos itens de todos os lotes já processados, sem reenviar os XMLs.
+
+    'q' procura em xProd e cProd (cada palavra como prefixo, sem diferenciar acentos);
+    'ncm' e 'cprod' aceitam prefixo; 'cfop' e 'emitente' (CNPJ) são exatos.
+    Paginação com 'limite' (até 500) e 'deslocamento'; 'mais' indica se há outra página.
+    """
+    if not catalogo_global.ativo:
+        raise HTTPException(status_code=503, detail="Catálogo de produtos desligado (configure MONXML_CATALOGO).")
+    return await run_in_threadpool(
+        catalogo_global.buscar, q, ncm=ncm, cfop=cfop, cprod=cprod, emitente=emitente,
+        limite=limite, deslocamento=deslocamento
+    )
+
+
+@app.get("/produtos/estatisticas")
+async def estatisticas_catalogo():
+    """
+    Itens no catálogo, lotes indexados/pendentes e tempo gasto na indexação.
+    """
+    return await run_in_threadpool(catalogo_global.estatisticas)
+
+
+# -------------------------------------------------------------------
+# MÉTRICAS (PROMETHEUS)
+# -------------------------------------------------------------------
+def _metricas_cache():
+    stats = cache_global.estatisticas()
+    return [
+        ("monxml_cache_entradas", "gauge", "Documentos no cache de classificação em memória.", stats["entradas"]),
+        ("monxml_cache_acertos_total", "counter", "Consultas ao cache que evitaram o parsing.", stats["acertos"]),
+        ("monxml_cache_falhas_total", "counter", "Consultas ao cache sem resultado.", stats["falhas"]),
+        ("monxml_cache_remocoes_total", "counter", "Entradas removidas do cache (evictions).", stats["remocoes"]),
+    ]
+
+
+registro.coletor(_metricas_cache)
+
+
+def _metricas_catalogo():
+    if not catalogo_global.ativo:
+        return []
+    return [
+        ("monxml_catalogo_itens_indexados_total", "counter", "Itens novos gravados no catálogo de produtos.",
+         catalogo_global.itens_indexados),
+        ("monxml_catalogo_lotes_pendentes", "gauge", "Lotes aguardando indexação no catálogo.",
+         catalogo_global.lotes_pendentes),
+        ("monxml_catalogo_indexacao_segundos_total", "counter", "Tempo gasto indexando o catálogo.",
+         catalogo_global.segundos_indexacao),
+    ]
+
+
+registro.coletor(_metricas_catalogo)
+
+
+def _metricas_admissao():
+    stats = controle_admissao.estatisticas()
+    return [
+        ("monxml_admissao_memoria_bytes", "gauge", "Memória estimada das requisições em processamento.",
+         stats["memoria_em_uso"]),
+        ("monxml_admissao_cpu_vagas", "gauge", "Vagas de CPU ocupadas pelas requisições em processamento.",
+         stats["cpu_em_uso"]),
+        ("monxml_admissao_em_espera", "gauge", "Requisições aguardando orçamento de memória/CPU.", stats["em_espera"]),
+        ("monxml_admissao_rejeitadas_total", "counter", "Requisições recusadas com 503 por falta de orçamento.",
+         stats["rejeitadas"]),
+    ]
+
+
+registro.coletor(_metricas_admissao)
+
+
+def _metricas_resultados():
+    if not armazem_resultados.ativo:
+        return []
+    stats = armazem_resultados.estatisticas()
+    return [
+        ("monxml_resultados_acertos_total", "counter", "Reenvios servidos pelo armazém de resultados.", stats["acertos"]),
+        ("monxml_resultados_falhas_total", "counter", "Consultas ao armazém de resultados sem resultado.",
+         stats["falhas"]),
+        ("monxml_resultados_bytes", "gauge", "Espaço em disco ocupado pelo armazém de resultados.",
+         stats["bytes_em_disco"]),
+        ("monxml_resultados_remocoes_total", "counter", "Resultados removidos por espaço ou TTL.", stats["remocoes"]),
+    ]
+
+
+registro.coletor(_metricas_resultados)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metricas():
+    """
+    Contadores e histogramas no formato texto do Prometheus: documentos por categoria,
+    erros de parsing, bytes de entrada/saída e duração de cada etapa do processamento.
+    """
+    return PlainTextResponse(registro.exportar(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+# -------------------------------------------------------------------
+# API DE JOBS (PROCESSAMENTO EM SEGUNDO PLANO)
+# -------------------------------------------------------------------
+def _status_job(job) -> dict:
+    status = job.como_dict(gerenciador_jobs.ttl)
+    if job.status == CONCLUIDO:
+        status["resultado"] = f"/jobs/{job.id}/resultado"
+    return status
+
+
+@app.post("/jobs/", status_code=202)
+async def criar_job(
+    arquivo: UploadFile = File(...), usar_cache: bool = True, itens: bool = False, compressao: str | None = None
+):
+    """
+    Enfileira um ZIP para processamento em segundo plano e devolve o id do job NA HORA.
+
+    Evita timeouts de proxy em lotes grandes: o cliente acompanha o andamento em
+    GET /jobs/{id} e baixa o resultado em GET /jobs/{id}/resultado.
+    Se a fila estiver cheia, responde 429 com Retry-After.
+    """
+    compressao = politica_da_requisicao(compressao)
+    # "Zip bomb" é recusado já no envio (413); o custo estimado vai com o job e o worker
+    # reserva esse orçamento de memória/CPU antes de processar
+    custo = await custo_do_zip(arquivo.file)
+    try:
+        # A cópia do upload para o diretório de jobs é I/O bloqueante: vai para o threadpool
+        job = await run_in_threadpool(
+            gerenciador_jobs.submeter, arquivo.file, arquivo.filename, custo,
+            OpcoesProcessamento(usar_cache=usar_cache, exportar_itens=itens, compressao=compressao),
+        )
+    except FilaCheia:
+        return JSONResponse(
+            status_code=429,
+            content={"detail": "Fila de processamento cheia. Tente novamente mais tarde."},
+            headers={"Retry-After": str(JOBS_RETRY_AFTER)},
+        )
+
+    return JSONResponse(status_code=202, content=_status_job(job), headers={"Location": f"/jobs/{job.id}"})
+
+
+@app.get("/jobs/{job_id}")
+async def consultar_job(job_id: str):
+    """
+    Andamento do job: status, arquivos processados/total e totais parciais por categoria.
+    """
+    job = gerenciador_jobs.obter(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job não encontrado ou expirado.")
+    return _status_job(job)
+
+
+@app.get("/jobs/{job_id}/resultado")
+async def baixar_resultado_job(job_id: str):
+    """
+    Download do ZIP processado (disponível até o TTL expirar), com os mesmos headers de resumo.
+    """
+    job = gerenciador_jobs.obter(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job não encontrado ou expirado.")
+    if job.status != CONCLUIDO:
+        raise HTTPException(status_code=409, detail=f"Job ainda não concluído (status: {job.status}).")
+
+    return FileResponse(
+        job.caminho_resultado,
         media_type="application/x-zip-compressed",
-        headers={
-            "Content-Disposition": "attachment; filename=xmls_processados.zip"
-        }
+        filename="xmls_processados.zip",
+        headers=montar_headers_resumo(job.dados_gerais),
     )
-PARQUE ESPLANADA III
-"""
+
+
+# -------------------------------------------------------------------
+# UPLOAD EM PEDAÇOS (RETOMÁVEL)
+# -------------------------------------------------------------------
+def _sessao_upload(upload_id: str):
+    try:
+        return gerenciador_uploads.obter(upload_id)
+    except SessaoNaoEncontrada:
+        raise HTTPException(status_code=404, detail="Upload não encontrado ou expirado.")
+
+
+def _intervalo_do_pedaco(content_range: str | None, tamanho: int) -> int:
+    """'Content-Range: bytes 0-1048575/52428800' -> 0 (início do pedaço). 400 se o header for inválido."""
+    try:
+        unidade, intervalo = content_range.split(" ", 1)
+        intervalo, total = intervalo.split("/", 1)
+        inicio, fim = (int(parte) for parte in intervalo.split("-", 1))
+        if unidade != "bytes" or int(total) != tamanho or fim < inicio:
+            raise ValueError
+    except (AttributeError, ValueError):
+        raise HTTPException(
+            status_code=400, detail=f"Content-Range inválido: use 'bytes inicio-fim/{tamanho}'."
+        )
+    return inicio
+
+
+@app.post("/uploads/", status_code=201)
+async def criar_upload(tamanho: int, nome: str = "upload.zip"):
+    """
+    Abre uma sessão de upload em pedaços para um ZIP de 'tamanho' bytes.
+
+    Protocolo: POST /uploads/ -> PUT /uploads/{id} com 'Content-Range' para cada pedaço, em ordem
+    -> POST /uploads/{id}/concluir. Se a conexão cair, GET /uploads/{id} diz de qual byte retomar.
+    Enquanto o upload avança, os XMLs que já chegaram inteiros vão sendo classificados.
+    """
+    try:
+        sessao = await run_in_threadpool(gerenciador_uploads.criar, nome, tamanho)
+    except ValueError as erro:
+        raise HTTPException(status_code=400, detail=str(erro))
+    return JSONResponse(status_code=201, content=sessao.como_dict(), headers={"Location": f"/uploads/{sessao.id}"})
+
+
+@app.put("/uploads/{upload_id}")
+async def enviar_pedaco(upload_id: str, request: Request):
+    """
+    Recebe um pedaço ('Content-Range: bytes inicio-fim/tamanho'). Trechos já recebidos são
+    ignorados (reenvio seguro); um pedaço que começa depois do último byte recebido
+    responde 409 com 'recebido' (de onde o cliente deve continuar).
+    """
+    sessao = _sessao_upload(upload_id)
+    inicio = _intervalo_do_pedaco(request.headers.get("content-range"), sessao.tamanho)
+
+    # Cada parte do corpo vai direto para o arquivo da sessão, no seu deslocamento:
+    # o pedaço nunca fica inteiro na memória
+    posicao = inicio
+    recebido = sessao.recebido
+    try:
+        async for parte in request.stream():
+            if posicao + len(parte) - inicio > UPLOADS_LIMITE_PEDACO:
+                raise HTTPException(status_code=413, detail=f"Pedaço acima de {UPLOADS_LIMITE_PEDACO} bytes.")
+            if parte:
+                recebido = await run_in_threadpool(sessao.escrever, posicao, parte)
+                posicao += len(parte)
+    except PedacoForaDeOrdem as erro:
+        return JSONResponse(status_code=409, content={"detail": str(erro), "recebido": erro.recebido})
+    except ValueError as erro:
+        raise HTTPException(status_code=400, detail=str(erro))
+    except SessaoNaoEncontrada:
+        # Sessão concluída/cancelada enquanto o pedaço chegava
+        raise HTTPException(status_code=404, detail="Upload não encontrado ou expirado.")
+    return {"recebido": recebido, "tamanho": sessao.tamanho}
+
+
+@app.get("/uploads/{upload_id}")
+async def consultar_upload(upload_id: str):
+    """Andamento do upload: bytes recebidos (ponto de retomada) e XMLs já classificados."""
+    return _sessao_upload(upload_id).como_dict()
+
+
+@app.post("/uploads/{upload_id}/concluir")
+async def concluir_upload(
+    request: Request, upload_id: str, usar_cache: bool = True, itens: bool = False, compressao: str | None = None
+):
+    """
+    Processa o ZIP enviado em pedaços e devolve o ZIP de saída, como em /processar-zip/
+    (mesmos parâmetros e headers). Só o que não foi classificado durante o upload ainda
+    passa pelo parsing. 409 se ainda faltarem bytes.
+    """
+    tempos = tempos_da_requisicao(request)
+    compressao = politica_da_requisicao(compressao)
+    sessao = _sessao_upload(upload_id)
+    if not sessao.completa:
+        return JSONResponse(status_code=409, content={
+            "detail": f"Upload incompleto: {sessao.recebido} de {sessao.tamanho} bytes recebidos.",
+            "recebido": sessao.recebido,
+        })
+
+    reserva = await admitir(await custo_do_zip(sessao.caminho))
+    arquivo_zip_saida = SpooledTemporaryFile(max_size=LIMITE_SPOOL)
+    try:
+        with reserva:
+            arquivo_zip_saida, stats = await run_in_threadpool(
+                gerenciador_uploads.concluir, upload_id,
+                OpcoesProcessamento(
+                    destino=arquivo_zip_saida, usar_cache=usar_cache, tempos=tempos, exportar_itens=itens,
+                    compressao=compressao,
+                ),
+            )
+    except BaseException as erro:
+        # Qualquer falha (upload incompleto, ZIP inválido, erro no processamento...) descarta o ZIP de saída
+        arquivo_zip_saida.close()
+        if isinstance(erro, UploadIncompleto):
+            return JSONResponse(status_code=409, content={"detail": str(erro), "recebido": erro.recebido})
+        if isinstance(erro, SessaoNaoEncontrada):
+            raise HTTPException(status_code=404, detail="Upload não encontrado ou expirado.")
+        raise
+
+    return responder_zip(arquivo_zip_saida, stats, tempos, "uploads", sessao.tamanho)
+
+
+@app.delete("/uploads/{upload_id}", status_code=204)
+async def cancelar_upload(upload_id: str):
+    """Descarta a sessão e o que já foi recebido."""
+    try:
+        await run_in_threadpool(gerenciador_uploads.cancelar, upload_id)
+    except SessaoNaoEncontrada:
+        raise HTTPException(status_code=404, detail="Upload não encontrado ou expirado.")
+    return Response(status_code=204)
+
 
 # Bloco para correr o servidor
 if __name__ == "__main__":
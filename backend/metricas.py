@@ -0,0 +1,226 @@
+import time
+import threading
+from contextlib import contextmanager
+
+
+# -------------------------------------------------------------------
+# MÉTRICAS (FORMATO TEXTO DO PROMETHEUS)
+# -------------------------------------------------------------------
+# Implementação mínima de contadores e histogramas, sem dependências externas.
+# No laço quente nada é publicado: o processamento acumula os tempos em variáveis
+# locais / num TempoEtapas e só publica aqui uma vez por lote (um lock por lote).
+
+# Etapas medidas, na ordem em que aparecem no header Server-Timing
+ETAPAS = (
+    "leitura_upload",   # recebimento do corpo da requisição (multipart)
+    "hash_upload",      # SHA-256 do upload (consulta ao armazém de resultados)
+    "indice_zip",       # abertura do ZIP de entrada e leitura do diretório central
+    "cache",            # consultas ao cache de classificação por metadados
+    "descompactacao",   # descompactação dos XMLs que não são copiados em bruto
+    "extracao",         # parsing lxml + classificação (no modo bruto inclui a descompactação em streaming)
+    "gravacao",         # escrita no ZIP de saída (deflate ou cópia bruta)
+    "relatorios",       # geração dos CSVs (e do resumo.json)
+)
+
+# Limites (segundos) dos buckets dos histogramas de latência
+BUCKETS_SEGUNDOS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+class TempoEtapas:
+    """
+    Tempos (em segundos) de cada etapa de UMA requisição/lote.
+
+    Vira o header Server-Timing da resposta e alimenta os histogramas de /metrics.
+    """
+
+    __slots__ = ("duracoes", "inicio")
+
+    def __init__(self, inicio: float | None = None):
+        self.duracoes: dict[str, float] = {}
+        # 'inicio' em time.perf_counter(); padrão: agora
+        self.inicio = time.perf_counter() if inicio is None else inicio
+
+    def adicionar(self, etapa: str, segundos: float) -> None:
+        self.duracoes[etapa] = self.duracoes.get(etapa, 0.0) + segundos
+
+    @contextmanager
+    def medir(self, etapa: str):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.adicionar(etapa, time.perf_counter() - inicio)
+
+    def total(self) -> float:
+        return time.perf_counter() - self.inicio
+
+    def server_timing(self) -> str:
+        """Valor do header Server-Timing (durações em milissegundos)."""
+        partes = [
+            f"{etapa};dur={self.duracoes[etapa] * 1000:.1f}"
+            for etapa in sorted(self.duracoes, key=lambda e: ETAPAS.index(e) if e in ETAPAS else len(ETAPAS))
+        ]
+        partes.append(f"total;dur={self.total() * 1000:.1f}")
+        return ", ".join(partes)
+
+
+def _formatar_rotulos(nomes: tuple, valores: tuple, extra: str = "") -> str:
+    pares = [f'{nome}="{valor}"' for nome, valor in zip(nomes, valores)]
+    if extra:
+        pares.append(extra)
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+
+def _formatar_numero(valor: float) -> str:
+    return str(int(valor)) if float(valor).is_integer() else repr(float(valor))
+
+
+class Contador:
+    def __init__(self, nome: str, ajuda: str, rotulos: tuple = ()):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = rotulos
+        self._valores: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def incrementar(self, valor: float = 1, *rotulos) -> None:
+        with self._lock:
+            self._valores[rotulos] = self._valores.get(rotulos, 0) + valor
+
+    def valor(self, *rotulos) -> float:
+        with self._lock:
+            return self._valores.get(rotulos, 0)
+
+    def exportar(self) -> list[str]:
+        linhas = [f"# HELP {self.nome} {self.ajuda}", f"# TYPE {self.nome} counter"]
+        with self._lock:
+            for rotulos, valor in sorted(self._valores.items()):
+                linhas.append(f"{self.nome}{_formatar_rotulos(self.rotulos, rotulos)} {_formatar_numero(valor)}")
+        return linhas
+
+
+class Histograma:
+    def __init__(self, nome: str, ajuda: str, rotulos: tuple = (), buckets: tuple = BUCKETS_SEGUNDOS):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = rotulos
+        self.buckets = buckets
+        # rotulos -> [contagem por bucket (não cumulativa) + excedente, soma, quantidade]
+        self._series: dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observar(self, valor: float, *rotulos) -> None:
+        with self._lock:
+            serie = self._series.get(rotulos)
+            if serie is None:
+                serie = self._series[rotulos] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            indice = next((i for i, limite in enumerate(self.buckets) if valor <= limite), len(self.buckets))
+            serie[0][indice] += 1
+            serie[1] += valor
+            serie[2] += 1
+
+    def quantidade(self, *rotulos) -> int:
+        with self._lock:
+            serie = self._series.get(rotulos)
+            return serie[2] if serie else 0
+
+    def exportar(self) -> list[str]:
+        linhas = [f"# HELP {self.nome} {self.ajuda}", f"# TYPE {self.nome} histogram"]
+        with self._lock:
+            for rotulos, (contagens, soma, quantidade) in sorted(self._series.items()):
+                acumulado = 0
+                for limite, contagem in zip(self.buckets, contagens):
+                    acumulado += contagem
+                    le = _formatar_rotulos(self.rotulos, rotulos, f'le="{_formatar_numero(limite)}"')
+                    linhas.append(f"{self.nome}_bucket{le} {acumulado}")
+                le = _formatar_rotulos(self.rotulos, rotulos, 'le="+Inf"')
+                linhas.append(f"{self.nome}_bucket{le} {quantidade}")
+                linhas.append(f"{self.nome}_sum{_formatar_rotulos(self.rotulos, rotulos)} {_formatar_numero(soma)}")
+                linhas.append(f"{self.nome}_count{_formatar_rotulos(self.rotulos, rotulos)} {quantidade}")
+        return linhas
+
+
+class RegistroMetricas:
+    """Conjunto de métricas exportadas juntas em /metrics."""
+
+    def __init__(self):
+        self._metricas = []
+        # Funções chamadas na exportação que devolvem [(nome, tipo, ajuda, valor)] de valores
+        # mantidos em outro lugar (ex: contadores do cache de classificação)
+        self._coletores = []
+
+    def contador(self, nome: str, ajuda: str, rotulos: tuple = ()) -> Contador:
+        metrica = Contador(nome, ajuda, rotulos)
+        self._metricas.append(metrica)
+        return metrica
+
+    def histograma(self, nome: str, ajuda: str, rotulos: tuple = (), buckets: tuple = BUCKETS_SEGUNDOS) -> Histograma:
+        metrica = Histograma(nome, ajuda, rotulos, buckets)
+        self._metricas.append(metrica)
+        return metrica
+
+    def coletor(self, funcao) -> None:
+        self._coletores.append(funcao)
+
+    def exportar(self) -> str:
+        linhas = []
+        for metrica in self._metricas:
+            linhas.extend(metrica.exportar())
+        for funcao in self._coletores:
+            for nome, tipo, ajuda, valor in funcao():
+                linhas.extend([f"# HELP {nome} {ajuda}", f"# TYPE {nome} {tipo}", f"{nome} {_formatar_numero(valor)}"])
+        return "\n".join(linhas) + "\n"
+
+
+# Registro único do processo, exportado em GET /metrics
+registro = RegistroMetricas()
+
+REQUISICOES = registro.contador("monxml_requisicoes_total", "Requisições de processamento recebidas.", ("endpoint",))
+DOCUMENTOS = registro.contador("monxml_documentos_total", "XMLs processados por categoria.", ("categoria",))
+ERROS_PARSE = registro.contador("monxml_erros_parse_total", "XMLs corrompidos ou inválidos (ERRO_PARSE).")
+BYTES_XML = registro.contador("monxml_bytes_xml_total", "Bytes de XML (descompactado) processados.")
+BYTES_ENTRADA = registro.contador("monxml_bytes_entrada_total", "Bytes recebidos no corpo das requisições.", ("endpoint",))
+BYTES_SAIDA = registro.contador("monxml_bytes_saida_total", "Bytes de ZIP devolvidos nas respostas.", ("endpoint",))
+DURACAO_ETAPA = registro.histograma("monxml_etapa_segundos", "Duração de cada etapa por lote.", ("etapa",))
+DURACAO_REQUISICAO = registro.histograma("monxml_requisicao_segundos", "Duração total das requisições.", ("endpoint",))
+
+
+def registrar_lote(tempos: TempoEtapas, dados_gerais: dict, erros_parse: int, bytes_xml: int) -> None:
+    """Publica os números de um lote processado (chamado uma vez, no fim do lote)."""
+    for categoria, totais in dados_gerais.items():
+        if totais["qtd"]:
+            DOCUMENTOS.incrementar(totais["qtd"], categoria)
+    if erros_parse:
+        ERROS_PARSE.incrementar(erros_parse)
+    BYTES_XML.incrementar(bytes_xml)
+    for etapa, segundos in tempos.duracoes.items():
+        DURACAO_ETAPA.observar(segundos, etapa)
+
+
+def registrar_requisicao(endpoint: str, duracao: float, bytes_entrada: int | None, bytes_saida: int | None) -> None:
+    """Publica os números de uma requisição HTTP concluída."""
+    REQUISICOES.incrementar(1, endpoint)
+    DURACAO_REQUISICAO.observar(duracao, endpoint)
+    if bytes_entrada:
+        BYTES_ENTRADA.incrementar(bytes_entrada, endpoint)
+    if bytes_saida:
+        BYTES_SAIDA.incrementar(bytes_saida, endpoint)
+
+
+class MiddlewareInicioRequisicao:
+    """
+    Middleware ASGI que anota no 'scope' o instante em que a requisição chegou.
+
+    O FastAPI lê o multipart ANTES de chamar o endpoint; com esta marca o endpoint
+    consegue medir quanto tempo foi gasto recebendo o upload.
+    """
+
+    CHAVE = "monxml.inicio"
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            scope[self.CHAVE] = time.perf_counter()
+        await self.app(scope, receive, send)
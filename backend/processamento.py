@@ -0,0 +1,973 @@
+import io
+import os
+import csv
+import json
+import time
+import zipfile
+import shutil
+import tempfile
+import threading
+import contextlib
+import multiprocessing
+from itertools import repeat
+from dataclasses import dataclass, replace
+from typing import BinaryIO, Callable, Iterable, NamedTuple
+from concurrent.futures import ProcessPoolExecutor
+
+# Importamos 'etree' do lxml apenas para capturar erros de parsing
+from lxml import etree as ET
+
+# Motor de extração em passagem única (iterparse) usado na classificação
+from extracao import DadosNFe, extrair_dados_nfe, extrair_resumo_nfe
+# Cópia de membros já comprimidos, sem passar por descompressão + deflate de novo
+from zip_bruto import suporta_copia_bruta
+# Compressão das entradas do ZIP de saída em paralelo (pool de threads) e políticas de nível
+from compressao import GravadorParalelo, POLITICAS, POLITICAS_COPIA_BRUTA, validar_politica
+# Cache de resultados por (CRC32, tamanho) do diretório central
+from cache_classificacao import cache_global, chave_cache
+# Tempos por etapa (Server-Timing) e contadores/histogramas de /metrics
+from metricas import TempoEtapas, registrar_lote
+# Itens das notas (det/prod) em colunas tipadas, exportados como 'itens.mxc'
+from colunar import ColunasItens, NOME_ARQUIVO_ITENS
+# Campos de cabeçalho (emitente, CFOP, data, totais) em colunas para a agregação vetorizada
+from agregacao import ColunasCabecalhos
+# Catálogo persistente de produtos (SQLite FTS5), alimentado em segundo plano
+from catalogo import catalogo_global
+# Estimativa de custo (controle de admissão) e limites contra "zip bomb"
+from admissao import Custo, custo_de_membros, verificar_descompressao
+
+
+# -------------------------------------------------------------------
+# CONFIGURAÇÃO DO MODO PARALELO (variáveis de ambiente)
+# -------------------------------------------------------------------
+# Quantidade de processos do pool (padrão: um por núcleo de CPU)
+PROCESSOS = int(os.environ.get("MONXML_PROCESSOS", os.cpu_count() or 1))
+# Quantidade de membros do ZIP entregues a cada worker por vez
+TAMANHO_LOTE = int(os.environ.get("MONXML_TAMANHO_LOTE", "500"))
+# Abaixo desta quantidade de XMLs o custo de despachar para outros processos
+# supera o ganho, então o lote é processado em série na própria thread
+MIN_ARQUIVOS_PARALELO = int(os.environ.get("MONXML_MIN_ARQUIVOS_PARALELO", "2000"))
+
+# Ordem fixa das categorias (pastas do ZIP de saída e linhas do relatório geral)
+CATEGORIAS = ['aprovados', 'contingencia', 'rejeitados', 'cancelados', 'eventos']
+# Categorias de notas autorizadas: as únicas que um evento de cancelamento do lote pode mudar
+AUTORIZADAS = ('aprovados', 'contingencia')
+
+# Eventos que cancelam a nota: cancelamento (110111) e cancelamento por substituição (110112)
+EVENTOS_CANCELAMENTO = ('110111', '110112')
+# cStat do retorno de um cancelamento homologado: registrado e vinculado à NF-e (135) ou homologado
+# fora de prazo (155). O 136 ("registrado, mas não vinculado a NF-e") fica de fora: o evento não foi
+# vinculado à nota na SEFAZ, então não basta para tirá-la dos aprovados.
+CSTAT_EVENTO_REGISTRADO = ('135', '155')
+
+
+# -------------------------------------------------------------------
+# REGRAS DE NEGÓCIO (CLASSIFICAÇÃO)
+# -------------------------------------------------------------------
+def classificar(dados: DadosNFe) -> str:
+    """
+    Aplica as regras SEFAZ e devolve a categoria (nome da pasta de destino).
+
+    - REGRA 0: Eventos (procEventoNFe: cancelamento, carta de correção...) -> 'eventos'
+    - REGRA 1: cStat diferente de 100 (Autorizado) e 150 (Autorizado Fora de Prazo) -> 'rejeitados'
+    - REGRA 2: tpEmis = 1 (Emissão Normal) -> 'aprovados'
+    - REGRA 3: Outros tpEmis (ex: 9) -> 'contingencia'
+
+    'cancelados' não sai daqui: depende de um evento que pode estar em outro arquivo
+    do lote (ver 'IndiceCancelamentos').
+    """
+    if dados.tp_evento is not None:
+        return 'eventos'
+    if dados.cstat not in ['100', '150']:
+        return 'rejeitados'
+    if dados.tpemis == '1':
+        return 'aprovados'
+    return 'contingencia'
+
+
+def cancela_nota(dados: DadosNFe) -> bool:
+    """Diz se o documento é um evento de cancelamento registrado pela SEFAZ."""
+    return dados.tp_evento in EVENTOS_CANCELAMENTO and dados.cstat in CSTAT_EVENTO_REGISTRADO and bool(dados.chave)
+
+
+def extrair_ou_none(
+    origem,
+    nome_arquivo: str,
+    itens: ColunasItens | None = None,
+    cabecalhos: ColunasCabecalhos | None = None,
+    arvore: bool = False,
+) -> DadosNFe | None:
+    """
+    Executa o motor de extração, devolvendo None se o XML estiver corrompido.
+    Com 'itens' / 'cabecalhos', os det/prod e os campos de cabeçalho do documento
+    são coletados na mesma passagem. Com 'arvore' (só para bytes, sem coletores),
+    usa o motor em árvore 'extrair_resumo_nfe'.
+    """
+    try:
+        if arvore:
+            return extrair_resumo_nfe(origem)
+        return extrair_dados_nfe(origem, itens, cabecalhos)
+    except ET.ParseError:
+        # Se o arquivo .xml estiver corrompido ou mal formatado
+        print(f"Erro ao analisar o XML: {nome_arquivo}")
+        return None
+
+
+class ResumoLote:
+    """
+    Acumuladores do lote: totais por categoria e lista de rejeições.
+
+    Centraliza a contabilidade para que o modo serial e o paralelo produzam
+    exatamente os mesmos números (os registros são sempre somados na ordem do ZIP).
+    """
+
+    def __init__(self):
+        # Listas para guardar tuplas (nome_arquivo, cstat, xmotivo)
+        self.lista_detalhes_rejeicao = []
+        # Notas canceladas por um evento do lote: (nome_arquivo, chave, nome_do_evento)
+        self.lista_cancelamentos = []
+        # XMLs corrompidos (contados à parte para /metrics)
+        self.erros_parse = 0
+
+        # Estrutura de acumuladores para o relatório geral (qtd, valor, icms)
+        self.dados_gerais = {
+            cat: {"qtd": 0, "valor": 0.0, "icms": 0.0} for cat in CATEGORIAS
+        }
+        # Valor e ICMS de cada categoria em centavos (inteiros): somas e cancelamentos exatos,
+        # sem resíduos de ponto flutuante (ex: -1.4e-14) nos headers X-Value-* e no CSV
+        self._centavos = {cat: [0, 0] for cat in CATEGORIAS}
+
+    def _somar(self, categoria: str, dados: DadosNFe, sinal: int = 1) -> None:
+        # Soma (ou subtrai) o documento da categoria e recalcula o valor/ICMS a partir dos centavos
+        centavos = self._centavos[categoria]
+        centavos[0] += sinal * round(dados.v_nf * 100)
+        centavos[1] += sinal * round(dados.v_icms * 100)
+        acumulador = self.dados_gerais[categoria]
+        acumulador["qtd"] += sinal
+        acumulador["valor"] = centavos[0] / 100
+        acumulador["icms"] = centavos[1] / 100
+
+    def registrar(self, nome_limpo: str, dados: DadosNFe | None) -> str:
+        """
+        Classifica um documento, soma nos totais e devolve a categoria.
+
+        Args:
+            nome_limpo (str): Nome do arquivo já "achatado" (sem pastas).
+            dados (DadosNFe | None): Resultado da extração ou None se o XML for inválido.
+        """
+        if dados is None:
+            self.erros_parse += 1
+            self.dados_gerais["rejeitados"]["qtd"] += 1
+            self.lista_detalhes_rejeicao.append([nome_limpo, "ERRO_PARSE", "Arquivo XML inválido ou corrompido"])
+            return 'rejeitados'
+
+        categoria = classificar(dados)
+        self._somar(categoria, dados)
+
+        if categoria == 'rejeitados':
+            self.lista_detalhes_rejeicao.append([nome_limpo, dados.cstat, dados.xmotivo])
+
+        return categoria
+
+    def cancelar(self, nome_limpo: str, dados: DadosNFe, categoria: str, nome_evento: str) -> str:
+        """
+        Move uma nota já registrada em 'categoria' (autorizada) para 'cancelados',
+        corrigindo os totais das duas categorias. Devolve a nova categoria.
+        """
+        self._somar(categoria, dados, -1)
+        self._somar('cancelados', dados)
+        self.lista_cancelamentos.append([nome_limpo, dados.chave, nome_evento])
+        return 'cancelados'
+
+    def gravar_relatorios(self, zip_out: zipfile.ZipFile) -> None:
+        """
+        Grava o relatório de rejeições (se houver) e o relatório geral no ZIP de saída.
+        """
+        # --- GERAÇÃO DO RELATÓRIO DE REJEIÇÕES (CSV) ---
+        if self.lista_detalhes_rejeicao:
+            csv_buffer = io.StringIO()
+            writer = csv.writer(csv_buffer, delimiter=';') # Ponto e vírgula para Excel PT-BR
+            writer.writerow(['Nome do Arquivo', 'Código Status (cStat)', 'Motivo (xMotivo)'])
+            writer.writerows(self.lista_detalhes_rejeicao)
+
+            # Grava o CSV no ZIP
+            zip_out.writestr('rejeitados/relatorio_erros.csv', csv_buffer.getvalue().encode('utf-8-sig')) # utf-8-sig para Excel abrir direto
+
+        # --- RELATÓRIO DE CANCELAMENTOS (CSV) ---
+        if self.lista_cancelamentos:
+            csv_buffer = io.StringIO()
+            writer = csv.writer(csv_buffer, delimiter=';')
+            writer.writerow(['Nome do Arquivo', 'Chave de Acesso', 'Evento de Cancelamento'])
+            writer.writerows(self.lista_cancelamentos)
+            zip_out.writestr('cancelados/relatorio_cancelamentos.csv', csv_buffer.getvalue().encode('utf-8-sig'))
+
+        # --- GERAÇÃO DO RELATÓRIO GERAL (CSV) ---
+        csv_buffer_geral = io.StringIO()
+        writer_geral = csv.writer(csv_buffer_geral, delimiter=';')
+        writer_geral.writerow(['Categoria', 'Quantidade', 'Valor Total (R$)', 'ICMS Total (R$)'])
+
+        total_qtd = 0
+        for cat in CATEGORIAS:
+            dados = self.dados_gerais[cat]
+            writer_geral.writerow([
+                cat.capitalize(),
+                dados['qtd'],
+                f"{dados['valor']:.2f}".replace('.', ','),
+                f"{dados['icms']:.2f}".replace('.', ',')
+            ])
+            total_qtd += dados['qtd']
+        # Totais gerais também a partir dos centavos
+        total_valor = sum(centavos[0] for centavos in self._centavos.values()) / 100
+        total_icms = sum(centavos[1] for centavos in self._centavos.values()) / 100
+
+        writer_geral.writerow([
+            'TOTAL GERAL',
+            total_qtd,
+            f"{total_valor:.2f}".replace('.', ','),
+            f"{total_icms:.2f}".replace('.', ',')
+        ])
+
+        zip_out.writestr('relatorio_geral.csv', csv_buffer_geral.getvalue().encode('utf-8-sig'))
+
+    def gravar_resumo_json(self, zip_out: zipfile.ZipFile) -> None:
+        """
+        Grava 'resumo.json' (os mesmos totais dos headers X-Count/X-Value/X-Icms) no ZIP de saída.
+        """
+        zip_out.writestr('resumo.json', json.dumps(self.dados_gerais, ensure_ascii=False, indent=2))
+
+    def como_dict(self) -> dict:
+        """Totais por categoria e lista de rejeições, para as respostas em JSON (modo só resumo)."""
+        return {
+            "total": sum(dados["qtd"] for dados in self.dados_gerais.values()),
+            "dados_gerais": self.dados_gerais,
+            "erros_parse": self.erros_parse,
+            "rejeitados": [
+                {"arquivo": nome, "cstat": cstat, "xmotivo": xmotivo}
+                for nome, cstat, xmotivo in self.lista_detalhes_rejeicao
+            ],
+            "cancelados": [
+                {"arquivo": nome, "chave": chave, "evento": evento}
+                for nome, chave, evento in self.lista_cancelamentos
+            ],
+        }
+
+
+class NotaAutorizada(NamedTuple):
+    """Registro compacto de uma nota autorizada que ainda pode ser cancelada por um evento do lote."""
+    indice: int             # posição do membro no ZIP de entrada (regravado no fim, sem novo parsing)
+    nome_limpo: str
+    categoria: str
+    dados: DadosNFe
+    linha: int | None       # linha nas colunas de itens/cabeçalhos (None se não foi coletada)
+
+
+class IndiceCancelamentos:
+    """
+    Correlação entre notas e eventos de cancelamento do MESMO lote, pela chave de acesso.
+
+    Montado na passagem única pelos membros: os eventos de cancelamento registrados entram
+    em 'canceladas' (chave -> arquivo do evento). Uma nota autorizada cujo cancelamento já
+    passou vai direto para 'cancelados'; as demais ficam em 'notas' (posição no ZIP + DadosNFe)
+    até o fim do lote, quando 'resolver' aplica os cancelamentos que vieram depois delas.
+    Só ficam na memória as chaves e esses registros compactos, nunca as árvores nem os bytes.
+    """
+
+    def __init__(self):
+        self.canceladas: dict[str, str] = {}
+        self.notas: list[NotaAutorizada] = []
+        # Linha das colunas de itens/cabeçalhos -> categoria corrigida
+        self.linhas_corrigidas: dict[int, str] = {}
+
+    def registrar(
+        self, resumo: ResumoLote, indice: int, nome_limpo: str, categoria: str, dados: DadosNFe, linha: int | None
+    ) -> str | None:
+        """
+        Indexa um documento já registrado no resumo. Devolve a categoria final de um documento
+        que já pode ser gravado, ou None se a nota precisa esperar o fim do lote.
+        """
+        if categoria == 'eventos':
+            if cancela_nota(dados):
+                self.canceladas.setdefault(dados.chave, nome_limpo)
+            return categoria
+        if categoria not in AUTORIZADAS or not dados.chave:
+            return categoria
+        nota = NotaAutorizada(indice, nome_limpo, categoria, dados, linha)
+        if dados.chave in self.canceladas:
+            return self._cancelar(resumo, nota)
+        self.notas.append(nota)
+        return None
+
+    def resolver(self, resumo: ResumoLote):
+        """Fim do lote: devolve (nota, categoria final) das notas que esperaram, na ordem do ZIP."""
+        for nota in self.notas:
+            if nota.dados.chave in self.canceladas:
+                yield nota, self._cancelar(resumo, nota)
+            else:
+                yield nota, nota.categoria
+
+    def _cancelar(self, resumo: ResumoLote, nota: NotaAutorizada) -> str:
+        categoria = resumo.cancelar(nota.nome_limpo, nota.dados, nota.categoria, self.canceladas[nota.dados.chave])
+        if nota.linha is not None:
+            self.linhas_corrigidas[nota.linha] = categoria
+        return categoria
+
+
+def gravar_itens(itens: ColunasItens, zip_out: zipfile.ZipFile) -> None:
+    """
+    Grava as colunas de itens como 'itens.mxc' no ZIP de saída, direto dos buffers
+    (sem montar uma cópia do arquivo em memória).
+    """
+    zip64 = itens.tamanho_estimado() > zipfile.ZIP64_LIMIT * 0.9
+    with zip_out.open(NOME_ARQUIVO_ITENS, 'w', force_zip64=zip64) as destino:
+        itens.gravar(destino)
+
+
+def listar_xmls(zip_in: zipfile.ZipFile) -> list[zipfile.ZipInfo]:
+    """
+    Membros XML do ZIP, na ordem do diretório central. Nomes repetidos continuam sendo
+    membros distintos ('getinfo' devolveria só o último): cada um é identificado pela
+    posição do header local ('header_offset').
+    """
+    # Ignoramos arquivos que não sejam XML (ex: imagens, txt, pastas ocultas)
+    return [info for info in zip_in.infolist() if info.filename.lower().endswith('.xml')]
+
+
+def estimar_custo(origem: bytes | str | os.PathLike | BinaryIO, processos: int | None = None) -> Custo:
+    """
+    Custo (memória e vagas de CPU) de 'processar_zip_sync' para este ZIP, lendo só o diretório
+    central. Usado pelo controle de admissão antes de o processamento começar.
+    O cursor de um objeto arquivo volta ao início (o upload ainda vai ser lido/copiado).
+
+    Raises:
+        DescompressaoExcessiva: Se o ZIP passar dos limites de descompressão.
+    """
+    processos = processos or PROCESSOS
+    if isinstance(origem, (bytes, bytearray)):
+        origem = io.BytesIO(origem)
+    try:
+        with zipfile.ZipFile(origem) as zip_in:
+            infos = listar_xmls(zip_in)
+    except zipfile.BadZipFile:
+        # Só vai gerar o 'ERRO.txt'
+        return custo_de_membros([])
+    finally:
+        if hasattr(origem, "seek"):
+            origem.seek(0)
+    verificar_descompressao(infos)
+    paralelo = processos > 1 and len(infos) >= MIN_ARQUIVOS_PARALELO
+    return custo_de_membros((info.file_size for info in infos), processos if paralelo else 1)
+
+
+# -------------------------------------------------------------------
+# MODO PARALELO (PROCESS POOL)
+# -------------------------------------------------------------------
+# Pools reaproveitados entre requisições (o custo de subir processos é pago uma vez só)
+_pools: dict[int, ProcessPoolExecutor] = {}
+_pools_lock = threading.Lock()
+
+
+def _obter_pool(processos: int) -> ProcessPoolExecutor:
+    with _pools_lock:
+        pool = _pools.get(processos)
+        if pool is None:
+            # O servidor é multi-thread (threadpool, streaming, jobs): 'fork' poderia copiar
+            # locks travados para o filho. 'forkserver' (ou 'spawn', no Windows) é seguro.
+            metodo = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            pool = ProcessPoolExecutor(max_workers=processos, mp_context=multiprocessing.get_context(metodo))
+            _pools[processos] = pool
+        return pool
+
+
+def _classificar_lote(
+    caminho_zip: str,
+    posicoes: list[int],
+    exportar_itens: bool = False,
+    coletar_cabecalhos: bool = False,
+    arvore: bool = False,
+) -> tuple[list[DadosNFe | None], ColunasItens | None, ColunasCabecalhos | None]:
+    """
+    Executada DENTRO do processo worker.
+
+    Recebe apenas o caminho do ZIP e as posições dos headers locais dos membros (nada de
+    bytes de XML trafegando via pickle; a posição distingue membros de mesmo nome): cada
+    worker abre o arquivo por conta própria e descompacta o membro em streaming direto
+    para o motor de extração.
+
+    Com 'exportar_itens' / 'coletar_cabecalhos', devolve também as colunas de itens e de
+    cabeçalhos do lote (já com os documentos concluídos), que o processo principal
+    concatena na ordem dos lotes. Com 'arvore', cada membro é lido inteiro e vai para
+    o motor em árvore (modo só resumo).
+    """
+    resultados = []
+    itens = ColunasItens() if exportar_itens else None
+    cabecalhos = ColunasCabecalhos() if coletar_cabecalhos else None
+    with zipfile.ZipFile(caminho_zip, 'r') as zip_in:
+        membros = {info.header_offset: info for info in zip_in.infolist()}
+        for posicao in posicoes:
+            info = membros[posicao]
+            nome_arquivo = info.filename
+            if arvore:
+                dados = extrair_ou_none(zip_in.read(info), nome_arquivo, arvore=True)
+            else:
+                with zip_in.open(info) as membro:
+                    dados = extrair_ou_none(membro, nome_arquivo, itens, cabecalhos)
+            resultados.append(dados)
+            if dados is not None and (itens is not None or cabecalhos is not None):
+                categoria = classificar(dados)
+                if itens is not None:
+                    itens.concluir_documento(os.path.basename(nome_arquivo), categoria)
+                if cabecalhos is not None:
+                    cabecalhos.concluir_documento(categoria)
+    return resultados, itens, cabecalhos
+
+
+def _classificar_em_paralelo(
+    caminho_zip: str,
+    posicoes: list[int],
+    processos: int,
+    tamanho_lote: int,
+    itens: ColunasItens | None = None,
+    cabecalhos: ColunasCabecalhos | None = None,
+    arvore: bool = False,
+):
+    """
+    Distribui os membros em lotes pelo pool e devolve um iterador de DadosNFe | None
+    na MESMA ordem de 'posicoes' (o 'map' do executor preserva a ordem dos lotes).
+    """
+    lotes = [posicoes[i:i + tamanho_lote] for i in range(0, len(posicoes), tamanho_lote)]
+    pool = _obter_pool(processos)
+    mapa = pool.map(
+        _classificar_lote, repeat(caminho_zip), lotes, repeat(itens is not None), repeat(cabecalhos is not None),
+        repeat(arvore)
+    )
+    for resultados, itens_lote, cabecalhos_lote in mapa:
+        if itens is not None:
+            itens.estender(itens_lote)
+        if cabecalhos is not None:
+            cabecalhos.estender(cabecalhos_lote)
+        yield from resultados
+
+
+# -------------------------------------------------------------------
+# LÓGICA DE PROCESSAMENTO (SÍNCRONA / CPU-BOUND)
+# -------------------------------------------------------------------
+@dataclass
+class OpcoesProcessamento:
+    """
+    Opções de 'processar_zip_sync': o que muda na saída (compressão, itens, resumo...) e os
+    objetos que acompanham o lote (destino, tempos, coletores, callbacks). O padrão de cada
+    campo é o comportamento de '/processar-zip/'. Quem repassa opções de outra camada acrescenta
+    as suas com 'dataclasses.replace', sem alterar o objeto recebido.
+
+    Atributos:
+        processos (int | None): Quantidade de processos (padrão: MONXML_PROCESSOS). 1 força o modo serial.
+        tamanho_lote (int | None): Membros por lote enviado a cada worker (padrão: MONXML_TAMANHO_LOTE).
+        destino (BinaryIO | None): Onde gravar o ZIP de saída. Se omitido, usa um buffer em memória.
+            Pode ser um objeto não-seekable (ex: streaming.CanalSaida): o zipfile passa a usar
+            data descriptors e grava o diretório central no final.
+        incluir_resumo (bool): Grava 'resumo.json' (os mesmos totais dos headers X-Count/X-Value/X-Icms)
+            como última entrada do ZIP. Necessário quando os headers saem antes do processamento.
+        copia_bruta (bool): Copia os membros DEFLATED para o ZIP de saída sem recomprimir (bytes
+            e CRC32 originais). Membros com outros métodos seguem o caminho normal (writestr).
+            Só vale com as políticas de POLITICAS_COPIA_BRUTA ('rapida', 'padrao').
+        usar_cache (bool): Consulta/alimenta o cache de classificação do processo (cache_global).
+            False força a análise de todos os XMLs desta requisição.
+        progresso (callable | None): Chamada como progresso(processados, total, dados_gerais) no início
+            e após cada XML gravado. Usada pela API de jobs para reportar o andamento.
+        tempos (TempoEtapas | None): Recebe o tempo de cada etapa (vira o header Server-Timing).
+            Com ou sem ele, os números do lote são publicados em /metrics no final.
+        exportar_itens (bool): Extrai os itens (det/prod) de cada nota na mesma passagem do
+            parsing e grava 'itens.mxc' (formato colunar tipado, ver 'colunar.py') no ZIP de saída.
+            Como um acerto de cache pularia o parsing, o cache não é consultado neste modo.
+        cabecalhos (ColunasCabecalhos | None): Recebe uma linha por XML válido (emitente,
+            destinatário, UFs, data, CFOP, vNF, vICMS, vST, vIPI) para 'agregacao.agregar'.
+            Também dispensa o cache, pelo mesmo motivo.
+        indexar_catalogo (bool | None): Entrega os itens analisados ao catálogo de produtos
+            (catalogo_global), que os indexa em segundo plano. Padrão: sempre que o catálogo
+            estiver ligado (MONXML_CATALOGO). Aqui o cache continua valendo: um acerto é um
+            documento já analisado (e catalogado) antes.
+        compressao (str | None): Política de compressão do ZIP de saída ('armazenar', 'rapida',
+            'padrao' ou 'maxima'; padrão: MONXML_COMPRESSAO). As entradas são comprimidas em
+            paralelo (compressao.GravadorParalelo); as cópias brutas não são afetadas.
+        classificados (dict[int, DadosNFe] | None): Membros já classificados antes do processamento
+            (posição do header local -> DadosNFe), como os do upload em pedaços ('uploads.SessaoUpload').
+            Funcionam como acertos de cache. Ignorados na exportação de itens / coleta de cabeçalhos.
+        somente_resumo (bool): Só classifica e soma: o ZIP de saída NÃO é montado (nada é
+            comprimido nem gravado, nem os CSVs) e, sem cabeçalhos/catálogo a coletar, os XMLs
+            vão para o motor em árvore ('extrair_resumo_nfe'). Retorna None no lugar do ZIP.
+            'destino', 'incluir_resumo', 'exportar_itens' e 'compressao' são ignorados.
+            Ver 'resumir_zip_sync'.
+        resumo (ResumoLote | None): Recebe os totais e a lista de rejeições do lote (um novo
+            ResumoLote é usado se omitido).
+        observador (callable | None): Chamada como observador(nome_limpo, categoria, dados) assim que
+            cada XML é classificado (dados None = XML inválido). Uma nota cancelada por um evento
+            que vem depois dela no ZIP é informada de novo no fim do lote, com 'cancelados'.
+            Usada pelo acompanhamento em NDJSON/SSE ('acompanhamento.py').
+    """
+    processos: int | None = None
+    tamanho_lote: int | None = None
+    destino: BinaryIO | None = None
+    incluir_resumo: bool = False
+    copia_bruta: bool = True
+    usar_cache: bool = True
+    progresso: Callable | None = None
+    tempos: TempoEtapas | None = None
+    exportar_itens: bool = False
+    cabecalhos: ColunasCabecalhos | None = None
+    indexar_catalogo: bool | None = None
+    compressao: str | None = None
+    classificados: dict[int, DadosNFe] | None = None
+    somente_resumo: bool = False
+    resumo: ResumoLote | None = None
+    observador: Callable | None = None
+
+
+def processar_zip_sync(
+    conteudo_zip_recebido: bytes | str | os.PathLike | BinaryIO,
+    opcoes: OpcoesProcessamento | None = None,
+) -> tuple[BinaryIO | None, dict]:
+    """
+    Função síncrona que processa o arquivo ZIP recebido.
+
+    MOTIVO DE SER SÍNCRONA:
+    O processamento de arquivos ZIP e parsing de XML são tarefas intensivas em CPU (CPU-bound).
+    Em Python, código síncrono CPU-bound bloqueia o Event Loop do asyncio.
+    Para evitar travar o servidor, isolamos esta lógica nesta função e a chamamos via 'run_in_threadpool'.
+
+    MODO PARALELO:
+    Lotes grandes (a partir de MIN_ARQUIVOS_PARALELO XMLs) têm a extração/classificação
+    distribuída em um ProcessPoolExecutor. Os resultados são consumidos na ordem do ZIP,
+    então totais, CSVs e ZIP de saída são idênticos aos do modo serial.
+
+    CANCELAMENTOS:
+    Eventos (procEventoNFe) vão para 'eventos/'. Uma nota autorizada com evento de cancelamento
+    registrado no mesmo lote vai para 'cancelados/' e sai dos totais de aprovados/contingência,
+    em qualquer ordem dos arquivos no ZIP e numa passagem única: as chaves de acesso são
+    indexadas durante o laço ('IndiceCancelamentos'). Os demais documentos são gravados na hora;
+    das notas autorizadas ficam só a posição e o DadosNFe, e elas são gravadas no fim do lote, já
+    na pasta final, por cópia bruta (sem cópia bruta, o membro é relido do ZIP de entrada).
+
+    Args:
+        conteudo_zip_recebido (bytes | str | os.PathLike | BinaryIO): O ZIP enviado pelo usuário:
+            bytes, caminho em disco ou um objeto arquivo seekable (ex: o SpooledTemporaryFile do
+            upload). Com caminho/arquivo o ZIP nunca é carregado inteiro na memória: os membros
+            são descompactados um de cada vez.
+        opcoes (OpcoesProcessamento | None): Ver 'OpcoesProcessamento' (padrão: todas as opções padrão).
+
+    Returns:
+        tuple[BinaryIO | None, dict]: O ZIP de saída (o próprio 'destino', se informado; None no modo
+            só resumo) e os totais por categoria (dados_gerais).
+
+    Raises:
+        DescompressaoExcessiva: Se os tamanhos do diretório central passarem dos limites de 'admissao.py'.
+        zipfile.BadZipFile: No modo só resumo, se a entrada não for um ZIP (sem ZIP de saída para o 'ERRO.txt').
+    """
+    opcoes = OpcoesProcessamento() if opcoes is None else opcoes
+    processos = opcoes.processos or PROCESSOS
+    tamanho_lote = opcoes.tamanho_lote or TAMANHO_LOTE
+    tempos = TempoEtapas() if opcoes.tempos is None else opcoes.tempos
+    somente_resumo = opcoes.somente_resumo
+    exportar_itens = opcoes.exportar_itens and not somente_resumo
+    cabecalhos = opcoes.cabecalhos
+    progresso = opcoes.progresso
+    observador = opcoes.observador
+    agora = time.perf_counter
+
+    # Lógica de tracking para relatório e resumo
+    resumo = ResumoLote() if opcoes.resumo is None else opcoes.resumo
+    # Chaves de acesso das notas autorizadas e dos cancelamentos do lote
+    cancelamentos = IndiceCancelamentos()
+    bytes_xml = 0
+
+    # Cache de classificação compartilhado entre requisições (None = desligado).
+    # Na exportação de itens / coleta de cabeçalhos todo XML precisa ser analisado, então o cache fica de fora.
+    coletando = exportar_itens or cabecalhos is not None
+    cache = cache_global if opcoes.usar_cache and cache_global.ativo and not coletando else None
+    indexar = catalogo_global.ativo and opcoes.indexar_catalogo is not False
+    itens = ColunasItens() if exportar_itens or indexar else None
+    if indexar and cabecalhos is None:
+        cabecalhos = ColunasCabecalhos()
+    # Só resumo e nada a coletar: motor em árvore sobre os bytes do membro (ver 'extrair_resumo_nfe')
+    arvore = somente_resumo and itens is None and cabecalhos is None
+    # Linhas já existentes nas colunas recebidas do chamador (as deste lote vêm depois)
+    base_cabecalhos = len(cabecalhos) if cabecalhos is not None else 0
+    linhas_coletadas = 0
+
+    # Criamos um buffer em memória para o ZIP de saída (evita gravar em disco = + performance)
+    if somente_resumo:
+        memoria_zip_saida = None
+    else:
+        memoria_zip_saida = io.BytesIO() if opcoes.destino is None else opcoes.destino
+
+    # Arquivo temporário criado só quando o modo paralelo precisa de um caminho em disco
+    caminho_temporario = None
+
+    if isinstance(conteudo_zip_recebido, (bytes, bytearray)):
+        origem = io.BytesIO(conteudo_zip_recebido)
+    else:
+        origem = conteudo_zip_recebido
+
+    # Abrimos o ZIP de saída em modo de escrita ('w') com o método/nível da política (relatórios inclusos).
+    # No modo só resumo não existe ZIP de saída: 'zip_out' e 'gravador' ficam None.
+    politica = validar_politica(opcoes.compressao)
+    metodo, nivel = POLITICAS[politica]
+    # 'armazenar'/'maxima' valem também para os membros DEFLATED: sem cópia bruta, eles são recomprimidos
+    copia_bruta = opcoes.copia_bruta and politica in POLITICAS_COPIA_BRUTA
+    if somente_resumo:
+        saida = contextlib.nullcontext()
+    else:
+        saida = zipfile.ZipFile(memoria_zip_saida, 'w', metodo, compresslevel=nivel)
+    with saida as zip_out:
+        # Os XMLs são comprimidos num pool de threads e gravados na ordem do ZIP de entrada
+        gravador = None if somente_resumo else GravadorParalelo(zip_out, opcoes.compressao)
+
+        # Abrimos o ZIP de entrada a partir dos bytes recebidos
+        try:
+            inicio = agora()
+            with zipfile.ZipFile(origem, 'r') as zip_in:
+                infos = listar_xmls(zip_in)
+                nomes = [info.filename for info in infos]
+                # Tamanhos declarados conferidos antes de descompactar qualquer membro
+                verificar_descompressao(infos)
+                bytes_xml = sum(info.file_size for info in infos)
+                tempos.adicionar("indice_zip", agora() - inicio)
+
+                # --- CACHE DE CLASSIFICAÇÃO ---
+                # Com a chave (CRC32, tamanho) a consulta usa só o diretório central, antes de tudo:
+                # um acerto dispensa descompactar e analisar o XML. Com hash de conteúdo, a consulta
+                # acontece dentro do laço (depois de descompactar) e só poupa o parsing.
+                cache_por_metadados = cache is not None and not cache.hash_conteudo
+                previas = [None] * len(infos)
+                if cache_por_metadados:
+                    inicio = agora()
+                    previas = [cache.obter(chave_cache(info)) for info in infos]
+                    tempos.adicionar("cache", agora() - inicio)
+                classificados = opcoes.classificados
+                if classificados and not coletando:
+                    previas = [previa or classificados.get(info.header_offset) for info, previa in zip(infos, previas)]
+
+                # --- Escolha do modo: serial ou paralelo ---
+                # Só os membros que não estão no cache vão para o pool
+                faltantes = [info.header_offset for info, previa in zip(infos, previas) if previa is None]
+                classificacoes = None
+                if processos > 1 and len(faltantes) >= MIN_ARQUIVOS_PARALELO:
+                    if isinstance(origem, (str, os.PathLike)):
+                        caminho_zip = os.fspath(origem)
+                    else:
+                        # Os workers leem do disco: copiamos o upload para um arquivo temporário uma única vez
+                        origem.seek(0)
+                        with tempfile.NamedTemporaryFile(suffix='.zip', delete=False) as tmp:
+                            shutil.copyfileobj(origem, tmp)
+                        caminho_temporario = caminho_zip = tmp.name
+                    classificacoes = _classificar_em_paralelo(
+                        caminho_zip, faltantes, processos, tamanho_lote, itens, cabecalhos, arvore
+                    )
+
+                # No modo paralelo o hash de conteúdo exigiria descompactar tudo nesta thread: sem cache
+                cache_por_conteudo = cache is not None and cache.hash_conteudo and classificacoes is None
+
+                total = len(nomes)
+                if progresso is not None:
+                    progresso(0, total, resumo.dados_gerais)
+
+                # Tempos do laço em variáveis locais: publicados uma única vez no fim do lote
+                tempo_descompactacao = tempo_extracao = tempo_gravacao = 0.0
+
+                # Itera por cada XML existente dentro do ZIP enviado
+                for indice, (nome_arquivo, info, dados) in enumerate(zip(nomes, infos, previas), start=1):
+
+                    # --- FIX: FLATTEN PATH ---
+                    # Usa apenas o nome do arquivo, ignorando as pastas de origem
+                    nome_limpo = os.path.basename(nome_arquivo)
+
+                    # --- CÓPIA BRUTA (PASSTHROUGH) ---
+                    # Membros já em deflate são copiados para o ZIP de saída sem recomprimir.
+                    # O XML só é descompactado (em streaming) se precisar ser classificado.
+                    bruto = copia_bruta and suporta_copia_bruta(info)
+
+                    # Lê o conteúdo binário do XML específico (só quando realmente necessário:
+                    # para gravar sem cópia bruta, ou para classificar aqui um membro sem acerto de
+                    # cache nem resultado do pool. Sem ZIP de saída e sem motor em árvore, o parsing
+                    # lê o membro em streaming)
+                    analisar_aqui = dados is None and classificacoes is None
+                    conteudo_xml = None
+                    marca = agora()
+                    if (not bruto and gravador is not None) or (analisar_aqui and (cache_por_conteudo or arvore)):
+                        conteudo_xml = zip_in.read(info)
+                        tempo_descompactacao += agora() - marca
+                        marca = agora()
+
+                    # --- Lógica de Validação: cStat / tpEmis ---
+                    analisado = False
+                    # Documento analisado agora (aqui ou no pool): ganha uma linha nas colunas de itens/cabeçalhos
+                    coletado = False
+                    if dados is None:
+                        chave = None
+                        if cache_por_conteudo:
+                            chave = chave_cache(info, conteudo_xml)
+                            dados = cache.obter(chave)
+                        elif cache_por_metadados:
+                            chave = chave_cache(info)
+
+                        if dados is None:
+                            coletado = True
+                            if classificacoes is not None:
+                                dados = next(classificacoes)
+                            elif conteudo_xml is not None:
+                                dados = extrair_ou_none(conteudo_xml, nome_arquivo, itens, cabecalhos, arvore)
+                                analisado = True
+                            else:
+                                with zip_in.open(info) as membro:
+                                    dados = extrair_ou_none(membro, nome_arquivo, itens, cabecalhos)
+                                analisado = True
+
+                            if chave is not None and dados is not None:
+                                cache.guardar(chave, dados)
+
+                    # Gravamos na pasta da categoria ('aprovados/', 'contingencia/', 'rejeitados/'...)
+                    categoria = resumo.registrar(nome_limpo, dados)
+                    linha = None
+                    if coletado and dados is not None and (itens is not None or cabecalhos is not None):
+                        linha = linhas_coletadas
+                        linhas_coletadas += 1
+                    # No modo paralelo os workers já concluíram os documentos das suas colunas
+                    if analisado and dados is not None:
+                        if itens is not None:
+                            itens.concluir_documento(nome_limpo, categoria)
+                        if cabecalhos is not None:
+                            cabecalhos.concluir_documento(categoria)
+
+                    # --- CANCELAMENTOS ---
+                    # Notas autorizadas só são gravadas no fim do lote (None): um evento mais adiante
+                    # no ZIP pode cancelá-las. Os demais documentos são gravados na hora.
+                    classificada = categoria
+                    if dados is not None:
+                        categoria = cancelamentos.registrar(resumo, indice - 1, nome_limpo, categoria, dados, linha)
+                    if observador is not None:
+                        observador(nome_limpo, categoria or classificada, dados)
+                    tempo_extracao += agora() - marca
+                    marca = agora()
+                    if gravador is None or categoria is None:
+                        pass
+                    elif bruto:
+                        gravador.adicionar_bruto(zip_in, info, f'{categoria}/{nome_limpo}')
+                    else:
+                        gravador.adicionar(f'{categoria}/{nome_limpo}', conteudo_xml)
+                    tempo_gravacao += agora() - marca
+
+                    if progresso is not None:
+                        progresso(indice, total, resumo.dados_gerais)
+
+                # --- NOTAS AUTORIZADAS (fim do lote) ---
+                # Com todos os eventos indexados, cada nota vai para a pasta final. Da nota só ficou o
+                # registro compacto: a cópia bruta relê os bytes comprimidos do ZIP de entrada; sem ela,
+                # o membro é descompactado de novo aqui (nada é analisado outra vez).
+                marca = agora()
+                for nota, categoria in cancelamentos.resolver(resumo):
+                    if observador is not None and categoria != nota.categoria:
+                        observador(nota.nome_limpo, categoria, nota.dados)
+                    if gravador is None:
+                        continue
+                    info = infos[nota.indice]
+                    nome_saida = f'{categoria}/{nota.nome_limpo}'
+                    if copia_bruta and suporta_copia_bruta(info):
+                        gravador.adicionar_bruto(zip_in, info, nome_saida)
+                    else:
+                        gravador.adicionar(nome_saida, zip_in.read(info))
+                tempo_gravacao += agora() - marca
+
+                # As colunas foram concluídas com a categoria do próprio protocolo: corrige as canceladas
+                if cancelamentos.linhas_corrigidas:
+                    if itens is not None:
+                        itens.reclassificar(cancelamentos.linhas_corrigidas)
+                    if cabecalhos is not None:
+                        cabecalhos.reclassificar(
+                            {base_cabecalhos + linha: categoria for linha, categoria in cancelamentos.linhas_corrigidas.items()}
+                        )
+
+                if cache is not None:
+                    cache.descarregar()
+
+                marca = agora()
+                if gravador is not None:
+                    gravador.concluir()
+                tempo_gravacao += agora() - marca
+
+                tempos.adicionar("descompactacao", tempo_descompactacao)
+                tempos.adicionar("extracao", tempo_extracao)
+                tempos.adicionar("gravacao", tempo_gravacao)
+
+            # --- GERAÇÃO DOS RELATÓRIOS (CSV) ---
+            if zip_out is not None:
+                with tempos.medir("relatorios"):
+                    resumo.gravar_relatorios(zip_out)
+                    if exportar_itens:
+                        gravar_itens(itens, zip_out)
+
+        except zipfile.BadZipFile:
+            # Caso o arquivo enviado pelo usuário não seja um ZIP válido
+            print("Erro: Ficheiro não é um ZIP válido.")
+            if zip_out is None:
+                raise
+            gravador.concluir()
+            zip_out.writestr('ERRO.txt', 'O ficheiro enviado não era um ZIP válido.')
+
+        finally:
+            if caminho_temporario is not None:
+                os.remove(caminho_temporario)
+
+        # --- RESUMO EM JSON (última entrada do ZIP) ---
+        if opcoes.incluir_resumo and zip_out is not None:
+            with tempos.medir("relatorios"):
+                resumo.gravar_resumo_json(zip_out)
+
+    registrar_lote(tempos, resumo.dados_gerais, resumo.erros_parse, bytes_xml)
+    if indexar:
+        catalogo_global.enfileirar(itens, cabecalhos)
+
+    # "Rebobina" o ponteiro do arquivo em memória para o início (byte 0) para que possa ser lido
+    if opcoes.destino is None and memoria_zip_saida is not None:
+        memoria_zip_saida.seek(0)
+
+    # Retorna a estrutura completa de dados_gerais para uso nos headers
+    return memoria_zip_saida, resumo.dados_gerais
+
+
+def resumir_zip_sync(
+    conteudo_zip_recebido: bytes | str | os.PathLike | BinaryIO, opcoes: OpcoesProcessamento | None = None
+) -> dict:
+    """
+    Pré-conferência de um lote: só classificação e totais, sem montar o ZIP de saída.
+
+    Mesmos números de 'processar_zip_sync' (que recebe 'opcoes'), devolvidos como
+    'ResumoLote.como_dict': total, dados_gerais, erros_parse e a lista de rejeições.
+
+    Raises:
+        zipfile.BadZipFile: Se a entrada não for um ZIP válido.
+    """
+    resumo = ResumoLote()
+    opcoes = replace(opcoes or OpcoesProcessamento(), somente_resumo=True, resumo=resumo)
+    processar_zip_sync(conteudo_zip_recebido, opcoes)
+    return resumo.como_dict()
+
+
+def processar_xmls_sync(
+    partes: Iterable[tuple[str, bytes]],
+    destino: BinaryIO | None = None,
+    incluir_resumo: bool = False,
+    tempos: TempoEtapas | None = None,
+    compressao: str | None = None,
+) -> tuple[BinaryIO, dict]:
+    """
+    Versão de 'processar_zip_sync' para XMLs soltos (endpoint /processar-xmls/).
+
+    Consome as partes uma a uma (ex: direto do multipart, sem acumular a lista) e
+    grava cada resultado no ZIP de saída assim que é classificado. Usa o mesmo núcleo
+    (motor de extração + ResumoLote + IndiceCancelamentos), então estatísticas, cancelamentos
+    e CSVs são idênticos aos do ZIP. Como uma parte do multipart não pode ser relida, os bytes
+    das notas autorizadas que esperam o fim do lote vão para um arquivo temporário em disco
+    (a memória continua com só os registros compactos) e são gravados de lá.
+
+    Args:
+        partes (Iterable[tuple[str, bytes]]): Pares (nome_do_arquivo, conteúdo_xml).
+        destino (BinaryIO | None): Onde gravar o ZIP de saída. Se omitido, usa um buffer em memória.
+        incluir_resumo (bool): Grava 'resumo.json' como última entrada do ZIP.
+        tempos (TempoEtapas | None): Recebe o tempo de cada etapa. Como as partes chegam
+            durante o processamento, a espera por elas conta como 'leitura_upload'.
+        compressao (str | None): Política de compressão do ZIP de saída (ver 'processar_zip_sync').
+
+    Returns:
+        tuple[BinaryIO, dict]: O ZIP de saída e os totais por categoria (dados_gerais).
+    """
+    tempos = TempoEtapas() if tempos is None else tempos
+    agora = time.perf_counter
+    resumo = ResumoLote()
+    cancelamentos = IndiceCancelamentos()
+    bytes_xml = 0
+    memoria_zip_saida = io.BytesIO() if destino is None else destino
+    # Itens para o catálogo de produtos (quando ligado)
+    itens = ColunasItens() if catalogo_global.ativo else None
+    cabecalhos = ColunasCabecalhos() if catalogo_global.ativo else None
+    linhas_coletadas = 0
+    # Notas que esperam o fim do lote: bytes num temporário em disco, (início, tamanho) por posição
+    espera = None
+    trechos: list[tuple[int, int]] = []
+
+    metodo, nivel = POLITICAS[validar_politica(compressao)]
+    with zipfile.ZipFile(memoria_zip_saida, 'w', metodo, compresslevel=nivel) as zip_out:
+        gravador = GravadorParalelo(zip_out, compressao)
+        tempo_leitura = tempo_extracao = tempo_gravacao = 0.0
+        partes = iter(partes)
+        while True:
+            marca = agora()
+            try:
+                nome_arquivo, conteudo_xml = next(partes)
+            except StopIteration:
+                break
+            tempo_leitura += agora() - marca
+
+            # Garante que estamos a processar apenas arquivos XML
+            if not nome_arquivo.lower().endswith('.xml'):
+                continue
+
+            # Flattening (alguns navegadores enviam o caminho completo no filename)
+            nome_limpo = os.path.basename(nome_arquivo.replace('\\', '/'))
+            bytes_xml += len(conteudo_xml)
+
+            marca = agora()
+            dados = extrair_ou_none(conteudo_xml, nome_arquivo, itens, cabecalhos)
+            categoria = resumo.registrar(nome_limpo, dados)
+            linha = None
+            if itens is not None and dados is not None:
+                itens.concluir_documento(nome_limpo, categoria)
+                cabecalhos.concluir_documento(categoria)
+                linha = linhas_coletadas
+                linhas_coletadas += 1
+            if dados is not None:
+                categoria = cancelamentos.registrar(resumo, len(trechos), nome_limpo, categoria, dados, linha)
+            tempo_extracao += agora() - marca
+
+            marca = agora()
+            if categoria is not None:
+                gravador.adicionar(f'{categoria}/{nome_limpo}', conteudo_xml)
+            else:
+                # Nota autorizada: um evento mais adiante pode cancelá-la
+                if espera is None:
+                    espera = tempfile.TemporaryFile()
+                trechos.append((espera.tell(), len(conteudo_xml)))
+                espera.write(conteudo_xml)
+            tempo_gravacao += agora() - marca
+
+        # --- NOTAS AUTORIZADAS (fim do lote) ---
+        marca = agora()
+        try:
+            for nota, categoria in cancelamentos.resolver(resumo):
+                inicio, tamanho = trechos[nota.indice]
+                espera.seek(inicio)
+                gravador.adicionar(f'{categoria}/{nota.nome_limpo}', espera.read(tamanho))
+        finally:
+            if espera is not None:
+                espera.close()
+        if cancelamentos.linhas_corrigidas:
+            itens.reclassificar(cancelamentos.linhas_corrigidas)
+            cabecalhos.reclassificar(cancelamentos.linhas_corrigidas)
+        gravador.concluir()
+        tempo_gravacao += agora() - marca
+
+        tempos.adicionar("leitura_upload", tempo_leitura)
+        tempos.adicionar("extracao", tempo_extracao)
+        tempos.adicionar("gravacao", tempo_gravacao)
+
+        with tempos.medir("relatorios"):
+            resumo.gravar_relatorios(zip_out)
+            if incluir_resumo:
+                resumo.gravar_resumo_json(zip_out)
+
+    registrar_lote(tempos, resumo.dados_gerais, resumo.erros_parse, bytes_xml)
+    if itens is not None:
+        catalogo_global.enfileirar(itens, cabecalhos)
+
+    if destino is None:
+        memoria_zip_saida.seek(0)
+
+    return memoria_zip_saida, resumo.dados_gerais
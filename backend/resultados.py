@@ -0,0 +1,218 @@
+import os
+import json
+import time
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import BinaryIO, NamedTuple
+
+
+# -------------------------------------------------------------------
+# CONFIGURAÇÃO DO ARMAZÉM DE RESULTADOS (variáveis de ambiente)
+# -------------------------------------------------------------------
+# Espaço máximo em disco ocupado pelos ZIPs de saída guardados. 0 (padrão) desativa o armazém.
+RESULTADOS_LIMITE = int(os.environ.get("MONXML_RESULTADOS_LIMITE_MB", "0")) * 1024 * 1024
+# Tempo (segundos) que um resultado fica guardado desde o último uso
+RESULTADOS_TTL = int(os.environ.get("MONXML_RESULTADOS_TTL", "86400"))
+# Diretório dos resultados (padrão: temporário do sistema)
+RESULTADOS_DIRETORIO = (
+    os.environ.get("MONXML_RESULTADOS_DIRETORIO", "") or os.path.join(tempfile.gettempdir(), "monxml-resultados")
+)
+
+# Versão do ZIP de saída. Deve ser incrementada sempre que o conteúdo gerado para o
+# mesmo ZIP de entrada mudar (pastas, relatórios, regras de classificação).
+VERSAO_RESULTADOS = 5
+
+
+def hash_arquivo(origem: BinaryIO | bytes) -> str:
+    """SHA-256 (hex) do ZIP enviado, lido em blocos. O cursor do arquivo volta ao início."""
+    if isinstance(origem, (bytes, bytearray)):
+        return hashlib.sha256(origem).hexdigest()
+    origem.seek(0)
+    digest = hashlib.file_digest(origem, "sha256").hexdigest()
+    origem.seek(0)
+    return digest
+
+
+def chave_resultado(hash_zip: str, **opcoes) -> str:
+    """
+    Chave do resultado: hash do ZIP de entrada + as opções que mudam o ZIP de saída
+    (ex: itens, compressao) + VERSAO_RESULTADOS. É também o ETag da resposta.
+    """
+    descricao = ";".join(f"{nome}={opcoes[nome]}" for nome in sorted(opcoes))
+    return hashlib.sha256(f"{hash_zip}|v{VERSAO_RESULTADOS}|{descricao}".encode()).hexdigest()
+
+
+class Resultado(NamedTuple):
+    """Um ZIP de saída guardado: caminho, tamanho e os totais dos headers de resumo."""
+    chave: str
+    caminho: str
+    tamanho: int
+    dados_gerais: dict
+    usado_em: float
+
+
+class ArmazemResultados:
+    """
+    Armazém em disco dos ZIPs de saída, endereçado pelo conteúdo (SHA-256) do ZIP de entrada.
+
+    Reenviar exatamente o mesmo lote (refresh do navegador, botão "tentar de novo")
+    devolve o arquivo já pronto, sem processar nada. Guarda no máximo 'limite' bytes
+    (remove os menos usados recentemente) e descarta o que não é usado há 'ttl' segundos.
+    O índice fica em memória e é reconstruído a partir do diretório ao iniciar; o diretório
+    só é criado na primeira gravação.
+    """
+
+    def __init__(self, diretorio: str = RESULTADOS_DIRETORIO, limite: int = RESULTADOS_LIMITE, ttl: int = RESULTADOS_TTL):
+        self.diretorio = diretorio
+        self.limite = limite
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # chave -> Resultado, do menos para o mais recentemente usado
+        self._entradas: OrderedDict[str, Resultado] = OrderedDict()
+        self.bytes_em_disco = 0
+
+        # Contadores expostos em /resultados/estatisticas e /metrics
+        self.acertos = 0
+        self.falhas = 0
+        self.remocoes = 0
+
+        if self.ativo and os.path.isdir(diretorio):
+            self._carregar()
+
+    @property
+    def ativo(self) -> bool:
+        return self.limite > 0
+
+    def _caminhos(self, chave: str) -> tuple[str, str]:
+        base = os.path.join(self.diretorio, chave)
+        return base + ".zip", base + ".json"
+
+    def _carregar(self) -> None:
+        # Resultados de execuções anteriores (ZIP + JSON com os totais), mais antigos primeiro
+        encontrados = []
+        for nome in os.listdir(self.diretorio):
+            if not nome.endswith(".json"):
+                continue
+            chave = nome.removesuffix(".json")
+            caminho_zip, caminho_json = self._caminhos(chave)
+            try:
+                with open(caminho_json, encoding="utf-8") as arquivo:
+                    dados_gerais = json.load(arquivo)
+                estado = os.stat(caminho_zip)
+            except (OSError, ValueError):
+                continue
+            encontrados.append(Resultado(chave, caminho_zip, estado.st_size, dados_gerais, estado.st_mtime))
+        for resultado in sorted(encontrados, key=lambda r: r.usado_em):
+            self._entradas[resultado.chave] = resultado
+            self.bytes_em_disco += resultado.tamanho
+        self._liberar_espaco()
+
+    def obter(self, chave: str) -> Resultado | None:
+        """O resultado guardado (e marcado como usado agora) ou None."""
+        return self._usar(chave, abrir=False)[0]
+
+    def abrir(self, chave: str) -> tuple[Resultado, BinaryIO] | None:
+        """
+        Como 'obter', mas com o ZIP já aberto para leitura (quem recebe fecha o arquivo).
+        O arquivo é aberto com o lock: uma remoção (LRU/TTL) que venha depois só apaga o nome
+        no diretório, e o envio continua lendo pelo arquivo aberto.
+        """
+        resultado, arquivo = self._usar(chave, abrir=True)
+        return None if resultado is None else (resultado, arquivo)
+
+    def _usar(self, chave: str, abrir: bool) -> tuple[Resultado | None, BinaryIO | None]:
+        if not self.ativo:
+            return None, None
+        arquivo = None
+        with self._lock:
+            resultado = self._entradas.get(chave)
+            if resultado is not None and time.time() - resultado.usado_em > self.ttl:
+                self._remover(chave)
+                resultado = None
+            if resultado is not None and abrir:
+                try:
+                    arquivo = open(resultado.caminho, "rb")
+                except FileNotFoundError:
+                    # Apagado por fora do armazém: vale como falha
+                    self._remover(chave)
+                    resultado = None
+            if resultado is None:
+                self.falhas += 1
+                return None, None
+            self.acertos += 1
+            resultado = resultado._replace(usado_em=time.time())
+            self._entradas[chave] = resultado
+            self._entradas.move_to_end(chave)
+        # A data de modificação guarda o "último uso" para a reconstrução do índice
+        try:
+            os.utime(resultado.caminho)
+        except FileNotFoundError:
+            pass
+        return resultado, arquivo
+
+    def consultar(self, chave: str) -> Resultado | None:
+        """Como 'obter', mas sem contar acerto/falha nem mudar a ordem LRU."""
+        with self._lock:
+            return self._entradas.get(chave)
+
+    def novo_arquivo(self) -> BinaryIO:
+        """Arquivo temporário no diretório do armazém, para o processamento gravar o ZIP de saída."""
+        os.makedirs(self.diretorio, exist_ok=True)
+        return tempfile.NamedTemporaryFile(dir=self.diretorio, suffix=".tmp", delete=False)
+
+    def guardar(self, chave: str, caminho_temporario: str, dados_gerais: dict) -> Resultado:
+        """
+        Move o ZIP de saída para o armazém (rename: sem copiar bytes) e libera espaço se preciso.
+        Quem ainda tiver o arquivo aberto continua lendo normalmente.
+        """
+        caminho_zip, caminho_json = self._caminhos(chave)
+        with open(caminho_json, "w", encoding="utf-8") as arquivo:
+            json.dump(dados_gerais, arquivo)
+        os.replace(caminho_temporario, caminho_zip)
+        resultado = Resultado(chave, caminho_zip, os.path.getsize(caminho_zip), dados_gerais, time.time())
+        with self._lock:
+            anterior = self._entradas.pop(chave, None)
+            if anterior is not None:
+                self.bytes_em_disco -= anterior.tamanho
+            self._entradas[chave] = resultado
+            self.bytes_em_disco += resultado.tamanho
+            self._liberar_espaco()
+        return resultado
+
+    def _liberar_espaco(self) -> None:
+        # Chamado com o lock. O resultado mais recente nunca é removido (mesmo maior que o limite).
+        agora = time.time()
+        while len(self._entradas) > 1:
+            chave, resultado = next(iter(self._entradas.items()))
+            if self.bytes_em_disco <= self.limite and agora - resultado.usado_em <= self.ttl:
+                break
+            self._remover(chave)
+
+    def _remover(self, chave: str) -> None:
+        resultado = self._entradas.pop(chave)
+        self.bytes_em_disco -= resultado.tamanho
+        self.remocoes += 1
+        for caminho in self._caminhos(chave):
+            try:
+                os.remove(caminho)
+            except FileNotFoundError:
+                pass
+
+    def estatisticas(self) -> dict:
+        consultas = self.acertos + self.falhas
+        return {
+            "ativo": self.ativo,
+            "resultados": len(self._entradas),
+            "bytes_em_disco": self.bytes_em_disco,
+            "limite_bytes": self.limite,
+            "acertos": self.acertos,
+            "falhas": self.falhas,
+            "taxa_acerto": round(self.acertos / consultas, 4) if consultas else 0.0,
+            "remocoes": self.remocoes,
+        }
+
+
+# Armazém único do processo, compartilhado por todas as requisições
+armazem_resultados = ArmazemResultados()
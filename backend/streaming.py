@@ -0,0 +1,126 @@
+import asyncio
+import threading
+
+from starlette.concurrency import run_in_threadpool
+
+
+# -------------------------------------------------------------------
+# SAÍDA EM STREAMING (ZIP ESCRITO DIRETO NA RESPOSTA HTTP)
+# -------------------------------------------------------------------
+# Tamanho mínimo de cada pedaço entregue ao cliente (evita milhares de writes minúsculos)
+TAMANHO_PEDACO = 64 * 1024
+# Quantidade máxima de pedaços aguardando envio. Com isso a memória fica limitada a
+# ~TAMANHO_PEDACO * LIMITE_PEDACOS, independente do tamanho do lote.
+LIMITE_PEDACOS = 16
+
+
+class EnvioCancelado(Exception):
+    """O cliente desconectou: o processamento deve ser abortado."""
+
+
+class CanalSaida:
+    """
+    Objeto "arquivo" somente-escrita que liga a thread de processamento ao Event Loop.
+
+    O 'zipfile' escreve nele como se fosse um arquivo comum. Como o canal NÃO tem
+    'tell'/'seek', o zipfile entra no modo não-seekable: usa data descriptors após
+    cada membro e grava o diretório central só no final, que é exatamente o formato
+    que pode ser enviado ao cliente à medida que é produzido.
+
+    Backpressure: se o cliente estiver lento, 'write' bloqueia a thread de processamento
+    (nunca o Event Loop) até que um pedaço seja consumido.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, tamanho_pedaco: int = TAMANHO_PEDACO, limite_pedacos: int = LIMITE_PEDACOS):
+        self._loop = loop
+        self._fila: asyncio.Queue = asyncio.Queue()
+        self._vagas = threading.Semaphore(limite_pedacos)
+        self._tamanho_pedaco = tamanho_pedaco
+        self._buffer = bytearray()
+        self._cancelado = False
+
+    # --- Lado produtor (thread de processamento) ---
+    def write(self, dados) -> int:
+        if self._cancelado:
+            raise EnvioCancelado()
+        self._buffer += dados
+        if len(self._buffer) >= self._tamanho_pedaco:
+            self._enviar(bytes(self._buffer))
+            self._buffer.clear()
+        return len(dados)
+
+    def flush(self) -> None:
+        # Os pedaços só são liberados por tamanho ou no 'fechar' (mantém os writes agrupados)
+        pass
+
+    def fechar(self, erro: BaseException | None = None) -> None:
+        """Envia o que restou no buffer e sinaliza o fim do stream (ou o erro que o interrompeu)."""
+        if erro is None and self._buffer and not self._cancelado:
+            self._enviar(bytes(self._buffer))
+        self._buffer.clear()
+        self._loop.call_soon_threadsafe(self._fila.put_nowait, erro)
+
+    def _enviar(self, pedaco: bytes) -> None:
+        self._vagas.acquire()
+        if self._cancelado:
+            raise EnvioCancelado()
+        self._loop.call_soon_threadsafe(self._fila.put_nowait, pedaco)
+
+    # --- Lado consumidor (Event Loop) ---
+    def cancelar(self) -> None:
+        """Chamado quando o cliente desconecta: destrava e aborta o produtor."""
+        self._cancelado = True
+        self._vagas.release()
+
+    async def iterar(self):
+        """Gerador assíncrono com os pedaços do ZIP, no formato esperado pelo StreamingResponse."""
+        try:
+            while True:
+                item = await self._fila.get()
+                if item is None:
+                    return
+                if isinstance(item, BaseException):
+                    # Os headers já foram enviados: só resta interromper a conexão
+                    raise item
+                self._vagas.release()
+                yield item
+        finally:
+            self.cancelar()
+
+
+def transmitir_em_thread(canal: CanalSaida, funcao, *args, **kwargs) -> threading.Thread:
+    """
+    Executa 'funcao' (que escreve no canal) numa thread dedicada e fecha o canal ao final.
+
+    Usamos uma thread própria em vez do threadpool do Starlette porque ela pode ficar
+    bloqueada por backpressure durante todo o download do cliente.
+    """
+    def alvo():
+        try:
+            funcao(*args, **kwargs)
+        except EnvioCancelado:
+            canal.fechar()
+        except BaseException as erro:
+            canal.fechar(erro)
+        else:
+            canal.fechar()
+
+    thread = threading.Thread(target=alvo, name="monxml-streaming", daemon=True)
+    thread.start()
+    return thread
+
+
+async def iterar_arquivo(arquivo, tamanho_pedaco: int = TAMANHO_PEDACO):
+    """
+    Gerador assíncrono que lê um arquivo (ex: SpooledTemporaryFile) em pedaços e o fecha no fim.
+
+    As leituras rodam no threadpool: se o arquivo já foi para o disco, o Event Loop não bloqueia.
+    """
+    try:
+        while True:
+            pedaco = await run_in_threadpool(arquivo.read, tamanho_pedaco)
+            if not pedaco:
+                return
+            yield pedaco
+    finally:
+        arquivo.close()
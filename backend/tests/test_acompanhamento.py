@@ -0,0 +1,98 @@
+import io
+import os
+import sys
+import json
+import asyncio
+import zipfile
+
+import pytest
+from fastapi.testclient import TestClient
+
+# Add the backend directory to the path so we can import the per-file streaming module
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+from acompanhamento import EmissorRegistros, acompanhar_zip_sync
+from resultados import ArmazemResultados
+from streaming import CanalSaida, transmitir_em_thread
+from benchmarks.corpus import PerfilCorpus, gerar_corpus_zip
+
+CORPUS = gerar_corpus_zip(PerfilCorpus(arquivos=40, semente=5, proporcao_canceladas=0.2))
+# Notas + eventos de cancelamento, já sem as pastas
+NOMES = {os.path.basename(nome) for nome in zipfile.ZipFile(io.BytesIO(CORPUS)).namelist()}
+
+
+@pytest.fixture
+def armazem(tmp_path, monkeypatch):
+    armazem = ArmazemResultados(str(tmp_path), limite=64 * 1024 * 1024)
+    monkeypatch.setattr(main, "armazem_resultados", armazem)
+    return armazem
+
+
+def acompanhar(client, corpus=CORPUS, **params):
+    return client.post("/acompanhar-zip/", params=params, files={"arquivo": ("notas.zip", corpus, "application/zip")})
+
+
+def test_um_registro_por_xml(armazem):
+    client = TestClient(main.app)
+    resposta = acompanhar(client)
+    assert resposta.status_code == 200
+    assert resposta.headers["content-type"].startswith("application/x-ndjson")
+    registros = [json.loads(linha) for linha in resposta.text.splitlines()]
+
+    assert registros[0]["tipo"] == "totais" and registros[0]["processados"] == 0
+    assert registros[0]["total"] == len(NOMES)
+    arquivos = [r for r in registros if r["tipo"] == "arquivo"]
+    # Notas canceladas por um evento posterior aparecem de novo, já como 'cancelados'
+    fim = registros[-1]
+    assert fim["tipo"] == "fim" and fim["total"] == len(NOMES)
+    assert {r["arquivo"] for r in arquivos} == NOMES
+    assert len(arquivos) == len(NOMES) + fim["dados_gerais"]["cancelados"]["qtd"]
+    assert set(arquivos[0]) == {"tipo", "arquivo", "categoria", "cstat", "xmotivo", "vnf", "vicms"}
+    resumo = client.post("/resumo-zip/", files={"arquivo": ("notas.zip", CORPUS, "application/zip")}).json()
+    assert fim["dados_gerais"] == resumo["dados_gerais"]
+    assert fim["erros_parse"] == resumo["erros_parse"]
+
+    # A categoria final de cada arquivo bate com os totais
+    finais = {r["arquivo"]: r["categoria"] for r in arquivos}
+    for categoria, dados in fim["dados_gerais"].items():
+        assert list(finais.values()).count(categoria) == dados["qtd"]
+
+    # O link aponta para o ZIP guardado, o mesmo que '/processar-zip/' devolve para este lote
+    download = client.get(fim["download"])
+    assert download.status_code == 200
+    assert download.content == client.post("/processar-zip/", files={"arquivo": ("notas.zip", CORPUS, "application/zip")}).content
+    assert armazem.acertos == 2
+
+
+def test_formato_sse_e_erros(armazem):
+    client = TestClient(main.app)
+    resposta = acompanhar(client, formato="sse")
+    assert resposta.headers["content-type"].startswith("text/event-stream")
+    eventos = [bloco.split("\n") for bloco in resposta.text.strip().split("\n\n")]
+    assert all(evento.startswith("event: ") and dados.startswith("data: ") for evento, dados in eventos)
+    assert eventos[-1][0] == "event: fim"
+    assert sum(evento == "event: arquivo" for evento, _ in eventos) >= len(NOMES)
+
+    assert acompanhar(client, formato="xml").status_code == 400
+    assert acompanhar(client, corpus=b"isto nao e um zip").status_code == 400
+
+
+def test_cliente_lento_segura_o_processamento(armazem):
+    # Ninguém consome o canal: o processamento para em LIMITE_REGISTROS e não acumula o lote
+    async def rodar():
+        canal = CanalSaida(asyncio.get_running_loop(), tamanho_pedaco=1, limite_pedacos=4)
+        thread = transmitir_em_thread(
+            canal, acompanhar_zip_sync, io.BytesIO(CORPUS), EmissorRegistros(canal), usar_cache=False, armazem=armazem
+        )
+        await asyncio.sleep(0.2)
+        pendentes = canal._fila.qsize()
+        vivo = thread.is_alive()
+        canal.cancelar()
+        await asyncio.get_running_loop().run_in_executor(None, thread.join, 5)
+        return pendentes, vivo, thread.is_alive()
+
+    pendentes, vivo, ainda_vivo = asyncio.run(rodar())
+    assert pendentes <= 4 and vivo and not ainda_vivo
+    # O ZIP de saída incompleto não fica no armazém
+    assert os.listdir(armazem.diretorio) == [] and armazem.estatisticas()["resultados"] == 0
@@ -0,0 +1,99 @@
+import io
+import sys
+import os
+import time
+import zipfile
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+
+# Add the backend directory to the path so we can import the admission module
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+from admissao import ControleAdmissao, Custo, DescompressaoExcessiva, OrcamentoEsgotado, custo_de_membros
+from processamento import OpcoesProcessamento, estimar_custo, processar_zip_sync
+from resultados import ArmazemResultados
+from benchmarks.corpus import PerfilCorpus, gerar_corpus_zip
+
+MB = 1024 * 1024
+
+
+def zip_bomba():
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED, compresslevel=9) as z:
+        z.writestr("nota.xml", b"<a>" + b" " * (8 * MB) + b"</a>")
+    return buffer.getvalue()
+
+
+def test_orcamento_espera_e_rejeita():
+    controle = ControleAdmissao(memoria=100 * MB, cpu=2, limite_fila=1)
+    primeira = controle.reservar(Custo(60 * MB))
+    with pytest.raises(OrcamentoEsgotado):
+        controle.reservar(Custo(60 * MB), espera=0.05)
+    assert controle.estatisticas()["rejeitadas"] == 1
+
+    # Quem espera é admitido assim que a memória volta ao orçamento
+    admitida = threading.Event()
+
+    def esperar_vaga():
+        with controle.reservar(Custo(60 * MB), espera=5):
+            admitida.set()
+
+    thread = threading.Thread(target=esperar_vaga)
+    thread.start()
+    while controle.em_espera == 0:
+        time.sleep(0.001)
+    # Fila de espera cheia: recusa na hora
+    with pytest.raises(OrcamentoEsgotado):
+        controle.reservar(Custo(50 * MB), espera=5)
+    primeira.liberar()
+    primeira.liberar()
+    thread.join()
+    assert admitida.is_set()
+    assert (controle.memoria_em_uso, controle.cpu_em_uso) == (0, 0)
+
+    # Pedido maior que o orçamento inteiro roda sozinho em vez de nunca ser admitido
+    with controle.reservar(Custo(500 * MB, cpu=8), espera=0) as reserva:
+        assert reserva.custo == Custo(100 * MB, 2)
+
+
+def test_custo_pelo_diretorio_central():
+    corpus = gerar_corpus_zip(PerfilCorpus(arquivos=20))
+    custo = estimar_custo(corpus, processos=1)
+    with zipfile.ZipFile(io.BytesIO(corpus)) as z:
+        tamanhos = [info.file_size for info in z.infolist() if info.filename.endswith(".xml")]
+    assert custo == custo_de_membros(tamanhos) and custo.cpu == 1
+    # O pico depende do maior membro, não da soma do ZIP
+    assert custo.memoria < custo_de_membros(tamanhos * 1000).memoria * 2
+
+
+def test_zip_bomba_recusado():
+    bomba = zip_bomba()
+    with pytest.raises(DescompressaoExcessiva):
+        estimar_custo(bomba)
+    with pytest.raises(DescompressaoExcessiva):
+        processar_zip_sync(bomba, OpcoesProcessamento(usar_cache=False))
+
+    client = TestClient(main.app)
+    resposta = client.post("/processar-zip/", files={"arquivo": ("bomba.zip", bomba, "application/zip")})
+    assert resposta.status_code == 413
+
+
+def test_endpoint_sem_orcamento(monkeypatch):
+    controle = ControleAdmissao(memoria=64 * MB, cpu=1, limite_fila=0)
+    monkeypatch.setattr(main, "controle_admissao", controle)
+    # Sem armazém de resultados: um reenvio guardado seria servido sem passar pela admissão
+    monkeypatch.setattr(main, "armazem_resultados", ArmazemResultados(limite=0))
+    client = TestClient(main.app)
+    arquivo = ("notas.zip", gerar_corpus_zip(PerfilCorpus(arquivos=5)), "application/zip")
+
+    with controle.reservar(Custo(64 * MB)):
+        resposta = client.post("/processar-zip/", files={"arquivo": arquivo})
+        assert resposta.status_code == 503
+        assert resposta.headers["Retry-After"] == str(main.ADMISSAO_RETRY_AFTER)
+
+    assert client.post("/processar-zip/", files={"arquivo": arquivo}).status_code == 200
+    assert client.post("/processar-zip/?streaming=true", files={"arquivo": arquivo}).status_code == 200
+    assert controle.memoria_em_uso == 0
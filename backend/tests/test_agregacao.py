@@ -0,0 +1,172 @@
+import io
+import csv
+import sys
+import os
+import random
+import zipfile
+from decimal import Decimal
+
+import pytest
+from fastapi.testclient import TestClient
+
+# Add the backend directory to the path so we can import the aggregation module
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import processamento
+from main import app
+from processamento import OpcoesProcessamento, processar_zip_sync
+from agregacao import ColunasCabecalhos, agregar, relatorio_csv
+from extracao import extrair_dados_nfe
+from benchmarks.corpus import PerfilCorpus, gerar_corpus_zip, iterar_corpus, gerar_nfe, gerar_evento_cancelamento
+from lxml import etree as ET
+
+client = TestClient(app)
+
+
+def montar_nfe(emitente, uf_dest, data, cfop, v_nf, v_icms="0.00", v_st="0.00", tpemis="1", cstat="100"):
+    return f"""<?xml version="1.0" encoding="UTF-8"?>
+<nfeProc xmlns="http://www.portalfiscal.inf.br/nfe">
+  <NFe><infNFe Id="NFe1">
+    <ide><dhEmi>{data}T10:00:00-03:00</dhEmi><tpEmis>{tpemis}</tpEmis></ide>
+    <emit><CNPJ>{emitente}</CNPJ><enderEmit><UF>SP</UF></enderEmit></emit>
+    <dest><CNPJ>99999999000199</CNPJ><enderDest><UF>{uf_dest}</UF></enderDest></dest>
+    <det nItem="1"><prod><CFOP>{cfop}</CFOP><vProd>{v_nf}</vProd></prod></det>
+    <det nItem="2"><prod><CFOP>6102</CFOP><vProd>0.00</vProd></prod></det>
+    <total><ICMSTot><vICMS>{v_icms}</vICMS><vST>{v_st}</vST><vIPI>0.00</vIPI><vNF>{v_nf}</vNF></ICMSTot></total>
+  </infNFe></NFe>
+  <protNFe><infProt><cStat>{cstat}</cStat><xMotivo>Autorizado</xMotivo></infProt></protNFe>
+</nfeProc>""".encode()
+
+
+def montar_zip(xmls):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as z:
+        for i, xml in enumerate(xmls):
+            z.writestr(f"nota_{i}.xml", xml)
+    return buffer.getvalue()
+
+
+NOTAS = [
+    montar_nfe("11111111000111", "RJ", "2024-01-10", "5102", "0.10", v_icms="0.01"),
+    montar_nfe("11111111000111", "RJ", "2024-01-20", "5102", "0.20", v_icms="0.02", v_st="1.05"),
+    montar_nfe("11111111000111", "MG", "2024-02-01", "5405", "1000000.01"),
+    montar_nfe("22222222000122", "RJ", "2024-02-15", "5102", "0.30", tpemis="9"),
+    montar_nfe("22222222000122", "RJ", "2024-02-15", "5102", "7.77", cstat="301"),
+    b"<nfeProc><NFe><infNFe>",
+]
+
+
+def test_campos_de_cabecalho_na_mesma_passagem():
+    cabecalhos = ColunasCabecalhos()
+    extrair_dados_nfe(NOTAS[1], cabecalho=cabecalhos)
+    cabecalhos.concluir_documento("aprovados")
+
+    linha = {nome: vetor[0] for nome, vetor in cabecalhos.como_numpy().items()}
+    assert linha["cnpj_emitente"] == b"11111111000111"
+    assert linha["uf_emitente"] == b"SP"
+    assert linha["uf_destinatario"] == b"RJ"
+    assert linha["data_emissao"] == 20240120
+    # CFOP do primeiro item
+    assert linha["cfop"] == b"5102"
+    assert (linha["v_nf"], linha["v_icms"], linha["v_st"]) == (20, 2, 105)
+
+
+def test_agregacao_por_dimensoes_compostas():
+    cabecalhos = ColunasCabecalhos()
+    processar_zip_sync(montar_zip(NOTAS), OpcoesProcessamento(usar_cache=False, cabecalhos=cabecalhos))
+    # O XML corrompido não gera linha
+    assert len(cabecalhos) == 5
+
+    relatorio = agregar(cabecalhos, ["emitente", "mes", "cfop+uf_destinatario"], categorias=["aprovados", "contingencia"])
+
+    assert relatorio["emitente"] == [
+        {"chave": "11111111000111", "documentos": 3, "v_nf_centavos": 100000031,
+         "v_icms_centavos": 3, "v_st_centavos": 105, "v_ipi_centavos": 0},
+        {"chave": "22222222000122", "documentos": 1, "v_nf_centavos": 30,
+         "v_icms_centavos": 0, "v_st_centavos": 0, "v_ipi_centavos": 0},
+    ]
+    # Dimensões de tempo em ordem cronológica
+    assert [(linha["chave"], linha["documentos"]) for linha in relatorio["mes"]] == [("202401", 2), ("202402", 2)]
+    assert {linha["chave"]: linha["v_nf_centavos"] for linha in relatorio["cfop+uf_destinatario"]} == {
+        "5405+MG": 100000001, "5102+RJ": 60,
+    }
+
+
+def test_dimensao_desconhecida():
+    with pytest.raises(ValueError):
+        agregar(ColunasCabecalhos(), ["emitente+cor"])
+
+
+def test_totais_exatos_e_paralelo_igual_a_serial(monkeypatch):
+    perfil = PerfilCorpus(arquivos=80, itens_max=6, proporcao_corrompidos=0.05, semente=11)
+    entrada = gerar_corpus_zip(perfil)
+
+    serial = ColunasCabecalhos()
+    processar_zip_sync(entrada, OpcoesProcessamento(processos=1, cabecalhos=serial))
+    monkeypatch.setattr(processamento, "MIN_ARQUIVOS_PARALELO", 1)
+    paralela = ColunasCabecalhos()
+    processar_zip_sync(entrada, OpcoesProcessamento(processos=2, tamanho_lote=9, cabecalhos=paralela))
+
+    relatorio = agregar(serial, ["categoria", "dia"])
+    assert relatorio == agregar(paralela, ["categoria", "dia"])
+
+    # Soma de referência em Decimal, direto dos XMLs
+    esperado = Decimal(0)
+    for _, xml in iterar_corpus(perfil):
+        try:
+            arvore = ET.fromstring(xml)
+        except ET.XMLSyntaxError:
+            continue
+        esperado += Decimal(arvore.xpath("string(//*[local-name()='vNF'])"))
+    assert sum(linha["v_nf_centavos"] for linha in relatorio["dia"]) == int(esperado * 100)
+
+
+def test_endpoint_json_e_csv():
+    arquivo = ("notas.zip", montar_zip(NOTAS), "application/zip")
+
+    resposta = client.post("/agregacoes/?dimensoes=emitente&dimensoes=ano", files={"arquivo": arquivo})
+    assert resposta.status_code == 200
+    corpo = resposta.json()
+    assert corpo["documentos"] == 5
+    assert corpo["dimensoes"]["ano"][0]["v_nf"] == "1000008.38"
+    assert resposta.headers["X-Count-Rejected"] == "2"
+
+    resposta = client.post("/agregacoes/?dimensoes=cfop&formato=csv", files={"arquivo": arquivo})
+    linhas = list(csv.reader(io.StringIO(resposta.content.decode("utf-8-sig")), delimiter=";"))
+    assert linhas[1] == ["cfop", "5405", "1", "1000000,01", "0,00", "0,00", "0,00"]
+
+    resposta = client.post("/agregacoes/?dimensoes=estado", files={"arquivo": arquivo})
+    assert resposta.status_code == 400
+
+
+def test_eventos_e_notas_canceladas_fora_dos_totais():
+    aleatorio = random.Random(4)
+    notas = [gerar_nfe(aleatorio, 1, 2), gerar_nfe(aleatorio, 2, 3), gerar_nfe(aleatorio, 3, 1, cstat="204")]
+    chave_cancelada = extrair_dados_nfe(notas[0]).chave
+    entrada = montar_zip([*notas, gerar_evento_cancelamento(chave_cancelada)])
+    arquivo = ("notas.zip", entrada, "application/zip")
+
+    # Mesmas linhas (e valores) do relatorio_geral.csv, sem a nota cancelada nem o evento
+    saida, _ = processar_zip_sync(entrada, OpcoesProcessamento(usar_cache=False))
+    with zipfile.ZipFile(saida) as z:
+        geral = list(csv.reader(io.StringIO(z.read("relatorio_geral.csv").decode("utf-8-sig")), delimiter=";"))
+    esperado = {linha[0].lower(): (int(linha[1]), linha[2].replace(",", ".")) for linha in geral[1:4] if linha[1] != "0"}
+
+    resposta = client.post("/agregacoes/?dimensoes=categoria&dimensoes=emitente", files={"arquivo": arquivo})
+    corpo = resposta.json()
+    assert {linha["chave"]: (linha["documentos"], linha["v_nf"]) for linha in corpo["dimensoes"]["categoria"]} == esperado
+    assert corpo["documentos"] == 2
+    emitente_cancelado = ET.fromstring(notas[0]).xpath("string(//*[local-name()='emit']/*[local-name()='CNPJ'])")
+    assert emitente_cancelado not in [linha["chave"] for linha in corpo["dimensoes"]["emitente"]]
+
+    # Pedidas, as canceladas vêm em grupo próprio; eventos nunca entram
+    resposta = client.post(
+        "/agregacoes/?dimensoes=categoria&categorias=cancelados&categorias=eventos", files={"arquivo": arquivo}
+    )
+    assert [(linha["chave"], linha["documentos"]) for linha in resposta.json()["dimensoes"]["categoria"]] == [
+        ("cancelados", 1)
+    ]
+
+
+def test_csv_vazio_tem_cabecalho():
+    assert relatorio_csv(agregar(ColunasCabecalhos())).decode("utf-8-sig").startswith("Dimensão;Chave")
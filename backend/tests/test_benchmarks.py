@@ -0,0 +1,42 @@
+import sys
+import os
+
+# Add the backend directory to the path so we can import the benchmark package
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.corpus import PerfilCorpus, gerar_corpus_zip
+from benchmarks.executar import executar_benchmark, comparar, percentil
+from processamento import OpcoesProcessamento, processar_zip_sync
+
+
+def test_corpus_reproduzivel_e_com_a_mistura_pedida():
+    perfil = PerfilCorpus(arquivos=300, itens_max=5, cstat={"100": 1, "204": 1}, tpemis={"1": 1, "9": 1},
+                          proporcao_corrompidos=0.1, proporcao_sem_protocolo=0.1, proporcao_canceladas=0.1, semente=7)
+    conteudo = gerar_corpus_zip(perfil)
+    assert conteudo == gerar_corpus_zip(perfil)
+
+    _, stats = processar_zip_sync(conteudo, OpcoesProcessamento(usar_cache=False))
+    # Cada cancelamento é um arquivo a mais (o evento) e tira a nota de aprovados/contingência
+    assert stats["eventos"]["qtd"] == stats["cancelados"]["qtd"]
+    assert sum(cat["qtd"] for cat in stats.values()) == 300 + stats["eventos"]["qtd"]
+    # Todas as categorias aparecem; rejeitados inclui corrompidos, sem protocolo e cStat 204
+    assert all(cat["qtd"] > 0 for cat in stats.values())
+    assert stats["rejeitados"]["qtd"] > stats["aprovados"]["qtd"] / 2
+
+
+def test_resultado_no_formato_comparavel():
+    resultado = executar_benchmark(PerfilCorpus(arquivos=20, itens_max=3), repeticoes=2, isolar=False)
+
+    for cenario in ("biblioteca", "endpoint"):
+        medidas = resultado["cenarios"][cenario]
+        assert medidas["repeticoes"] == 2
+        assert medidas["arquivos_por_s"] > 0 and medidas["p99_s"] >= medidas["p50_s"]
+
+    assert comparar(resultado, resultado, tolerancia=0.1) == []
+    pior = {**resultado, "cenarios": {"biblioteca": {**resultado["cenarios"]["biblioteca"], "arquivos_por_s": 1e9}}}
+    assert comparar(resultado, pior, tolerancia=0.1) == ["biblioteca.arquivos_por_s -100.0%"]
+
+
+def test_percentil_nearest_rank():
+    assert percentil([3, 1, 2], 50) == 2
+    assert percentil(list(range(1, 101)), 99) == 99
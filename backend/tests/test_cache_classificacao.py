@@ -0,0 +1,74 @@
+import io
+import zipfile
+import sys
+import os
+
+# Add the backend directory to the path so we can import processar_zip_sync
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import processamento
+from processamento import OpcoesProcessamento, processar_zip_sync
+from cache_classificacao import CacheClassificacao
+from extracao import DadosNFe
+from test_paralelo import montar_zip_misto, conteudo_zip
+
+
+def test_segundo_envio_nao_analisa_xmls(monkeypatch):
+    cache = CacheClassificacao(limite=1000)
+    monkeypatch.setattr(processamento, "cache_global", cache)
+    entrada = montar_zip_misto(20)
+
+    saida_1, stats_1 = processar_zip_sync(entrada)
+
+    analisados = []
+    extrair_original = processamento.extrair_ou_none
+
+    def contar(origem, nome_arquivo, itens=None, cabecalhos=None):
+        analisados.append(nome_arquivo)
+        return extrair_original(origem, nome_arquivo, itens, cabecalhos)
+
+    monkeypatch.setattr(processamento, "extrair_ou_none", contar)
+    saida_2, stats_2 = processar_zip_sync(entrada)
+
+    assert stats_2 == stats_1
+    assert conteudo_zip(saida_2) == conteudo_zip(saida_1)
+    # XMLs corrompidos não são guardados: só eles são analisados de novo
+    assert len(analisados) == 3
+    assert cache.acertos == 17
+
+
+def test_cache_desligado_por_requisicao(monkeypatch):
+    cache = CacheClassificacao(limite=1000)
+    monkeypatch.setattr(processamento, "cache_global", cache)
+
+    processar_zip_sync(montar_zip_misto(10), OpcoesProcessamento(usar_cache=False))
+
+    assert cache.estatisticas()["entradas"] == 0
+
+
+def test_lru_remove_mais_antigo_e_disco_sobrevive(tmp_path):
+    caminho = str(tmp_path / "cache.sqlite")
+    dados = DadosNFe("100", "ok", "1", 1.0, 0.18)
+
+    cache = CacheClassificacao(limite=2, caminho_disco=caminho)
+    for i in range(3):
+        cache.guardar((i, 10), dados)
+    cache.descarregar()
+
+    assert cache.remocoes == 1
+    assert cache.obter((0, 10)) == dados  # saiu da memória, mas veio do disco
+    assert cache.acertos_disco == 1
+
+    # Novo processo (nova instância): o nível em disco continua valendo
+    assert CacheClassificacao(limite=2, caminho_disco=caminho).obter((2, 10)) == dados
+
+
+def test_hash_de_conteudo_diferencia_colisao_de_crc(monkeypatch):
+    cache = CacheClassificacao(limite=1000, hash_conteudo=True)
+    monkeypatch.setattr(processamento, "cache_global", cache)
+
+    processar_zip_sync(montar_zip_misto(10))
+    processar_zip_sync(montar_zip_misto(10))
+
+    assert cache.acertos == 8
+    assert all(len(chave) == 3 for chave in cache._memoria)
@@ -0,0 +1,187 @@
+import io
+import csv
+import sys
+import os
+import random
+import zipfile
+
+import pytest
+
+# Add the backend directory to the path so we can import the cancellation correlation
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import processamento
+from processamento import OpcoesProcessamento, processar_zip_sync, processar_xmls_sync, resumir_zip_sync
+from agregacao import ColunasCabecalhos
+from extracao import DadosNFe, extrair_dados_nfe
+from benchmarks.corpus import gerar_nfe, gerar_evento_cancelamento
+
+
+def montar_lote():
+    """
+    Seis notas autorizadas: a 1ª é cancelada por um evento que vem DEPOIS dela, a 2ª por um
+    evento que vem ANTES; a 3ª tem um cancelamento não homologado e a 4ª uma carta de correção.
+    """
+    aleatorio = random.Random(3)
+    notas = [gerar_nfe(aleatorio, numero, 2) for numero in range(1, 7)]
+    chaves = [extrair_dados_nfe(nota).chave for nota in notas]
+    carta_correcao = gerar_evento_cancelamento(chaves[3]).replace(b"110111", b"110110")
+
+    membros = [
+        ("eventos/cancelamento_2.xml", gerar_evento_cancelamento(chaves[1])),
+        *[(f"notas/nfe_{i}.xml", nota) for i, nota in enumerate(notas)],
+        ("eventos/cancelamento_1.xml", gerar_evento_cancelamento(chaves[0])),
+        ("eventos/cancelamento_3.xml", gerar_evento_cancelamento(chaves[2], cstat="573")),
+        ("eventos/cce_4.xml", carta_correcao),
+    ]
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as z:
+        for nome, conteudo in membros:
+            z.writestr(nome, conteudo)
+    return buffer.getvalue(), notas, chaves
+
+
+ENTRADA, NOTAS, CHAVES = montar_lote()
+
+
+def conteudo_zip(buffer):
+    with zipfile.ZipFile(buffer) as z:
+        return {info.filename: z.read(info) for info in z.infolist()}
+
+
+def test_extracao_da_chave_e_do_evento():
+    dados = extrair_dados_nfe(NOTAS[0])
+    assert len(dados.chave) == 44 and dados.tp_evento is None
+
+    evento = extrair_dados_nfe(gerar_evento_cancelamento(CHAVES[0]))
+    assert (evento.chave, evento.tp_evento, evento.cstat) == (CHAVES[0], "110111", "135")
+    assert processamento.classificar(evento) == "eventos"
+    assert processamento.cancela_nota(evento)
+    assert not processamento.cancela_nota(extrair_dados_nfe(gerar_evento_cancelamento(CHAVES[0], cstat="573")))
+    # Registrado sem vínculo com a NF-e não cancela; homologado fora de prazo, sim
+    assert not processamento.cancela_nota(extrair_dados_nfe(gerar_evento_cancelamento(CHAVES[0], cstat="136")))
+    assert processamento.cancela_nota(extrair_dados_nfe(gerar_evento_cancelamento(CHAVES[0], cstat="155")))
+
+
+def test_notas_canceladas_em_qualquer_ordem():
+    saida, stats = processar_zip_sync(ENTRADA, OpcoesProcessamento(usar_cache=False))
+    arquivos = conteudo_zip(saida)
+
+    assert arquivos["cancelados/nfe_0.xml"] == NOTAS[0]
+    assert arquivos["cancelados/nfe_1.xml"] == NOTAS[1]
+    for i in range(2, 6):
+        assert arquivos[f"aprovados/nfe_{i}.xml"] == NOTAS[i]
+    assert {nome for nome in arquivos if nome.startswith("eventos/")} == {
+        "eventos/cancelamento_1.xml", "eventos/cancelamento_2.xml", "eventos/cancelamento_3.xml", "eventos/cce_4.xml"
+    }
+
+    # Os valores das canceladas saem dos aprovados
+    valores = [extrair_dados_nfe(nota).v_nf for nota in NOTAS]
+    assert stats["aprovados"]["qtd"] == 4 and stats["cancelados"]["qtd"] == 2
+    assert stats["aprovados"]["valor"] == pytest.approx(sum(valores[2:]))
+    assert stats["cancelados"]["valor"] == pytest.approx(sum(valores[:2]))
+    assert stats["eventos"]["qtd"] == 4
+
+    relatorio = arquivos["cancelados/relatorio_cancelamentos.csv"].decode("utf-8-sig")
+    linhas = list(csv.reader(io.StringIO(relatorio), delimiter=";"))
+    assert linhas[1:] == [
+        ["nfe_1.xml", CHAVES[1], "cancelamento_2.xml"],
+        ["nfe_0.xml", CHAVES[0], "cancelamento_1.xml"],
+    ]
+
+
+def test_notas_esperam_so_como_registro_compacto(monkeypatch):
+    leituras = []
+    ler = zipfile.ZipFile.read
+    monkeypatch.setattr(zipfile.ZipFile, "read", lambda self, nome, *args: leituras.append(nome.filename) or ler(self, nome, *args))
+
+    # Com cópia bruta nenhum membro é lido inteiro: as notas que esperaram são copiadas comprimidas
+    saida, _ = processar_zip_sync(ENTRADA, OpcoesProcessamento(usar_cache=False))
+    assert leituras == []
+    # Os demais documentos são gravados na hora; as notas autorizadas, no fim, na ordem do ZIP
+    nomes = zipfile.ZipFile(saida).namelist()
+    assert nomes[:6] == [
+        "eventos/cancelamento_2.xml", "cancelados/nfe_1.xml", "eventos/cancelamento_1.xml",
+        "eventos/cancelamento_3.xml", "eventos/cce_4.xml", "cancelados/nfe_0.xml",
+    ]
+
+    # Sem cópia bruta só as notas que esperaram são relidas (uma vez) na gravação
+    processar_zip_sync(ENTRADA, OpcoesProcessamento(copia_bruta=False, usar_cache=False))
+    esperaram = [f"notas/nfe_{i}.xml" for i in (0, 2, 3, 4, 5)]
+    assert sorted(leituras) == sorted(zipfile.ZipFile(io.BytesIO(ENTRADA)).namelist() + esperaram)
+
+
+def test_paralelo_identico_ao_serial(monkeypatch):
+    saida_serial, stats_serial = processar_zip_sync(ENTRADA, OpcoesProcessamento(processos=1, usar_cache=False))
+
+    monkeypatch.setattr(processamento, "MIN_ARQUIVOS_PARALELO", 1)
+    saida_paralela, stats_paralela = processar_zip_sync(
+        ENTRADA, OpcoesProcessamento(processos=2, tamanho_lote=2, usar_cache=False)
+    )
+
+    assert stats_paralela == stats_serial
+    assert conteudo_zip(saida_paralela) == conteudo_zip(saida_serial)
+
+    # Sem cópia bruta as notas adiadas são relidas do ZIP de entrada
+    saida_recomprimida, _ = processar_zip_sync(ENTRADA, OpcoesProcessamento(copia_bruta=False, usar_cache=False))
+    assert conteudo_zip(saida_recomprimida) == conteudo_zip(saida_serial)
+
+
+def test_colunas_e_resumo_corrigidos():
+    cabecalhos = ColunasCabecalhos()
+    _, stats = processar_zip_sync(ENTRADA, OpcoesProcessamento(usar_cache=False, cabecalhos=cabecalhos))
+    categorias = [c.decode("ascii").rstrip("\x00") for c in cabecalhos.como_numpy()["categoria"]]
+    assert categorias.count("cancelados") == 2 and categorias.count("aprovados") == 4
+
+    resumo = resumir_zip_sync(ENTRADA, OpcoesProcessamento(usar_cache=False))
+    assert resumo["dados_gerais"] == stats
+    assert {item["chave"] for item in resumo["cancelados"]} == set(CHAVES[:2])
+
+
+def test_totais_sem_residuos_de_ponto_flutuante():
+    resumo = processamento.ResumoLote()
+    notas = [DadosNFe("100", "Autorizado", "1", valor, valor / 10, str(i) * 44) for i, valor in enumerate((0.1, 0.2, 0.3))]
+    for i, nota in enumerate(notas):
+        resumo.registrar(f"nfe_{i}.xml", nota)
+    for i, nota in enumerate(notas[:2]):
+        resumo.cancelar(f"nfe_{i}.xml", nota, "aprovados", "evento.xml")
+
+    # 0.1 + 0.2 + 0.3 - 0.1 - 0.2 em float daria 0.3000000000000001
+    assert resumo.dados_gerais["aprovados"] == {"qtd": 1, "valor": 0.3, "icms": 0.03}
+    assert resumo.dados_gerais["cancelados"] == {"qtd": 2, "valor": 0.3, "icms": 0.03}
+
+    resumo.cancelar("nfe_2.xml", notas[2], "aprovados", "evento.xml")
+    assert resumo.dados_gerais["aprovados"] == {"qtd": 0, "valor": 0.0, "icms": 0.0}
+
+
+def test_layout_do_relatorio_geral():
+    saida, stats = processar_zip_sync(ENTRADA, OpcoesProcessamento(usar_cache=False))
+    arquivos = conteudo_zip(saida)
+    relatorio = arquivos["relatorio_geral.csv"].decode("utf-8-sig")
+    linhas = list(csv.reader(io.StringIO(relatorio), delimiter=";"))
+
+    # Sempre as cinco categorias, nesta ordem, e o total geral
+    assert [linha[0] for linha in linhas] == [
+        "Categoria", "Aprovados", "Contingencia", "Rejeitados", "Cancelados", "Eventos", "TOTAL GERAL"
+    ]
+    assert [int(linha[1]) for linha in linhas[1:]] == [4, 0, 0, 2, 4, 10]
+    # Eventos (inclusive o cancelamento não homologado) não entram nas rejeições
+    assert "rejeitados/relatorio_erros.csv" not in arquivos
+
+    # Lote sem eventos: as linhas continuam lá, zeradas
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as z:
+        z.writestr("nfe.xml", NOTAS[0])
+    saida, _ = processar_zip_sync(buffer.getvalue(), OpcoesProcessamento(usar_cache=False))
+    linhas = conteudo_zip(saida)["relatorio_geral.csv"]
+    assert linhas.decode("utf-8-sig").splitlines()[4:6] == ["Cancelados;0;0,00;0,00", "Eventos;0;0,00;0,00"]
+
+
+def test_xmls_soltos_com_a_mesma_correlacao():
+    with zipfile.ZipFile(io.BytesIO(ENTRADA)) as z:
+        partes = [(info.filename, z.read(info)) for info in z.infolist()]
+    saida_zip, stats_zip = processar_zip_sync(ENTRADA, OpcoesProcessamento(usar_cache=False))
+    saida_xmls, stats_xmls = processar_xmls_sync(iter(partes))
+
+    assert stats_xmls == stats_zip
+    assert conteudo_zip(saida_xmls) == conteudo_zip(saida_zip)
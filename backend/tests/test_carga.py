@@ -0,0 +1,61 @@
+import sys
+import os
+import asyncio
+
+import pytest
+
+# Add the backend directory to the path so we can import the load-test module
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+from benchmarks.carga import (
+    ler_mistura, montar_lotes, alvo_em_processo, alvo_http, executar_etapa, rss_mb, post_http
+)
+
+
+LOTES = montar_lotes(ler_mistura(["5:2", "15"]), itens_max=3)
+
+
+def test_mistura():
+    assert ler_mistura(["50:3", "500"]) == [(50, 3), (500, 1)]
+    with pytest.raises(ValueError):
+        ler_mistura(["50:0"])
+
+
+@pytest.mark.parametrize("modelo", [{"concorrencia": 3}, {"taxa": 50.0}])
+def test_etapa_em_processo(modelo):
+    async def rodar():
+        main.configurar_threadpool()
+        enviar = alvo_em_processo(main.app, "/processar-zip/", "usar_cache=false")
+        return await executar_etapa(enviar, LOTES, duracao=10, requisicoes=8, pid=os.getpid(), intervalo_rss=0.01, **modelo)
+
+    etapa = asyncio.run(rodar())
+    assert etapa["requisicoes"] == etapa["sucesso"] == 8 and etapa["erros"] == {}
+    assert etapa["requisicoes_por_s"] > 0 and etapa["p99_s"] >= etapa["p50_s"]
+    assert set(etapa["por_lote"]) <= {"5", "15"}
+    if rss_mb(os.getpid()) is not None:
+        assert etapa["rss_pico_mb"] > 0 and etapa["rss"][-1][2] == 0
+
+
+def test_cliente_http_e_erros():
+    async def servidor(leitor, escritor):
+        await leitor.readuntil(b"\r\n\r\n")
+        escritor.write(b"HTTP/1.1 503 Service Unavailable\r\nRetry-After: 1\r\nContent-Length: 4\r\n\r\nlota")
+        await escritor.drain()
+        escritor.close()
+
+    async def rodar():
+        aberto = await asyncio.start_server(servidor, "127.0.0.1", 0)
+        porta = aberto.sockets[0].getsockname()[1]
+        async with aberto:
+            resposta = await post_http("127.0.0.1", porta, "/processar-zip/", b"x", "application/zip")
+            etapa = await executar_etapa(
+                alvo_http(f"http://127.0.0.1:{porta}", "/processar-zip/", ""), LOTES[:1],
+                concorrencia=2, duracao=10, requisicoes=4,
+            )
+        return resposta, etapa
+
+    resposta, etapa = asyncio.run(rodar())
+    assert resposta == (503, 4)
+    assert etapa["taxa_erro"] == 1.0
+    assert etapa["erros"] == {"503": 4}
@@ -0,0 +1,113 @@
+import sys
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+
+# Add the backend directory to the path so we can import the catalog module
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import processamento
+import main
+from catalogo import CatalogoProdutos
+from processamento import OpcoesProcessamento, processar_zip_sync
+from benchmarks.corpus import PerfilCorpus, gerar_corpus_zip
+from test_agregacao import montar_zip
+
+
+def montar_nfe(chave, emitente, produtos):
+    dets = "".join(
+        f'<det nItem="{n}"><prod><cProd>{cprod}</cProd><xProd>{xprod}</xProd><NCM>{ncm}</NCM>'
+        f'<CFOP>5102</CFOP><uCom>UN</uCom><qCom>2.0000</qCom><vUnCom>1.50</vUnCom><vProd>3.00</vProd></prod></det>'
+        for n, (cprod, xprod, ncm) in enumerate(produtos, start=1)
+    )
+    return f"""<?xml version="1.0" encoding="UTF-8"?>
+<nfeProc xmlns="http://www.portalfiscal.inf.br/nfe">
+  <NFe><infNFe Id="NFe{chave}">
+    <ide><dhEmi>2024-03-05T10:00:00-03:00</dhEmi><tpEmis>1</tpEmis></ide>
+    <emit><CNPJ>{emitente}</CNPJ></emit>
+    {dets}
+    <total><ICMSTot><vICMS>0.00</vICMS><vNF>3.00</vNF></ICMSTot></total>
+  </infNFe></NFe>
+  <protNFe><infProt><cStat>100</cStat><xMotivo>Autorizado</xMotivo></infProt></protNFe>
+</nfeProc>""".encode()
+
+
+NOTAS = [
+    montar_nfe("1" * 44, "11111111000111", [("PAR-38", "PARAFUSO SEXTAVADO INOX 3/8", "73181500"),
+                                            ("CAF-01", "Café torrado moído 500g", "09012100")]),
+    montar_nfe("2" * 44, "22222222000122", [("PAR-14", "Parafuso francês 1/4", "73181600")]),
+]
+
+
+@pytest.fixture
+def catalogo(tmp_path, monkeypatch):
+    catalogo = CatalogoProdutos(str(tmp_path / "catalogo.sqlite"))
+    monkeypatch.setattr(processamento, "catalogo_global", catalogo)
+    monkeypatch.setattr(main, "catalogo_global", catalogo)
+    return catalogo
+
+
+def test_processamento_alimenta_o_catalogo(catalogo):
+    processar_zip_sync(montar_zip(NOTAS), OpcoesProcessamento(usar_cache=False))
+    catalogo.aguardar()
+
+    resultado = catalogo.buscar("parafuso")
+    assert {item["cprod"] for item in resultado["itens"]} == {"PAR-38", "PAR-14"}
+    # Prefixo de cada palavra, sem diferenciar acentos
+    assert [item["xprod"] for item in catalogo.buscar("cafe tor")["itens"]] == ["Café torrado moído 500g"]
+    # Filtros pelos índices B-tree (NCM por prefixo, emitente exato)
+    assert [item["cprod"] for item in catalogo.buscar(ncm="731815")["itens"]] == ["PAR-38"]
+    item = catalogo.buscar("parafuso", emitente="22222222000122")["itens"][0]
+    assert (item["chave"], item["n_item"], item["qcom"], item["vprod_centavos"], item["data_emissao"]) == (
+        "2" * 44, 1, 2.0, 300, 20240305
+    )
+    # Texto com sintaxe do FTS5 é tratado como palavras comuns
+    assert catalogo.buscar('"inox" OR NEAR(')["itens"] == []
+
+
+def test_reenvio_nao_duplica_itens(catalogo):
+    for _ in range(2):
+        processar_zip_sync(montar_zip(NOTAS), OpcoesProcessamento(usar_cache=False))
+    catalogo.aguardar()
+
+    assert catalogo.estatisticas()["itens"] == 3
+    assert len(catalogo.buscar("parafuso")["itens"]) == 2
+
+
+def test_paginacao_e_modo_paralelo(catalogo, monkeypatch):
+    monkeypatch.setattr(processamento, "MIN_ARQUIVOS_PARALELO", 1)
+    corpus = gerar_corpus_zip(PerfilCorpus(arquivos=40, itens_max=5, semente=5))
+    processar_zip_sync(corpus, OpcoesProcessamento(processos=2, tamanho_lote=7))
+    catalogo.aguardar()
+
+    total = catalogo.estatisticas()["itens"]
+    assert total > 40
+    pagina = catalogo.buscar(limite=total - 1)
+    assert pagina["mais"] and len(pagina["itens"]) == total - 1
+    assert not catalogo.buscar(limite=total)["mais"]
+
+
+def test_endpoint_de_busca(catalogo):
+    client = TestClient(main.app)
+    processar_zip_sync(montar_zip(NOTAS), OpcoesProcessamento(usar_cache=False))
+    catalogo.aguardar()
+
+    resposta = client.get("/produtos/", params={"q": "parafuso", "cprod": "PAR-1"})
+    assert resposta.status_code == 200
+    assert [item["xprod"] for item in resposta.json()["itens"]] == ["Parafuso francês 1/4"]
+
+
+def test_catalogo_desligado():
+    client = TestClient(main.app)
+    assert client.get("/produtos/", params={"q": "x"}).status_code == 503
+
+
+def test_reenvio_sem_chave_de_acesso_nao_duplica(catalogo):
+    sem_chave = montar_nfe("", "33333333000133", [("ARR-01", "Arruela lisa", "73182200")])
+    for _ in range(2):
+        processar_zip_sync(montar_zip([sem_chave]), OpcoesProcessamento(usar_cache=False))
+    catalogo.aguardar()
+
+    assert catalogo.estatisticas()["itens"] == 1
+    assert catalogo.buscar("arruela")["itens"][0]["chave"] is None
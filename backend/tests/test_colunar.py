@@ -0,0 +1,92 @@
+import io
+import zipfile
+import sys
+import os
+
+import pytest
+
+# Add the backend directory to the path so we can import the columnar module
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import processamento
+from processamento import OpcoesProcessamento, processar_zip_sync
+from colunar import ColunasItens, TabelaColunar, gravar_colunar, ler_colunar, NOME_ARQUIVO_ITENS
+from extracao import extrair_dados_nfe
+from benchmarks.corpus import PerfilCorpus, gerar_corpus_zip, iterar_corpus
+from lxml import etree as ET
+
+
+def ler_itens_do_zip(saida):
+    with zipfile.ZipFile(saida) as z:
+        return ler_colunar(z.read(NOME_ARQUIVO_ITENS))
+
+
+def test_formato_ida_e_volta():
+    tabela = TabelaColunar([("n", "<u4"), ("valor", "<i8"), ("q", "<f8"), ("ncm", "|S8"), ("nome", "utf8")])
+    for n, nome in enumerate(["café", "", "PARAFUSO 3/8"]):
+        tabela.colunas["n"].valores.append(n)
+        tabela.colunas["valor"].valores.append(-n * 10**12)
+        tabela.colunas["q"].valores.append(n / 3)
+        tabela.colunas["ncm"].adicionar(f"0{n}012100")
+        tabela.colunas["nome"].adicionar(nome)
+
+    buffer = io.BytesIO()
+    tamanho = gravar_colunar(buffer, {"t": tabela})
+    assert tamanho == len(buffer.getvalue())
+
+    lido = ler_colunar(buffer.getvalue())["t"]
+    assert list(lido["n"]) == [0, 1, 2]
+    assert list(lido["valor"]) == [0, -10**12, -2 * 10**12]
+    assert list(lido["q"]) == [0, 1 / 3, 2 / 3]
+    assert lido["ncm"] == ["00012100", "01012100", "02012100"]
+    assert lido["nome"] == ["café", "", "PARAFUSO 3/8"]
+
+
+def test_itens_extraidos_na_mesma_passagem():
+    _, xml = next(iterar_corpus(PerfilCorpus(arquivos=1, itens_min=4, itens_max=4, proporcao_corrompidos=0)))
+    itens = ColunasItens()
+    extrair_dados_nfe(xml, itens)
+    itens.concluir_documento("nota.xml", "aprovados")
+
+    assert len(itens) == 4
+    arvore = ET.fromstring(xml)
+    ns = {"n": "http://www.portalfiscal.inf.br/nfe"}
+    vprod = [round(float(v) * 100) for v in arvore.xpath("//n:det/n:prod/n:vProd/text()", namespaces=ns)]
+    assert list(itens.itens.colunas["vprod_centavos"].valores) == vprod
+    chave = arvore.xpath("//n:infNFe/@Id", namespaces=ns)[0][3:]
+    assert ler_colunar(_gravar(itens))["documentos"]["chave"] == [chave]
+
+
+def _gravar(itens):
+    buffer = io.BytesIO()
+    itens.gravar(buffer)
+    return buffer.getvalue()
+
+
+def test_xml_corrompido_nao_deixa_itens_orfaos():
+    _, xml = next(iterar_corpus(PerfilCorpus(arquivos=1, itens_min=5, itens_max=5, proporcao_corrompidos=0)))
+    itens = ColunasItens()
+    with pytest.raises(ET.ParseError):
+        extrair_dados_nfe(xml[: int(len(xml) * 0.8)], itens)
+    assert len(itens) == 0
+
+
+def test_exportacao_paralela_igual_a_serial(monkeypatch):
+    entrada = gerar_corpus_zip(PerfilCorpus(arquivos=60, itens_max=8, proporcao_corrompidos=0.1, semente=3))
+
+    saida_serial, stats_serial = processar_zip_sync(entrada, OpcoesProcessamento(processos=1, exportar_itens=True))
+    monkeypatch.setattr(processamento, "MIN_ARQUIVOS_PARALELO", 1)
+    saida_paralela, stats_paralela = processar_zip_sync(
+        entrada, OpcoesProcessamento(processos=2, tamanho_lote=7, exportar_itens=True)
+    )
+
+    assert stats_paralela == stats_serial
+    serial = ler_itens_do_zip(saida_serial)
+    paralela = ler_itens_do_zip(saida_paralela)
+    assert serial == paralela
+
+    documentos = serial["documentos"]
+    # Documentos corrompidos ficam de fora; os demais aparecem uma vez, na ordem do ZIP
+    validos = sum(cat["qtd"] for cat in stats_serial.values()) - stats_serial["rejeitados"]["qtd"]
+    assert documentos["categoria"].count("aprovados") + documentos["categoria"].count("contingencia") == validos
+    assert max(serial["itens"]["documento"]) == len(documentos["chave"]) - 1
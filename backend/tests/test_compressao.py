@@ -0,0 +1,86 @@
+import io
+import sys
+import os
+import random
+import zipfile
+
+import pytest
+from fastapi.testclient import TestClient
+
+# Add the backend directory to the path so we can import the compression module
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import app
+from compressao import GravadorParalelo, validar_politica
+from processamento import OpcoesProcessamento, processar_zip_sync
+from benchmarks.corpus import PerfilCorpus, gerar_corpus_zip
+
+client = TestClient(app)
+
+
+def conteudo(saida):
+    with zipfile.ZipFile(saida) as z:
+        assert z.testzip() is None
+        return [(info.filename, info.compress_type, z.read(info)) for info in z.infolist()]
+
+
+def test_gravador_paralelo_preserva_ordem_e_bytes():
+    entrada = io.BytesIO()
+    with zipfile.ZipFile(entrada, "w", zipfile.ZIP_DEFLATED) as z:
+        z.writestr("bruto.xml", b"<a>" * 5000)
+
+    aleatorio = random.Random(1)
+    payloads = [aleatorio.randbytes(i * 37) + b"<nfe/>" * i for i in range(50)]
+    saidas = {}
+    for threads in (1, 3):
+        saida = io.BytesIO()
+        with zipfile.ZipFile(entrada) as zip_in, zipfile.ZipFile(saida, "w") as zip_out:
+            gravador = GravadorParalelo(zip_out, "rapida", threads=threads)
+            for i, dados in enumerate(payloads):
+                gravador.adicionar(f"x/{i}.xml", dados)
+                if i == 25:
+                    gravador.adicionar_bruto(zip_in, zip_in.getinfo("bruto.xml"), "copiado.xml")
+            gravador.concluir()
+            zip_out.writestr("relatorio.csv", b"fim")
+        saidas[threads] = saida.getvalue()
+
+    nomes = [nome for nome, _, _ in conteudo(io.BytesIO(saidas[3]))]
+    assert nomes[25:28] == ["x/25.xml", "copiado.xml", "x/26.xml"] and nomes[-1] == "relatorio.csv"
+    assert conteudo(io.BytesIO(saidas[1])) == conteudo(io.BytesIO(saidas[3]))
+
+
+@pytest.mark.parametrize("politica, metodo", [("armazenar", zipfile.ZIP_STORED), ("maxima", zipfile.ZIP_DEFLATED)])
+def test_politicas_mudam_so_a_compressao(politica, metodo):
+    entrada = gerar_corpus_zip(PerfilCorpus(arquivos=30, semente=4))
+
+    # Com a cópia bruta ligada (padrão), os membros DEFLATED também seguem a política pedida
+    padrao, stats_padrao = processar_zip_sync(entrada, OpcoesProcessamento(usar_cache=False))
+    saida, stats = processar_zip_sync(entrada, OpcoesProcessamento(usar_cache=False, compressao=politica))
+
+    assert stats == stats_padrao
+    esperado = [(nome, dados) for nome, _, dados in conteudo(padrao)]
+    obtido = conteudo(saida)
+    assert [(nome, dados) for nome, _, dados in obtido] == esperado
+    assert {tipo for _, tipo, _ in obtido} == {metodo}
+
+
+def test_pool_reaproveitado_entre_requisicoes():
+    zip_out = zipfile.ZipFile(io.BytesIO(), "w")
+    pools = []
+    for rodada, threads in enumerate((3, 2, 3, 2)):
+        gravador = GravadorParalelo(zip_out, threads=threads)
+        for i in range(10):
+            gravador.adicionar(f"{rodada}/{i}.xml", b"<a/>" * 1000)
+        gravador.concluir()
+        pools.append(gravador._pool)
+    # Trocar o número de threads não cria (nem abandona) pools: um por tamanho, reaproveitado
+    assert pools[0] is pools[2] and pools[1] is pools[3] and pools[0] is not pools[1]
+
+
+def test_politica_invalida():
+    with pytest.raises(ValueError):
+        validar_politica("zstd-99")
+
+    arquivo = ("notas.zip", gerar_corpus_zip(PerfilCorpus(arquivos=2)), "application/zip")
+    assert client.post("/processar-zip/?compressao=ultra", files={"arquivo": arquivo}).status_code == 400
+    assert client.post("/processar-zip/?compressao=rapida", files={"arquivo": arquivo}).status_code == 200
@@ -0,0 +1,73 @@
+import sys
+import os
+
+import pytest
+
+# Add the backend directory to the path so we can import the extraction engine
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lxml import etree as ET
+
+from extracao import extrair_dados_nfe, extrair_resumo_nfe, CSTAT_AUSENTE, XMOTIVO_AUSENTE
+
+
+def montar_nfeproc(cstat="100", tpemis="1", itens=3, vnf="100.00", vicms="18.00"):
+    dets = "".join(
+        f"""<det nItem="{i}"><prod><cProd>{i}</cProd><vProd>1.00</vProd></prod>
+            <imposto><ICMS><ICMS00><vICMS>9.99</vICMS></ICMS00></ICMS></imposto></det>"""
+        for i in range(1, itens + 1)
+    )
+    return f"""<nfeProc xmlns="http://www.portalfiscal.inf.br/nfe" versao="4.00">
+        <NFe><infNFe>
+            <ide><tpEmis>{tpemis}</tpEmis></ide>
+            {dets}
+            <total><ICMSTot><vICMS>{vicms}</vICMS><vNF>{vnf}</vNF></ICMSTot></total>
+        </infNFe></NFe>
+        <protNFe><infProt><cStat>{cstat}</cStat><xMotivo>Autorizado o uso da NF-e</xMotivo></infProt></protNFe>
+    </nfeProc>""".encode()
+
+
+def test_extrai_campos_de_nfeproc():
+    dados = extrair_dados_nfe(montar_nfeproc(itens=50))
+
+    assert dados.cstat == "100"
+    assert dados.xmotivo == "Autorizado o uso da NF-e"
+    assert dados.tpemis == "1"
+    # vICMS dos itens não pode contaminar o total do ICMSTot
+    assert dados.v_icms == 18.0
+    assert dados.v_nf == 100.0
+
+
+def test_para_no_fim_do_protocolo():
+    # Lixo depois do protocolo não é lido: a extração termina no fim do 'infProt'
+    xml = montar_nfeproc().replace(b"</nfeProc>", b"<lixo>")
+    assert extrair_dados_nfe(xml).cstat == "100"
+
+
+def test_documento_sem_protocolo_usa_padroes():
+    xml = b"<NFe><infNFe><ide><tpEmis>9</tpEmis></ide></infNFe></NFe>"
+    dados = extrair_dados_nfe(xml)
+
+    assert dados.cstat == CSTAT_AUSENTE
+    assert dados.xmotivo == XMOTIVO_AUSENTE
+    assert dados.tpemis == "9"
+    assert dados.v_nf == 0.0
+
+
+def test_xml_corrompido_levanta_parse_error():
+    with pytest.raises(ET.ParseError):
+        extrair_dados_nfe(b"<nfeProc><NFe>")
+
+
+@pytest.mark.parametrize("xml", [
+    montar_nfeproc(itens=50),
+    montar_nfeproc(cstat="302", tpemis="9"),
+    montar_nfeproc().replace(b"</nfeProc>", b"<lixo>"),
+    # Um segundo protocolo depois do primeiro completo é ignorado pelos dois motores
+    montar_nfeproc().replace(b"</nfeProc>", b"<infProt><cStat>999</cStat></infProt></nfeProc>"),
+    b"<NFe><infNFe><ide><tpEmis>9</tpEmis></ide></infNFe></NFe>",
+])
+def test_motor_em_arvore_igual_ao_iterparse(xml):
+    assert extrair_resumo_nfe(xml) == extrair_dados_nfe(xml)
+    with pytest.raises(ET.ParseError):
+        extrair_resumo_nfe(b"<nfeProc><NFe>")
@@ -0,0 +1,85 @@
+import io
+import time
+import zipfile
+import sys
+import os
+
+import pytest
+
+# Add the backend directory to the path so we can import the job manager
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from jobs import GerenciadorJobs, FilaCheia, CONCLUIDO
+from processamento import OpcoesProcessamento, processar_zip_sync
+from test_paralelo import montar_zip_misto, conteudo_zip
+
+
+def aguardar(gerenciador, job_id, timeout=10):
+    limite = time.time() + timeout
+    while time.time() < limite:
+        job = gerenciador.obter(job_id)
+        if job.concluido_em is not None:
+            return job
+        time.sleep(0.01)
+    raise AssertionError("job não terminou")
+
+
+def test_job_processa_em_segundo_plano(tmp_path):
+    gerenciador = GerenciadorJobs(workers=1, limite_fila=2, diretorio=str(tmp_path))
+    entrada = montar_zip_misto(12)
+
+    job = gerenciador.submeter(io.BytesIO(entrada), "lote.zip", opcoes=OpcoesProcessamento(usar_cache=False))
+    job = aguardar(gerenciador, job.id)
+
+    assert job.status == CONCLUIDO
+    status = job.como_dict(gerenciador.ttl)
+    assert status["processados"] == status["total"] == 12
+
+    saida_esperada, stats = processar_zip_sync(entrada, OpcoesProcessamento(usar_cache=False))
+    assert status["dados_gerais"] == stats
+    with open(job.caminho_resultado, "rb") as resultado:
+        assert conteudo_zip(io.BytesIO(resultado.read())) == conteudo_zip(saida_esperada)
+    # A cópia de entrada é apagada ao fim do processamento
+    assert not os.path.exists(job.caminho_entrada)
+
+
+def test_fila_cheia_recusa_envio(tmp_path):
+    # Sem workers ninguém consome a fila
+    gerenciador = GerenciadorJobs(workers=0, limite_fila=1, diretorio=str(tmp_path))
+    gerenciador.submeter(io.BytesIO(montar_zip_misto(2)), "a.zip")
+
+    with pytest.raises(FilaCheia):
+        gerenciador.submeter(io.BytesIO(montar_zip_misto(2)), "b.zip")
+
+
+def test_resultado_expira_apos_ttl(tmp_path):
+    gerenciador = GerenciadorJobs(workers=1, limite_fila=1, ttl=0, diretorio=str(tmp_path))
+    job = gerenciador.submeter(io.BytesIO(montar_zip_misto(2)), "a.zip")
+    while job.concluido_em is None:
+        time.sleep(0.01)
+    time.sleep(0.01)
+
+    assert gerenciador.obter(job.id) is None
+    assert not os.path.exists(job.caminho_resultado)
+
+
+def test_endpoint_de_jobs(tmp_path, monkeypatch):
+    from fastapi.testclient import TestClient
+    import main
+
+    gerenciador = GerenciadorJobs(workers=1, limite_fila=2, diretorio=str(tmp_path))
+    monkeypatch.setattr(main, "gerenciador_jobs", gerenciador)
+    client = TestClient(main.app)
+    entrada = montar_zip_misto(12)
+
+    resposta = client.post("/jobs/?usar_cache=false", files={"arquivo": ("lote.zip", entrada, "application/zip")})
+    assert resposta.status_code == 202
+    job = aguardar(gerenciador, resposta.json()["id"])
+    # O custo estimado no envio (que lê o diretório central) não pode ter deixado o upload pela metade
+    assert job.status == CONCLUIDO and job.custo is not None
+
+    saida_esperada, stats = processar_zip_sync(entrada, OpcoesProcessamento(usar_cache=False))
+    status = client.get(f"/jobs/{job.id}").json()
+    assert status["dados_gerais"] == stats
+    download = client.get(status["resultado"])
+    assert conteudo_zip(io.BytesIO(download.content)) == conteudo_zip(saida_esperada)
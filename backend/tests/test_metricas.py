@@ -0,0 +1,49 @@
+import sys
+import os
+
+# Add the backend directory to the path so we can import the metrics module
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import metricas
+from metricas import RegistroMetricas, TempoEtapas
+from processamento import OpcoesProcessamento, processar_zip_sync
+from test_paralelo import montar_zip_misto
+
+
+def test_server_timing_em_ordem_de_etapa():
+    tempos = TempoEtapas()
+    tempos.adicionar("gravacao", 0.002)
+    tempos.adicionar("extracao", 0.010)
+    tempos.adicionar("extracao", 0.005)
+
+    valor = tempos.server_timing()
+    assert valor.startswith("extracao;dur=15.0, gravacao;dur=2.0, total;dur=")
+
+
+def test_exportacao_no_formato_prometheus():
+    registro = RegistroMetricas()
+    contador = registro.contador("teste_total", "Ajuda.", ("categoria",))
+    histograma = registro.histograma("teste_segundos", "Ajuda.", buckets=(0.1, 1))
+    contador.incrementar(3, "aprovados")
+    histograma.observar(0.05)
+    histograma.observar(5)
+
+    texto = registro.exportar()
+    assert 'teste_total{categoria="aprovados"} 3' in texto
+    assert 'teste_segundos_bucket{le="0.1"} 1' in texto
+    assert 'teste_segundos_bucket{le="1"} 1' in texto
+    assert 'teste_segundos_bucket{le="+Inf"} 2' in texto
+    assert "teste_segundos_count 2" in texto
+
+
+def test_processamento_publica_contadores_e_etapas():
+    erros_antes = metricas.ERROS_PARSE.valor()
+    lotes_antes = metricas.DURACAO_ETAPA.quantidade("extracao")
+    tempos = TempoEtapas()
+
+    _, stats = processar_zip_sync(montar_zip_misto(14), OpcoesProcessamento(usar_cache=False, tempos=tempos))
+
+    # 2 dos 14 XMLs (i % 7 == 0) estão corrompidos
+    assert metricas.ERROS_PARSE.valor() - erros_antes == 2
+    assert metricas.DURACAO_ETAPA.quantidade("extracao") - lotes_antes == 1
+    assert {"indice_zip", "extracao", "gravacao", "relatorios"} <= set(tempos.duracoes)
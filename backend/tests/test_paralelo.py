@@ -0,0 +1,80 @@
+import io
+import zipfile
+import sys
+import os
+
+# Add the backend directory to the path so we can import processar_zip_sync
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import processamento
+from processamento import OpcoesProcessamento, processar_zip_sync
+from test_extracao import montar_nfeproc
+
+
+def montar_zip_misto(quantidade=40):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as z:
+        for i in range(quantidade):
+            if i % 7 == 0:
+                conteudo = b"<nfeProc><NFe>"  # corrompido
+            else:
+                conteudo = montar_nfeproc(
+                    cstat=["100", "150", "204"][i % 3],
+                    tpemis=["1", "9"][i % 2],
+                    vnf=f"{i}.10",
+                    vicms=f"{i}.01",
+                )
+            z.writestr(f'lote/{i:03d}/nota_{i}.xml', conteudo)
+        z.writestr('leiame.txt', 'ignorado')
+    return buffer.getvalue()
+
+
+def conteudo_zip(buffer):
+    with zipfile.ZipFile(buffer) as z:
+        return [(info.filename, z.read(info)) for info in z.infolist()]
+
+
+def test_modo_paralelo_identico_ao_serial(monkeypatch):
+    entrada = montar_zip_misto()
+
+    saida_serial, stats_serial = processar_zip_sync(entrada, OpcoesProcessamento(processos=1, usar_cache=False))
+
+    monkeypatch.setattr(processamento, "MIN_ARQUIVOS_PARALELO", 1)
+    saida_paralela, stats_paralela = processar_zip_sync(
+        entrada, OpcoesProcessamento(processos=2, tamanho_lote=3, usar_cache=False)
+    )
+
+    assert stats_paralela == stats_serial
+    assert conteudo_zip(saida_paralela) == conteudo_zip(saida_serial)
+
+
+def test_lote_pequeno_usa_modo_serial(monkeypatch):
+    def falhar(*args, **kwargs):
+        raise AssertionError("pool não deveria ser usado")
+
+    monkeypatch.setattr(processamento, "_classificar_em_paralelo", falhar)
+    _, stats = processar_zip_sync(montar_zip_misto(5), OpcoesProcessamento(processos=4, usar_cache=False))
+
+    assert sum(cat["qtd"] for cat in stats.values()) == 5
+
+
+def test_aceita_arquivo_em_disco_sem_carregar_na_memoria(monkeypatch):
+    from tempfile import SpooledTemporaryFile
+
+    entrada = montar_zip_misto()
+    saida_bytes, stats_bytes = processar_zip_sync(entrada, OpcoesProcessamento(processos=1))
+
+    # Upload que já foi "despejado" para o disco, como o Starlette faz acima do limite de spool
+    spool = SpooledTemporaryFile(max_size=16)
+    spool.write(entrada)
+    spool.seek(0)
+    assert spool._rolled
+
+    monkeypatch.setattr(processamento, "MIN_ARQUIVOS_PARALELO", 1)
+    destino = io.BytesIO()
+    opcoes = OpcoesProcessamento(processos=2, tamanho_lote=5, destino=destino, usar_cache=False)
+    saida, stats = processar_zip_sync(spool, opcoes)
+
+    assert saida is destino
+    assert stats == stats_bytes
+    assert conteudo_zip(saida) == conteudo_zip(saida_bytes)
@@ -0,0 +1,109 @@
+import io
+import sys
+import os
+import hashlib
+
+import pytest
+from fastapi.testclient import TestClient
+
+# Add the backend directory to the path so we can import the results module
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+import processamento
+from resultados import ArmazemResultados, hash_arquivo
+from benchmarks.corpus import PerfilCorpus, gerar_corpus_zip
+
+CORPUS = gerar_corpus_zip(PerfilCorpus(arquivos=20, semente=11))
+
+
+@pytest.fixture
+def armazem(tmp_path, monkeypatch):
+    armazem = ArmazemResultados(str(tmp_path), limite=64 * 1024 * 1024)
+    monkeypatch.setattr(main, "armazem_resultados", armazem)
+    return armazem
+
+
+def enviar(client, corpus=CORPUS, **params):
+    return client.post("/processar-zip/", params=params, files={"arquivo": ("notas.zip", corpus, "application/zip")})
+
+
+def test_reenvio_servido_do_armazem(armazem, monkeypatch):
+    client = TestClient(main.app)
+    primeira = enviar(client)
+    assert primeira.status_code == 200
+    etag = primeira.headers["ETag"]
+
+    # O reenvio não processa nada: devolve o mesmo arquivo com os mesmos totais
+    monkeypatch.setattr(processamento, "processar_zip_sync", None)
+    monkeypatch.setattr(main, "processar_zip_sync", None)
+    segunda = enviar(client)
+    assert segunda.status_code == 200 and segunda.content == primeira.content
+    assert segunda.headers["ETag"] == etag
+    for header in ("X-Count-Approved", "X-Count-Rejected", "X-Value-Approved"):
+        assert segunda.headers[header] == primeira.headers[header]
+    assert (armazem.acertos, armazem.falhas) == (1, 1)
+
+    resposta = client.post("/processar-zip/", headers={"If-None-Match": etag},
+                           files={"arquivo": ("notas.zip", CORPUS, "application/zip")})
+    assert resposta.status_code == 304 and resposta.content == b""
+
+    # Outra opção que muda o ZIP de saída é outra chave
+    monkeypatch.undo()
+    monkeypatch.setattr(main, "armazem_resultados", armazem)
+    assert enviar(client, compressao="armazenar").headers["ETag"] != etag
+
+
+def test_remocao_depois_da_consulta_nao_derruba_o_envio(armazem, monkeypatch):
+    client = TestClient(main.app)
+    primeira = enviar(client)
+    chave = primeira.headers["ETag"].strip('"')
+
+    # O resultado sai do armazém (LRU/TTL) entre a consulta e o envio do arquivo
+    original = main.responder_resultado
+
+    def remover_e_responder(*args, **kwargs):
+        with armazem._lock:
+            armazem._remover(chave)
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(main, "responder_resultado", remover_e_responder)
+    segunda = enviar(client)
+    assert segunda.status_code == 200 and segunda.content == primeira.content
+    assert int(segunda.headers["Content-Length"]) == len(primeira.content)
+    assert armazem.consultar(chave) is None and not os.listdir(armazem.diretorio)
+
+
+def test_consulta_pelo_hash_antes_do_upload(armazem):
+    client = TestClient(main.app)
+    hash_zip = hashlib.sha256(CORPUS).hexdigest()
+    assert hash_arquivo(io.BytesIO(CORPUS)) == hash_zip
+    assert client.get(f"/resultados/{hash_zip}").status_code == 404
+
+    original = enviar(client, itens="true")
+    assert client.get(f"/resultados/{hash_zip}").status_code == 404
+    consulta = client.get(f"/resultados/{hash_zip}", params={"itens": "true"})
+    assert consulta.status_code == 200
+    assert consulta.json()["dados_gerais"]["aprovados"]["qtd"] == int(original.headers["X-Count-Approved"])
+
+    download = client.get(consulta.json()["download"])
+    assert download.content == original.content
+    assert client.get(consulta.json()["download"], headers={"If-None-Match": download.headers["ETag"]}).status_code == 304
+
+
+def test_remove_menos_usados(tmp_path):
+    # O diretório só é criado na primeira gravação
+    armazem = ArmazemResultados(str(tmp_path / "resultados"), limite=250)
+    assert not os.path.exists(armazem.diretorio)
+    for chave in ("a", "b", "c"):
+        destino = armazem.novo_arquivo()
+        destino.write(b"x" * 100)
+        destino.close()
+        armazem.guardar(chave, destino.name, {})
+        if chave == "b":
+            assert armazem.obter("a") is not None  # "a" passa a ser o mais recente
+    assert armazem.consultar("b") is None and armazem.remocoes == 1
+    assert armazem.bytes_em_disco == 200
+
+    # O índice é reconstruído a partir do diretório
+    assert set(ArmazemResultados(armazem.diretorio, limite=250)._entradas) == {"a", "c"}
@@ -0,0 +1,71 @@
+import sys
+import os
+import zipfile
+
+from fastapi.testclient import TestClient
+
+# Add the backend directory to the path so we can import the processing module
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+from processamento import OpcoesProcessamento, processar_zip_sync, resumir_zip_sync
+from benchmarks.corpus import PerfilCorpus, gerar_corpus_zip
+
+CORPUS = gerar_corpus_zip(PerfilCorpus(arquivos=200, semente=11))
+client = TestClient(main.app)
+
+
+def test_resumo_igual_ao_processamento_completo():
+    saida, stats = processar_zip_sync(CORPUS, OpcoesProcessamento(usar_cache=False))
+    resumo = resumir_zip_sync(CORPUS, OpcoesProcessamento(usar_cache=False))
+
+    assert resumo["dados_gerais"] == stats
+    assert resumo["total"] == 200 and resumo["erros_parse"] > 0
+    with zipfile.ZipFile(saida) as z:
+        linhas = z.read("rejeitados/relatorio_erros.csv").decode("utf-8-sig").splitlines()[1:]
+    assert [";".join(r.values()) for r in resumo["rejeitados"]] == linhas
+
+
+def test_resumo_nao_monta_zip_de_saida(monkeypatch):
+    import processamento
+
+    def proibido(*args, **kwargs):
+        raise AssertionError("o modo só resumo não pode comprimir nada")
+
+    monkeypatch.setattr(processamento, "GravadorParalelo", proibido)
+    saida, stats = processar_zip_sync(CORPUS, OpcoesProcessamento(usar_cache=False, somente_resumo=True))
+    assert saida is None and sum(dados["qtd"] for dados in stats.values()) == 200
+
+
+def test_endpoint_resumo():
+    resposta = client.post("/resumo-zip/", files={"arquivo": ("notas.zip", CORPUS, "application/zip")})
+    assert resposta.status_code == 200
+    corpo = resposta.json()
+    assert resposta.headers["X-Count-Rejected"] == str(corpo["dados_gerais"]["rejeitados"]["qtd"])
+    assert len(corpo["rejeitados"]) == corpo["dados_gerais"]["rejeitados"]["qtd"]
+
+    invalido = client.post("/resumo-zip/", files={"arquivo": ("x.zip", b"nada", "application/zip")})
+    assert invalido.status_code == 400
+
+
+def test_resumo_nao_descompacta_o_que_ja_foi_classificado(monkeypatch):
+    import processamento
+    from cache_classificacao import CacheClassificacao
+
+    leituras = []
+    ler = zipfile.ZipFile.read
+    monkeypatch.setattr(zipfile.ZipFile, "read", lambda self, nome, *args: leituras.append(nome) or ler(self, nome, *args))
+
+    # Cache quente: só os XMLs corrompidos (que não vão para o cache) são descompactados de novo
+    monkeypatch.setattr(processamento, "cache_global", CacheClassificacao(limite=1000))
+    frio = resumir_zip_sync(CORPUS)
+    assert len(leituras) == 200
+    leituras.clear()
+    assert resumir_zip_sync(CORPUS) == frio
+    assert len(leituras) == frio["erros_parse"] > 0
+    leituras.clear()
+
+    # Em paralelo, quem lê é o pool: o processo principal não descompacta os mesmos membros
+    monkeypatch.setattr(processamento, "MIN_ARQUIVOS_PARALELO", 1)
+    assert resumir_zip_sync(CORPUS, OpcoesProcessamento(processos=2, usar_cache=False)) == frio
+    assert leituras == []
@@ -0,0 +1,53 @@
+import io
+import json
+import asyncio
+import zipfile
+import sys
+import os
+
+# Add the backend directory to the path so we can import processar_zip_sync
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from processamento import OpcoesProcessamento, processar_zip_sync
+from streaming import CanalSaida, transmitir_em_thread
+from test_paralelo import montar_zip_misto, conteudo_zip
+
+
+async def receber_tudo(entrada, **kwargs):
+    canal = CanalSaida(asyncio.get_running_loop(), **kwargs)
+    opcoes = OpcoesProcessamento(destino=canal, incluir_resumo=True)
+    thread = transmitir_em_thread(canal, processar_zip_sync, entrada, opcoes)
+    pedacos = [pedaco async for pedaco in canal.iterar()]
+    thread.join(timeout=5)
+    return pedacos
+
+
+def test_zip_transmitido_igual_ao_em_memoria():
+    entrada = montar_zip_misto()
+    pedacos = asyncio.run(receber_tudo(entrada, tamanho_pedaco=1024, limite_pedacos=2))
+
+    assert len(pedacos) > 1
+    with zipfile.ZipFile(io.BytesIO(b"".join(pedacos))) as z:
+        nomes = z.namelist()
+        # Data descriptors: o ZIP foi escrito sem seek (os XMLs copiados em bruto já têm header completo)
+        assert z.getinfo('relatorio_geral.csv').flag_bits & 0x08
+        assert nomes[-1] == 'resumo.json'
+        resumo = json.loads(z.read('resumo.json'))
+
+    saida_memoria, stats = processar_zip_sync(entrada)
+    assert resumo == stats
+    esperado = conteudo_zip(saida_memoria)
+    assert conteudo_zip(io.BytesIO(b"".join(pedacos)))[:-1] == esperado
+
+
+def test_desconexao_aborta_processamento():
+    async def cenario():
+        canal = CanalSaida(asyncio.get_running_loop(), tamanho_pedaco=256, limite_pedacos=1)
+        thread = transmitir_em_thread(canal, processar_zip_sync, montar_zip_misto(), OpcoesProcessamento(destino=canal))
+        fluxo = canal.iterar()
+        await fluxo.__anext__()
+        await fluxo.aclose()  # cliente desconectou
+        await asyncio.to_thread(thread.join, 5)
+        return thread.is_alive()
+
+    assert asyncio.run(cenario()) is False
@@ -0,0 +1,101 @@
+import io
+import zipfile
+import sys
+import os
+
+import pytest
+
+# Add the backend directory to the path so we can import the multipart reader
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from processamento import OpcoesProcessamento, processar_zip_sync, processar_xmls_sync
+from upload_xmls import iterar_partes_multipart, ParteMuitoGrande, RequisicaoInvalida
+from test_paralelo import montar_zip_misto, conteudo_zip
+
+BOUNDARY = "----monxml-teste"
+CONTENT_TYPE = f"multipart/form-data; boundary={BOUNDARY}"
+
+
+def montar_multipart(partes, campo="arquivos"):
+    corpo = io.BytesIO()
+    for nome, conteudo in partes:
+        corpo.write(f"--{BOUNDARY}\r\n".encode())
+        corpo.write(f'Content-Disposition: form-data; name="{campo}"; filename="{nome}"\r\n'.encode())
+        corpo.write(b"Content-Type: text/xml\r\n\r\n")
+        corpo.write(conteudo)
+        corpo.write(b"\r\n")
+    corpo.write(f"--{BOUNDARY}--\r\n".encode())
+    return corpo.getvalue()
+
+
+def leitor(corpo, tamanho=100):
+    # Simula o corpo chegando em pedaços pequenos (partes cortadas no meio)
+    pedacos = iter([corpo[i:i + tamanho] for i in range(0, len(corpo), tamanho)])
+    return lambda: next(pedacos, None)
+
+
+def xmls_do_zip(entrada):
+    with zipfile.ZipFile(io.BytesIO(entrada)) as z:
+        return [(info.filename, z.read(info)) for info in z.infolist()]
+
+
+def test_partes_entregues_uma_a_uma():
+    partes = [("a.xml", b"<a/>" * 50), ("b.xml", b""), ("c.xml", b"<c>\r\n--quase boundary</c>")]
+    corpo = montar_multipart(partes)
+
+    lidos = []
+    gerador = iterar_partes_multipart(leitor(corpo), CONTENT_TYPE)
+    # A primeira parte sai antes de o corpo terminar de ser lido
+    assert next(gerador) == partes[0]
+    lidos.extend(gerador)
+
+    assert lidos == partes[1:]
+
+
+def test_campos_sem_arquivo_sao_ignorados():
+    corpo = (
+        f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="obs"\r\n\r\ntexto\r\n'.encode()
+        + montar_multipart([("nota.xml", b"<x/>")])
+    )
+    assert list(iterar_partes_multipart(leitor(corpo), CONTENT_TYPE)) == [("nota.xml", b"<x/>")]
+
+
+def test_parte_acima_do_limite():
+    corpo = montar_multipart([("grande.xml", b"x" * 1000)])
+    with pytest.raises(ParteMuitoGrande):
+        list(iterar_partes_multipart(leitor(corpo), CONTENT_TYPE, limite_parte=500))
+
+
+def test_content_type_invalido():
+    with pytest.raises(RequisicaoInvalida):
+        list(iterar_partes_multipart(leitor(b""), "application/json"))
+
+
+def test_xmls_soltos_igual_ao_zip():
+    entrada = montar_zip_misto()
+    corpo = montar_multipart(xmls_do_zip(entrada))
+
+    saida, stats = processar_xmls_sync(iterar_partes_multipart(leitor(corpo, 4096), CONTENT_TYPE))
+    saida_zip, stats_zip = processar_zip_sync(entrada, OpcoesProcessamento(usar_cache=False))
+
+    assert stats == stats_zip
+    assert conteudo_zip(saida) == conteudo_zip(saida_zip)
+
+
+def test_requisicao_recusada_fecha_o_zip_de_saida(monkeypatch):
+    from tempfile import SpooledTemporaryFile
+    from fastapi.testclient import TestClient
+    import main
+
+    criados = []
+
+    def spool(*args, **kwargs):
+        criados.append(SpooledTemporaryFile(*args, **kwargs))
+        return criados[-1]
+
+    monkeypatch.setattr(main, "SpooledTemporaryFile", spool)
+    resposta = TestClient(main.app).post(
+        "/processar-xmls/", content=b"{}", headers={"Content-Type": "application/json"}
+    )
+    assert resposta.status_code == 400
+    assert len(criados) == 1 and criados[0].closed
@@ -0,0 +1,214 @@
+import io
+import sys
+import os
+import time
+import random
+import asyncio
+import warnings
+import zipfile
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+
+# Add the backend directory to the path so we can import the uploads module
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+import processamento
+from processamento import OpcoesProcessamento
+from uploads import GerenciadorUploads, PedacoForaDeOrdem, UploadIncompleto, UPLOADS_ANALISADORES
+from benchmarks.corpus import PerfilCorpus, gerar_corpus_zip, gerar_nfe
+
+CORPUS = gerar_corpus_zip(PerfilCorpus(arquivos=30, semente=8))
+XMLS_CORPUS = sum(1 for nome in zipfile.ZipFile(io.BytesIO(CORPUS)).namelist() if nome.lower().endswith(".xml"))
+
+
+@pytest.fixture
+def gerenciador(tmp_path, monkeypatch):
+    gerenciador = GerenciadorUploads(str(tmp_path))
+    monkeypatch.setattr(main, "gerenciador_uploads", gerenciador)
+    return gerenciador
+
+
+def esperar(condicao, limite=5.0):
+    fim = time.monotonic() + limite
+    while not condicao():
+        assert time.monotonic() < fim, "tempo esgotado"
+        time.sleep(0.01)
+
+
+def conteudo(saida):
+    with zipfile.ZipFile(saida) as z:
+        return {info.filename: z.read(info) for info in z.infolist()}
+
+
+def test_classifica_durante_o_upload(gerenciador, monkeypatch):
+    sessao = gerenciador.criar("notas.zip", len(CORPUS))
+    metade = len(CORPUS) // 2
+    sessao.escrever(0, CORPUS[:metade])
+    # Os membros que já chegaram inteiros são classificados antes do fim do upload
+    esperar(lambda: len(sessao.classificados) > 0)
+    assert len(sessao.classificados) < XMLS_CORPUS
+
+    sessao.escrever(metade, CORPUS[metade:])
+    esperar(lambda: len(sessao.classificados) >= XMLS_CORPUS - 2)  # corrompidos ficam para a conclusão
+
+    analisados = []
+    original = processamento.extrair_ou_none
+    monkeypatch.setattr(processamento, "extrair_ou_none", lambda *args: analisados.append(args[1]) or original(*args))
+    saida, stats = gerenciador.concluir(sessao.id, OpcoesProcessamento(usar_cache=False))
+    assert len(analisados) == XMLS_CORPUS - len(sessao.classificados)
+
+    esperado, stats_esperado = processamento.processar_zip_sync(CORPUS, OpcoesProcessamento(usar_cache=False))
+    assert stats == stats_esperado
+    assert conteudo(saida) == conteudo(esperado)
+    assert not os.path.exists(sessao.caminho)
+
+
+def test_membros_com_o_mesmo_nome(gerenciador, monkeypatch):
+    aleatorio = random.Random(5)
+    buffer = io.BytesIO()
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")  # 'Duplicate name'
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as z:
+            z.writestr("notas/nota.xml", gerar_nfe(aleatorio, 1, 2))
+            z.writestr("notas/nota.xml", gerar_nfe(aleatorio, 2, 2, cstat="204"))
+    entrada = buffer.getvalue()
+
+    sessao = gerenciador.criar("repetidos.zip", len(entrada))
+    sessao.escrever(0, entrada)
+    esperar(lambda: len(sessao.classificados) == 2)
+
+    # Cada membro reaproveita a SUA classificação, mesmo com o nome repetido
+    analisados = []
+    original = processamento.extrair_ou_none
+    monkeypatch.setattr(processamento, "extrair_ou_none", lambda *args: analisados.append(args[1]) or original(*args))
+    saida, stats = gerenciador.concluir(sessao.id, OpcoesProcessamento(usar_cache=False))
+    assert analisados == []
+    assert stats["aprovados"]["qtd"] == 1 and stats["rejeitados"]["qtd"] == 1
+    assert {"aprovados/nota.xml", "rejeitados/nota.xml"} <= set(conteudo(saida))
+
+    # No processamento direto (serial e paralelo) também são dois documentos distintos
+    monkeypatch.setattr(processamento, "extrair_ou_none", original)
+    _, stats_serial = processamento.processar_zip_sync(entrada, OpcoesProcessamento(usar_cache=False))
+    monkeypatch.setattr(processamento, "MIN_ARQUIVOS_PARALELO", 1)
+    _, stats_paralelo = processamento.processar_zip_sync(entrada, OpcoesProcessamento(usar_cache=False, processos=2))
+    assert stats_serial == stats_paralelo == stats
+
+
+def test_sessoes_dividem_o_pool_de_analise(gerenciador):
+    sessoes = [gerenciador.criar(f"notas_{i}.zip", len(CORPUS)) for i in range(8)]
+    for sessao in sessoes:
+        sessao.escrever(0, CORPUS)
+    for sessao in sessoes:
+        esperar(lambda: len(sessao.classificados) >= XMLS_CORPUS - 2)
+
+    # Sessões abertas não seguram threads: a análise roda num pool de tamanho fixo
+    analisadores = [t for t in threading.enumerate() if t.name.startswith("monxml-upload")]
+    assert len(analisadores) <= UPLOADS_ANALISADORES
+    for sessao in sessoes:
+        gerenciador.cancelar(sessao.id)
+
+
+def test_retomada_e_pedacos_fora_de_ordem(gerenciador):
+    sessao = gerenciador.criar("notas.zip", len(CORPUS))
+    assert sessao.escrever(0, CORPUS[:1000]) == 1000
+    with pytest.raises(PedacoForaDeOrdem) as erro:
+        sessao.escrever(2000, CORPUS[2000:3000])
+    assert erro.value.recebido == 1000
+    # Reenvio com sobreposição: só os bytes novos são gravados
+    assert sessao.escrever(500, CORPUS[500:1500]) == 1500
+    with pytest.raises(UploadIncompleto):
+        gerenciador.concluir(sessao.id)
+    with pytest.raises(ValueError):
+        sessao.escrever(1500, CORPUS[1500:] + b"x")
+
+    gerenciador.cancelar(sessao.id)
+    assert not os.path.exists(sessao.caminho)
+
+
+def test_protocolo_http(gerenciador):
+    client = TestClient(main.app)
+    resposta = client.post("/uploads/", params={"tamanho": len(CORPUS), "nome": "notas.zip"})
+    assert resposta.status_code == 201
+    url = resposta.headers["Location"]
+
+    pedaco = 4096
+    for inicio in range(0, len(CORPUS), pedaco):
+        fim = min(inicio + pedaco, len(CORPUS)) - 1
+        if inicio == pedaco * 2:
+            # Pedaço adiantado (o anterior "se perdeu"): o servidor diz de onde retomar
+            resposta = client.put(url, content=CORPUS[inicio + pedaco:], headers={
+                "Content-Range": f"bytes {inicio + pedaco}-{len(CORPUS) - 1}/{len(CORPUS)}"
+            })
+            assert resposta.status_code == 409 and resposta.json()["recebido"] == inicio
+            assert client.post(f"{url}/concluir").status_code == 409
+        resposta = client.put(url, content=CORPUS[inicio:fim + 1], headers={
+            "Content-Range": f"bytes {inicio}-{fim}/{len(CORPUS)}"
+        })
+        assert resposta.status_code == 200 and resposta.json()["recebido"] == fim + 1
+
+    assert client.get(url).json()["recebido"] == len(CORPUS)
+    assert client.put(url, content=b"x", headers={"Content-Range": "bytes 0-0"}).status_code == 400
+
+    resposta = client.post(f"{url}/concluir", params={"compressao": "rapida"})
+    assert resposta.status_code == 200
+    direto = client.post("/processar-zip/", files={"arquivo": ("notas.zip", CORPUS, "application/zip")})
+    for header in ("X-Count-Approved", "X-Count-Rejected", "X-Value-Approved"):
+        assert resposta.headers[header] == direto.headers[header]
+    assert conteudo(io.BytesIO(resposta.content)).keys() == conteudo(io.BytesIO(direto.content)).keys()
+    assert client.get(url).status_code == 404
+
+
+def test_pedaco_gravado_parte_a_parte(gerenciador, monkeypatch):
+    import httpx
+    from uploads import SessaoUpload
+
+    gravacoes = []
+    escrever = SessaoUpload.escrever
+    monkeypatch.setattr(SessaoUpload, "escrever", lambda self, inicio, dados: gravacoes.append(len(dados)) or escrever(self, inicio, dados))
+
+    async def partes(inicio, quantidade):
+        for i in range(inicio, inicio + quantidade * 1000, 1000):
+            yield CORPUS[i:i + 1000]
+
+    async def enviar():
+        # O transporte ASGI do httpx entrega o corpo ao app na mesma divisão em partes do cliente
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://teste") as client:
+            url = (await client.post("/uploads/", params={"tamanho": len(CORPUS)})).headers["Location"]
+            resposta = await client.put(url, content=partes(0, 5), headers={"Content-Range": f"bytes 0-4999/{len(CORPUS)}"})
+            monkeypatch.setattr(main, "UPLOADS_LIMITE_PEDACO", 2500)
+            acima = await client.put(url, content=partes(5000, 3), headers={"Content-Range": f"bytes 5000-7999/{len(CORPUS)}"})
+            await client.delete(url)
+            return resposta, acima
+
+    resposta, acima = asyncio.run(enviar())
+    # O pedaço não é juntado na memória: cada parte do corpo vai direto para o arquivo da sessão
+    assert resposta.status_code == 200 and resposta.json()["recebido"] == 5000
+    assert gravacoes[:5] == [1000] * 5
+    # Acima do limite a requisição para antes de gravar a parte que passaria dele
+    assert acima.status_code == 413 and gravacoes[5:] == [1000, 1000]
+
+
+def test_falha_na_conclusao_fecha_o_zip_de_saida(gerenciador, monkeypatch):
+    from tempfile import SpooledTemporaryFile
+
+    criados = []
+
+    def spool(*args, **kwargs):
+        criados.append(SpooledTemporaryFile(*args, **kwargs))
+        return criados[-1]
+
+    def falhar(*args, **kwargs):
+        raise RuntimeError("falha no processamento")
+
+    monkeypatch.setattr(main, "SpooledTemporaryFile", spool)
+    monkeypatch.setattr(gerenciador, "concluir", falhar)
+    sessao = gerenciador.criar("notas.zip", len(CORPUS))
+    sessao.escrever(0, CORPUS)
+
+    resposta = TestClient(main.app, raise_server_exceptions=False).post(f"/uploads/{sessao.id}/concluir")
+    assert resposta.status_code == 500
+    assert len(criados) == 1 and criados[0].closed
+    gerenciador.cancelar(sessao.id)
@@ -0,0 +1,54 @@
+import io
+import zipfile
+import sys
+import os
+
+# Add the backend directory to the path so we can import processar_zip_sync
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from processamento import OpcoesProcessamento, processar_zip_sync
+from test_extracao import montar_nfeproc
+from test_paralelo import montar_zip_misto, conteudo_zip
+
+
+def bytes_comprimidos(buffer, nome):
+    with zipfile.ZipFile(buffer) as z:
+        info = z.getinfo(nome)
+        z.fp.seek(info.header_offset + 26)
+        tamanho_nome, tamanho_extra = int.from_bytes(z.fp.read(2), 'little'), int.from_bytes(z.fp.read(2), 'little')
+        z.fp.seek(tamanho_nome + tamanho_extra, 1)
+        return info.CRC, z.fp.read(info.compress_size)
+
+
+def test_copia_bruta_reaproveita_bytes_deflate():
+    entrada = io.BytesIO()
+    with zipfile.ZipFile(entrada, 'w', zipfile.ZIP_DEFLATED, compresslevel=1) as z:
+        z.writestr('pasta/nota.xml', montar_nfeproc(itens=30))
+
+    saida, stats = processar_zip_sync(entrada.getvalue())
+
+    assert stats["aprovados"]["qtd"] == 1
+    # Mesmos bytes comprimidos (nível 1 da entrada, não o nível padrão) e mesmo CRC
+    assert bytes_comprimidos(saida, 'aprovados/nota.xml') == bytes_comprimidos(entrada, 'pasta/nota.xml')
+
+
+def test_copia_bruta_gera_mesmo_conteudo_que_recompressao():
+    entrada = montar_zip_misto()
+
+    saida_bruta, stats_bruta = processar_zip_sync(entrada, OpcoesProcessamento(copia_bruta=True))
+    saida_normal, stats_normal = processar_zip_sync(entrada, OpcoesProcessamento(copia_bruta=False))
+
+    assert stats_bruta == stats_normal
+    assert conteudo_zip(saida_bruta) == conteudo_zip(saida_normal)
+
+
+def test_membro_stored_usa_caminho_normal():
+    entrada = io.BytesIO()
+    with zipfile.ZipFile(entrada, 'w', zipfile.ZIP_STORED) as z:
+        z.writestr('nota.xml', montar_nfeproc())
+
+    saida, _ = processar_zip_sync(entrada.getvalue())
+
+    with zipfile.ZipFile(saida) as z:
+        assert z.getinfo('aprovados/nota.xml').compress_type == zipfile.ZIP_DEFLATED
+        assert z.read('aprovados/nota.xml') == montar_nfeproc()
@@ -0,0 +1,119 @@
+import os
+from typing import Callable, Iterator
+
+from python_multipart.exceptions import MultipartParseError
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+
+# -------------------------------------------------------------------
+# LEITURA INCREMENTAL DE MULTIPART (VÁRIOS XMLS SOLTOS)
+# -------------------------------------------------------------------
+# Tamanho máximo (em MB) de UM XML enviado em /processar-xmls/. Protege a memória,
+# já que cada parte é mantida inteira enquanto é classificada.
+LIMITE_XML = int(os.environ.get("MONXML_LIMITE_XML_MB", "50")) * 1024 * 1024
+
+
+class ParteMuitoGrande(Exception):
+    """Uma parte do multipart excedeu LIMITE_XML."""
+
+
+class RequisicaoInvalida(Exception):
+    """O corpo não é um multipart/form-data válido."""
+
+
+def _decodificar(valor: bytes) -> str:
+    try:
+        return valor.decode('utf-8')
+    except UnicodeDecodeError:
+        return valor.decode('latin-1')
+
+
+def iterar_partes_multipart(
+    ler_pedaco: Callable[[], bytes | None],
+    content_type: str,
+    limite_parte: int = LIMITE_XML,
+) -> Iterator[tuple[str, bytes]]:
+    """
+    Gera (nome_do_arquivo, conteúdo) para cada parte de ARQUIVO de um corpo multipart/form-data,
+    à medida que cada parte termina de chegar.
+
+    Diferente do 'request.form()' do Starlette, nada é acumulado: só a parte atual fica em
+    memória, então milhares de XMLs podem ser processados com memória limitada.
+    Campos que não são arquivos (sem 'filename') são ignorados.
+
+    Args:
+        ler_pedaco (Callable): Devolve o próximo pedaço do corpo da requisição, ou None no fim.
+        content_type (str): Header Content-Type da requisição (contém o 'boundary').
+        limite_parte (int): Tamanho máximo de uma parte, em bytes.
+
+    Raises:
+        RequisicaoInvalida: Content-Type sem boundary ou corpo malformado.
+        ParteMuitoGrande: Alguma parte excedeu 'limite_parte'.
+    """
+    tipo, parametros = parse_options_header(content_type)
+    boundary = parametros.get(b'boundary')
+    if tipo != b'multipart/form-data' or not boundary:
+        raise RequisicaoInvalida("Esperado multipart/form-data com boundary.")
+
+    # Estado da parte atual, preenchido pelos callbacks do parser
+    prontas: list[tuple[str, bytes]] = []
+    atual = {"campo": b"", "valor": b"", "headers": {}, "nome": None, "dados": bytearray()}
+
+    def on_part_begin():
+        atual["headers"] = {}
+        atual["nome"] = None
+        atual["dados"] = bytearray()
+
+    def on_header_field(data, start, end):
+        atual["campo"] += data[start:end]
+
+    def on_header_value(data, start, end):
+        atual["valor"] += data[start:end]
+
+    def on_header_end():
+        atual["headers"][atual["campo"].lower()] = atual["valor"]
+        atual["campo"] = b""
+        atual["valor"] = b""
+
+    def on_headers_finished():
+        _, opcoes = parse_options_header(atual["headers"].get(b'content-disposition', b''))
+        if b'filename' in opcoes:
+            atual["nome"] = _decodificar(opcoes[b'filename'])
+
+    def on_part_data(data, start, end):
+        if atual["nome"] is None:
+            return
+        if len(atual["dados"]) + (end - start) > limite_parte:
+            raise ParteMuitoGrande(f"O arquivo '{atual['nome']}' excede {limite_parte // (1024 * 1024)} MB.")
+        atual["dados"] += data[start:end]
+
+    def on_part_end():
+        if atual["nome"] is not None:
+            prontas.append((atual["nome"], bytes(atual["dados"])))
+        atual["dados"] = bytearray()
+
+    parser = MultipartParser(boundary, {
+        "on_part_begin": on_part_begin,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+    })
+
+    try:
+        while True:
+            pedaco = ler_pedaco()
+            if pedaco is None:
+                break
+            if pedaco:
+                parser.write(pedaco)
+            # Entrega as partes concluídas neste pedaço antes de ler o próximo
+            while prontas:
+                yield prontas.pop(0)
+        parser.finalize()
+    except MultipartParseError as erro:
+        raise RequisicaoInvalida(f"Corpo multipart inválido: {erro}") from erro
+
+    yield from prontas
@@ -0,0 +1,328 @@
+import os
+import time
+import uuid
+import zlib
+import tempfile
+import threading
+from typing import BinaryIO
+from dataclasses import replace
+from concurrent.futures import ThreadPoolExecutor
+
+from extracao import DadosNFe
+from colunar import ColunasItens
+from agregacao import ColunasCabecalhos
+from catalogo import catalogo_global
+from upload_xmls import LIMITE_XML
+from zip_bruto import _ESTRUTURA_HEADER_LOCAL, _ASSINATURA_HEADER_LOCAL
+from processamento import OpcoesProcessamento, extrair_ou_none, classificar, processar_zip_sync
+
+
+# -------------------------------------------------------------------
+# CONFIGURAÇÃO DOS UPLOADS EM PEDAÇOS (variáveis de ambiente)
+# -------------------------------------------------------------------
+# Diretório dos arquivos de sessão (padrão: temporário do sistema)
+UPLOADS_DIRETORIO = os.environ.get("MONXML_UPLOADS_DIRETORIO", "") or os.path.join(tempfile.gettempdir(), "monxml-uploads")
+# Tempo (segundos) sem receber pedaços até a sessão ser descartada
+UPLOADS_TTL = int(os.environ.get("MONXML_UPLOADS_TTL", "86400"))
+# Tamanho máximo de um ZIP enviado em pedaços
+UPLOADS_LIMITE = int(os.environ.get("MONXML_UPLOADS_LIMITE_MB", "4096")) * 1024 * 1024
+# Tamanho máximo de cada pedaço (PUT)
+UPLOADS_LIMITE_PEDACO = int(os.environ.get("MONXML_UPLOADS_LIMITE_PEDACO_MB", "16")) * 1024 * 1024
+# Threads que classificam os membros durante os uploads, compartilhadas por TODAS as sessões
+UPLOADS_ANALISADORES = int(os.environ.get("MONXML_UPLOADS_ANALISADORES", "2"))
+
+# Tamanho de pedaço sugerido ao cliente na criação da sessão
+PEDACO_SUGERIDO = min(8 * 1024 * 1024, UPLOADS_LIMITE_PEDACO)
+
+_METODOS_ANALISE = (0, 8)  # ZIP_STORED, ZIP_DEFLATED
+
+# Pool da análise antecipada (criado no primeiro upload)
+_pool_analise: ThreadPoolExecutor | None = None
+_pool_lock = threading.Lock()
+
+
+def _obter_pool() -> ThreadPoolExecutor:
+    global _pool_analise
+    with _pool_lock:
+        if _pool_analise is None:
+            _pool_analise = ThreadPoolExecutor(max_workers=max(UPLOADS_ANALISADORES, 1), thread_name_prefix="monxml-upload")
+        return _pool_analise
+
+
+class SessaoNaoEncontrada(Exception):
+    """Sessão inexistente, expirada ou já concluída."""
+
+
+class PedacoForaDeOrdem(Exception):
+    """O pedaço começa depois do último byte recebido: o cliente deve retomar de 'recebido'."""
+
+    def __init__(self, recebido: int):
+        super().__init__(f"Pedaço fora de ordem: a sessão recebeu {recebido} bytes até agora.")
+        self.recebido = recebido
+
+
+class UploadIncompleto(Exception):
+    """A conclusão foi pedida antes de todos os bytes chegarem."""
+
+    def __init__(self, recebido: int, tamanho: int):
+        super().__init__(f"Upload incompleto: {recebido} de {tamanho} bytes recebidos.")
+        self.recebido = recebido
+
+
+class SessaoUpload:
+    """
+    Um ZIP sendo enviado em pedaços, gravado num arquivo da sessão.
+
+    Os pedaços chegam em ordem (reenvios de trechos já recebidos são ignorados) e a análise
+    acompanha a transferência: cada pedaço gravado agenda, no pool compartilhado
+    (UPLOADS_ANALISADORES threads para todas as sessões), a classificação dos membros cujos
+    headers locais e dados já estão no disco. Nunca há mais de uma análise por sessão e ela
+    nunca espera bytes: para no primeiro membro incompleto e continua no próximo pedaço.
+    Na conclusão sobra só o que chegou por último; o resto já está em 'classificados'
+    (posição do header local do membro -> DadosNFe: nomes repetidos no ZIP são membros distintos).
+    """
+
+    def __init__(self, nome_arquivo: str, tamanho: int, caminho: str):
+        self.id = uuid.uuid4().hex
+        self.nome_arquivo = nome_arquivo
+        self.tamanho = tamanho
+        self.caminho = caminho
+        self.recebido = 0
+        self.criado_em = self.atualizado_em = time.time()
+        self.classificados: dict[int, DadosNFe] = {}
+        # Itens para o catálogo de produtos, coletados na mesma análise antecipada
+        self.itens = ColunasItens() if catalogo_global.ativo else None
+        self.cabecalhos = ColunasCabecalhos() if catalogo_global.ativo else None
+
+        self._condicao = threading.Condition()
+        self._encerrada = False
+        self._escrita = open(caminho, "w+b")
+        # Estado da análise antecipada: próximo header local, análise em andamento / pedida de novo
+        self._posicao = 0
+        self._analisando = False
+        self._reanalisar = False
+        self._analise_concluida = False
+
+    def escrever(self, inicio: int, dados: bytes) -> int:
+        """
+        Grava um pedaço que começa no byte 'inicio'. Devolve o total recebido.
+
+        Raises:
+            SessaoNaoEncontrada: Se a sessão já foi concluída, cancelada ou expirou.
+            PedacoForaDeOrdem: Se 'inicio' estiver além do que já foi recebido.
+            ValueError: Se o pedaço passar do tamanho declarado.
+        """
+        with self._condicao:
+            if self._encerrada:
+                raise SessaoNaoEncontrada(self.id)
+            if inicio > self.recebido:
+                raise PedacoForaDeOrdem(self.recebido)
+            if inicio + len(dados) > self.tamanho:
+                raise ValueError(f"O pedaço passa do tamanho declarado ({self.tamanho} bytes).")
+            novos = dados[self.recebido - inicio:]
+            if novos:
+                self._escrita.seek(self.recebido)
+                self._escrita.write(novos)
+                self._escrita.flush()
+                self.recebido += len(novos)
+                self._agendar_analise()
+            self.atualizado_em = time.time()
+            return self.recebido
+
+    @property
+    def completa(self) -> bool:
+        return self.recebido == self.tamanho
+
+    def encerrar(self) -> None:
+        """Para a análise antecipada (no próximo membro) e fecha o arquivo de escrita."""
+        with self._condicao:
+            self._encerrada = True
+            self._condicao.wait_for(lambda: not self._analisando)
+            self._escrita.close()
+
+    def como_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "arquivo": self.nome_arquivo,
+            "tamanho": self.tamanho,
+            "recebido": self.recebido,
+            "classificados": len(self.classificados),
+            "pedaco_sugerido": PEDACO_SUGERIDO,
+            "criado_em": self.criado_em,
+            "atualizado_em": self.atualizado_em,
+        }
+
+    # --- Análise antecipada (pool compartilhado) ---
+    def _agendar_analise(self) -> None:
+        # Chamado com '_condicao': no máximo uma análise por sessão, e só quando chegou algo novo
+        if self._analise_concluida or self._encerrada:
+            return
+        if self._analisando:
+            self._reanalisar = True
+            return
+        self._analisando = True
+        _obter_pool().submit(self._analisar)
+
+    def _disponivel(self, fim: int) -> bool:
+        # O arquivo já tem 'fim' bytes? False também se a sessão foi encerrada.
+        with self._condicao:
+            return self.recebido >= fim and not self._encerrada
+
+    def _analisar(self) -> None:
+        while True:
+            try:
+                with open(self.caminho, "rb") as arquivo:
+                    concluida = self._percorrer_membros(arquivo)
+            except (OSError, ValueError, zlib.error) as erro:
+                # A análise antecipada é só uma otimização: na conclusão, o processamento normal refaz o que faltar
+                print(f"Análise antecipada do upload {self.id} interrompida: {erro!r}")
+                concluida = True
+            with self._condicao:
+                self._analise_concluida = self._analise_concluida or concluida
+                if self._reanalisar and not self._analise_concluida and not self._encerrada:
+                    # Chegou outro pedaço durante esta análise: continua de onde parou
+                    self._reanalisar = False
+                    continue
+                self._analisando = self._reanalisar = False
+                self._condicao.notify_all()
+                return
+
+    def _percorrer_membros(self, arquivo) -> bool:
+        """
+        Classifica os membros completos a partir de '_posicao'. Devolve True quando não há mais
+        nada a analisar antes da conclusão (fim dos membros ou tamanho só no data descriptor)
+        e False quando parou num membro que ainda não chegou inteiro.
+        """
+        while self._disponivel(self._posicao + _ESTRUTURA_HEADER_LOCAL.size):
+            arquivo.seek(self._posicao)
+            campos = _ESTRUTURA_HEADER_LOCAL.unpack(arquivo.read(_ESTRUTURA_HEADER_LOCAL.size))
+            (assinatura, _, _, flags, metodo, _, _, crc, tamanho_comprimido, tamanho, tamanho_nome, tamanho_extra) = campos
+            # Fim dos membros (diretório central) ou tamanho só no data descriptor: o resto fica para a conclusão
+            if assinatura != _ASSINATURA_HEADER_LOCAL or flags & 0x8 or 0xFFFFFFFF in (tamanho_comprimido, tamanho):
+                return True
+
+            inicio_dados = self._posicao + _ESTRUTURA_HEADER_LOCAL.size + tamanho_nome + tamanho_extra
+            proxima = inicio_dados + tamanho_comprimido
+            if not self._disponivel(inicio_dados):
+                return False
+            nome = arquivo.read(tamanho_nome).decode('utf-8' if flags & 0x800 else 'cp437')
+            analisavel = (
+                nome.lower().endswith('.xml') and not flags & 0x1 and metodo in _METODOS_ANALISE and tamanho <= LIMITE_XML
+            )
+            if analisavel:
+                if not self._disponivel(proxima):
+                    return False
+                arquivo.seek(inicio_dados)
+                dados = arquivo.read(tamanho_comprimido)
+                if metodo == 8:
+                    descompressor = zlib.decompressobj(-15)
+                    dados = descompressor.decompress(dados, LIMITE_XML + 1)
+                if len(dados) == tamanho and zlib.crc32(dados) == crc:
+                    self._classificar(self._posicao, nome, dados)
+            self._posicao = proxima
+        return False
+
+    def _classificar(self, posicao: int, nome: str, conteudo_xml: bytes) -> None:
+        resultado = extrair_ou_none(conteudo_xml, nome, self.itens, self.cabecalhos)
+        if resultado is None:
+            # Corrompido: a conclusão analisa de novo e registra o erro no relatório
+            return
+        self.classificados[posicao] = resultado
+        if self.itens is not None:
+            categoria = classificar(resultado)
+            self.itens.concluir_documento(os.path.basename(nome), categoria)
+            self.cabecalhos.concluir_documento(categoria)
+
+
+class GerenciadorUploads:
+    """
+    Sessões de upload em pedaços (criar -> PUT dos intervalos -> concluir).
+
+    Se a conexão cair, o cliente consulta a sessão e retoma do byte 'recebido'.
+    Sessões paradas há mais de 'ttl' segundos são descartadas.
+    """
+
+    def __init__(self, diretorio: str = UPLOADS_DIRETORIO, ttl: int = UPLOADS_TTL, limite: int = UPLOADS_LIMITE):
+        self.diretorio = diretorio
+        self.ttl = ttl
+        self.limite = limite
+        self._sessoes: dict[str, SessaoUpload] = {}
+        self._lock = threading.Lock()
+
+    def criar(self, nome_arquivo: str, tamanho: int) -> SessaoUpload:
+        """
+        Raises:
+            ValueError: Tamanho inválido ou acima do limite.
+        """
+        if tamanho <= 0 or tamanho > self.limite:
+            raise ValueError(f"Tamanho inválido: use de 1 a {self.limite} bytes.")
+        self.limpar_expirados()
+        os.makedirs(self.diretorio, exist_ok=True)
+        sessao = SessaoUpload(nome_arquivo, tamanho, os.path.join(self.diretorio, f"{uuid.uuid4().hex}.zip"))
+        with self._lock:
+            self._sessoes[sessao.id] = sessao
+        return sessao
+
+    def obter(self, sessao_id: str) -> SessaoUpload:
+        with self._lock:
+            sessao = self._sessoes.get(sessao_id)
+        if sessao is None:
+            raise SessaoNaoEncontrada(sessao_id)
+        return sessao
+
+    def retirar(self, sessao_id: str) -> SessaoUpload:
+        """Tira a sessão do gerenciador e encerra a análise; o arquivo passa a ser do chamador."""
+        with self._lock:
+            sessao = self._sessoes.pop(sessao_id, None)
+        if sessao is None:
+            raise SessaoNaoEncontrada(sessao_id)
+        sessao.encerrar()
+        return sessao
+
+    def concluir(self, sessao_id: str, opcoes: OpcoesProcessamento | None = None) -> tuple[BinaryIO, dict]:
+        """
+        Processa o ZIP da sessão (síncrono) reaproveitando os membros já classificados
+        durante o upload. 'opcoes' vão para 'processar_zip_sync'. A sessão deixa de existir.
+
+        Raises:
+            SessaoNaoEncontrada: Sessão inexistente (ou concluída por outra requisição).
+            UploadIncompleto: Ainda faltam bytes; nada é descartado e o cliente pode continuar.
+        """
+        sessao = self.obter(sessao_id)
+        if not sessao.completa:
+            raise UploadIncompleto(sessao.recebido, sessao.tamanho)
+        sessao = self.retirar(sessao_id)
+        try:
+            opcoes = replace(opcoes or OpcoesProcessamento(), classificados=sessao.classificados)
+            resultado = processar_zip_sync(sessao.caminho, opcoes)
+        finally:
+            _remover(sessao.caminho)
+        if sessao.itens is not None:
+            # Os documentos classificados durante o upload não passam de novo pelo parsing:
+            # os itens deles vão para o catálogo a partir das colunas da própria sessão
+            catalogo_global.enfileirar(sessao.itens, sessao.cabecalhos)
+        return resultado
+
+    def cancelar(self, sessao_id: str) -> None:
+        _remover(self.retirar(sessao_id).caminho)
+
+    def limpar_expirados(self) -> None:
+        limite = time.time() - self.ttl
+        with self._lock:
+            expiradas = [sessao.id for sessao in self._sessoes.values() if sessao.atualizado_em < limite]
+        for sessao_id in expiradas:
+            try:
+                self.cancelar(sessao_id)
+            except SessaoNaoEncontrada:
+                pass
+
+
+def _remover(caminho: str) -> None:
+    try:
+        os.remove(caminho)
+    except FileNotFoundError:
+        pass
+
+
+# Instância única do processo, compartilhada pelos endpoints /uploads/
+gerenciador_uploads = GerenciadorUploads()
@@ -0,0 +1,116 @@
+import struct
+import zipfile
+
+
+# -------------------------------------------------------------------
+# CÓPIA BRUTA DE MEMBROS (SEM RECOMPRIMIR)
+# -------------------------------------------------------------------
+# O módulo 'zipfile' não tem API pública para gravar bytes já comprimidos, então
+# montamos a entrada manualmente seguindo o mesmo protocolo interno que o
+# ZipFile usa em 'writestr' (lock, _writecheck, header local, start_dir, filelist).
+
+# Métodos de compressão copiados sem recomprimir. ZIP_STORED fica de fora de propósito:
+# copiá-lo deixaria o ZIP de saída maior do que o gerado pelo caminho normal (DEFLATED).
+METODOS_COPIA_BRUTA = (zipfile.ZIP_DEFLATED,)
+
+# Header local de arquivo: assinatura, versões, flags, método, data/hora, CRC, tamanhos, tamanho do nome e do extra
+_ESTRUTURA_HEADER_LOCAL = struct.Struct('<4s2B4HL2L2H')
+_ASSINATURA_HEADER_LOCAL = b'PK\x03\x04'
+
+
+def suporta_copia_bruta(info: zipfile.ZipInfo, metodos=METODOS_COPIA_BRUTA) -> bool:
+    """
+    Diz se o membro pode ser copiado byte a byte para o ZIP de saída.
+
+    Ficam de fora: métodos não suportados, membros criptografados e membros que
+    exigiriam ZIP64 (XMLs de NF-e nunca chegam perto de 4 GB).
+    """
+    return (
+        info.compress_type in metodos
+        and not info.flag_bits & 0x1
+        and info.file_size < zipfile.ZIP64_LIMIT
+        and info.compress_size < zipfile.ZIP64_LIMIT
+    )
+
+
+def ler_bruto(zip_in: zipfile.ZipFile, info: zipfile.ZipInfo) -> bytes:
+    """
+    Lê os bytes COMPRIMIDOS de um membro, exatamente como estão no ZIP de entrada.
+
+    Raises:
+        zipfile.BadZipFile: Se o header local do membro estiver corrompido.
+    """
+    with zip_in._lock:
+        zip_in.fp.seek(info.header_offset)
+        header = zip_in.fp.read(_ESTRUTURA_HEADER_LOCAL.size)
+        if len(header) != _ESTRUTURA_HEADER_LOCAL.size:
+            raise zipfile.BadZipFile(f"Header local truncado: {info.filename!r}")
+        campos = _ESTRUTURA_HEADER_LOCAL.unpack(header)
+        if campos[0] != _ASSINATURA_HEADER_LOCAL:
+            raise zipfile.BadZipFile(f"Assinatura de header local inválida: {info.filename!r}")
+
+        # Pula o nome e o campo extra do header local (podem diferir do diretório central)
+        zip_in.fp.seek(campos[10] + campos[11], 1)
+        dados = zip_in.fp.read(info.compress_size)
+
+    if len(dados) != info.compress_size:
+        raise zipfile.BadZipFile(f"Dados comprimidos truncados: {info.filename!r}")
+    return dados
+
+
+def gravar_bruto(
+    zip_out: zipfile.ZipFile,
+    nome: str,
+    dados_comprimidos: bytes,
+    compress_type: int,
+    crc: int,
+    file_size: int,
+    date_time: tuple = None,
+) -> zipfile.ZipInfo:
+    """
+    Grava uma entrada cujos bytes já estão comprimidos (e cujo CRC32 já é conhecido).
+
+    Como tamanhos e CRC são conhecidos antes de escrever, o header local já sai
+    completo: não há data descriptor nem 'seek' de volta, então funciona tanto em
+    arquivos comuns quanto em destinos não-seekable (streaming).
+    """
+    zinfo = zipfile.ZipInfo(nome) if date_time is None else zipfile.ZipInfo(nome, date_time=date_time)
+    zinfo.compress_type = compress_type
+    zinfo.CRC = crc
+    zinfo.compress_size = len(dados_comprimidos)
+    zinfo.file_size = file_size
+    zinfo.external_attr = 0o600 << 16  # permissões: ?rw------- (mesmo padrão do writestr)
+
+    with zip_out._lock:
+        if zip_out._writing:
+            raise ValueError("Não é possível gravar enquanto outro handle de escrita está aberto no ZIP.")
+        if zip_out._seekable:
+            zip_out.fp.seek(zip_out.start_dir)
+        zinfo.header_offset = zip_out.fp.tell()
+        zip_out._writecheck(zinfo)
+        zip_out._didModify = True
+
+        zip_out.fp.write(zinfo.FileHeader(False))
+        zip_out.fp.write(dados_comprimidos)
+
+        zip_out.start_dir = zip_out.fp.tell()
+        zip_out.filelist.append(zinfo)
+        zip_out.NameToInfo[zinfo.filename] = zinfo
+
+    return zinfo
+
+
+def copiar_bruto(zip_in: zipfile.ZipFile, info: zipfile.ZipInfo, zip_out: zipfile.ZipFile, novo_nome: str) -> zipfile.ZipInfo:
+    """
+    Copia um membro do ZIP de entrada para o de saída com outro nome, SEM descomprimir
+    nem recomprimir: os bytes deflate e o CRC32 originais são reaproveitados.
+    """
+    return gravar_bruto(
+        zip_out,
+        novo_nome,
+        ler_bruto(zip_in, info),
+        compress_type=info.compress_type,
+        crc=info.CRC,
+        file_size=info.file_size,
+        date_time=info.date_time,
+    )
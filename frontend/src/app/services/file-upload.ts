@@ -2,28 +2,185 @@
 
 import { Injectable } from '@angular/core';
 import { HttpClient, HttpHeaders, HttpRequest, HttpEventType, HttpEvent } from '@angular/common/http';
-import { Observable } from 'rxjs';
+import { Observable, Subscription, firstValueFrom } from 'rxjs';
 
 import { environment } from '../../environments/environment';
 
+// Resposta de POST/GET /uploads/ (sessão de upload em pedaços)
+interface SessaoUpload {
+  id: string;
+  tamanho: number;
+  recebido: number;
+  pedaco_sugerido: number;
+}
+
+// Registro de POST /acompanhar-zip/ (uma linha NDJSON): 'arquivo' por XML, 'totais' parciais, 'fim' ou 'erro'
+export interface RegistroAcompanhamento {
+  tipo: 'arquivo' | 'totais' | 'fim' | 'erro';
+  arquivo?: string;
+  categoria?: string;
+  cstat?: string;
+  xmotivo?: string;
+  vnf?: number;
+  vicms?: number;
+  processados?: number;
+  total?: number;
+  dados_gerais?: Record<string, { qtd: number; valor: number; icms: number }>;
+  erros_parse?: number;
+  download?: string | null;
+  detail?: string;
+}
+
+// Falhas seguidas de um mesmo pedaço antes de desistir do upload
+const MAX_TENTATIVAS = 5;
+
 @Injectable({
   providedIn: 'root'
 })
 export class FileUploadService {
 
   private zipApiUrl = environment.apiUrl;
+  // Mesmo servidor, endpoint do upload em pedaços (ex: http://127.0.0.1:8000/uploads/)
+  private uploadsApiUrl = environment.apiUrl.replace(/processar-zip\/?$/, 'uploads/');
+  // Registros por XML em NDJSON enquanto o lote é classificado
+  private acompanharApiUrl = environment.apiUrl.replace(/processar-zip\/?$/, 'acompanhar-zip/');
 
   constructor(private http: HttpClient) { }
 
   /**
-   * Função para enviar UM ficheiro ZIP
+   * Envia UM ficheiro ZIP em pedaços (upload retomável).
+   *
+   * Protocolo: POST /uploads/ -> PUT de cada pedaço com Content-Range -> POST /uploads/{id}/concluir.
+   * Se um pedaço falhar (rede instável), pergunta ao servidor quantos bytes chegaram e continua dali,
+   * sem reenviar o ficheiro inteiro. O servidor já classifica os XMLs enquanto os pedaços chegam.
+   *
+   * Emite os mesmos eventos do upload simples: UploadProgress (a cada pedaço) e, na conclusão,
+   * ResponseHeader / DownloadProgress / Response com o ZIP processado (blob).
+   */
+  uploadZip(file: Blob): Observable<HttpEvent<Blob>> {
+    const nome = file instanceof File ? file.name : 'upload.zip';
+
+    return new Observable<HttpEvent<Blob>>(observer => {
+      let cancelado = false;
+      let urlSessao: string | undefined;
+      let conclusao: Subscription | undefined;
+
+      const enviar = async () => {
+        const sessao = await firstValueFrom(this.http.post<SessaoUpload>(this.uploadsApiUrl, null, {
+          params: { tamanho: file.size, nome }
+        }));
+        urlSessao = this.uploadsApiUrl + sessao.id;
+
+        let recebido = sessao.recebido;
+        let falhas = 0;
+        while (recebido < file.size && !cancelado) {
+          const fim = Math.min(recebido + sessao.pedaco_sugerido, file.size);
+          try {
+            const resposta = await firstValueFrom(this.http.put<SessaoUpload>(urlSessao, file.slice(recebido, fim), {
+              headers: new HttpHeaders({
+                'Content-Type': 'application/octet-stream',
+                'Content-Range': `bytes ${recebido}-${fim - 1}/${file.size}`
+              })
+            }));
+            recebido = resposta.recebido;
+            falhas = 0;
+          } catch (erro) {
+            if (++falhas > MAX_TENTATIVAS) {
+              throw erro;
+            }
+            await new Promise(resolve => setTimeout(resolve, 500 * 2 ** falhas));
+            // Retoma do último byte que o servidor realmente gravou
+            recebido = (await firstValueFrom(this.http.get<SessaoUpload>(urlSessao))).recebido;
+          }
+          observer.next({ type: HttpEventType.UploadProgress, loaded: recebido, total: file.size });
+        }
+        if (cancelado) {
+          return;
+        }
+
+        conclusao = this.http.post(`${urlSessao}/concluir`, null, {
+          reportProgress: true,
+          observe: 'events',
+          responseType: 'blob'
+        }).subscribe(observer);
+      };
+
+      enviar().catch(erro => observer.error(erro));
+
+      return () => {
+        cancelado = true;
+        if (conclusao) {
+          conclusao.unsubscribe();
+        } else if (urlSessao) {
+          // Cancelado no meio do envio: descarta o que o servidor já recebeu
+          this.http.delete(urlSessao).subscribe({ error: () => { } });
+        }
+      };
+    });
+  }
+
+  /**
+   * Envia UM ficheiro ZIP e emite um registro por XML assim que o servidor o classifica,
+   * totais parciais e, no fim, o link de download do ZIP processado (ver urlDownload).
+   *
+   * A resposta é lida em streaming (fetch + ReadableStream): só a linha corrente fica na memória,
+   * ao contrário do 'partialText' do HttpClient, que acumula a resposta inteira.
+   */
+  acompanharZip(file: File): Observable<RegistroAcompanhamento> {
+    return new Observable<RegistroAcompanhamento>(observer => {
+      const controle = new AbortController();
+      const formData = new FormData();
+      formData.append('arquivo', file, file.name);
+
+      const ler = async () => {
+        const resposta = await fetch(this.acompanharApiUrl, { method: 'POST', body: formData, signal: controle.signal });
+        if (!resposta.ok || !resposta.body) {
+          throw new Error(`Falha ao acompanhar o lote (HTTP ${resposta.status})`);
+        }
+        const leitor = resposta.body.pipeThrough(new TextDecoderStream()).getReader();
+        let pendente = '';
+        while (true) {
+          const { value, done } = await leitor.read();
+          if (done) {
+            break;
+          }
+          const linhas = (pendente + value).split('\n');
+          pendente = linhas.pop() ?? '';
+          for (const linha of linhas) {
+            if (linha) {
+              observer.next(JSON.parse(linha));
+            }
+          }
+        }
+        observer.complete();
+      };
+
+      ler().catch(erro => {
+        if (!controle.signal.aborted) {
+          observer.error(erro);
+        }
+      });
+
+      // Cancelar a inscrição fecha a conexão: o servidor interrompe o processamento
+      return () => controle.abort();
+    });
+  }
+
+  /**
+   * URL absoluta do link 'download' do registro 'fim' (o servidor devolve um caminho relativo)
+   */
+  urlDownload(caminho: string): string {
+    return new URL(caminho, this.zipApiUrl).toString();
+  }
+
+  /**
+   * Envia UM ficheiro ZIP numa única requisição multipart (sem retomada)
    */
-  uploadZip(file: File): Observable<HttpEvent<Blob>> {
+  uploadZipMultipart(file: File): Observable<HttpEvent<Blob>> {
     const formData: FormData = new FormData();
     // A key é 'arquivo' (singular)
     formData.append('arquivo', file, file.name);
 
-    console.log('Uploading ZIP to:', this.zipApiUrl);
     return this.http.post(this.zipApiUrl, formData, {
       reportProgress: true,     // <-- Pedir progresso (Upload E Download)
       observe: 'events',        // <-- Ouvir todos os eventos, não só a resposta final